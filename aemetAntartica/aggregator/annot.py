@@ -3,13 +3,16 @@ Interface and typing definitions
 """
 
 from typing import Protocol, Sequence
-from datetime import timedelta
+from datetime import tzinfo
+
+from .bucketing import CalendarPeriod
 
 
-# TODO: MOVE FROM PERIOD GROUPER TO FUNCTIONAL GROUPER. LET IT RETURN SEQUENCES OF OBJECTS.
 class AggregatorCb[T](Protocol):
-    def __call__(self, data_in: Sequence[T], period: timedelta) -> Sequence[T]:
+    def __call__(
+        self, data_in: Sequence[T], period: CalendarPeriod, tz: tzinfo
+    ) -> Sequence[T]:
         """
-        Given sequence of data return other sequence with the same type but not the same length.
+        Given sequence of data sorted by date return one item per non empty calendar bucket of period in tz.
         """
         ...
@@ -0,0 +1,85 @@
+"""
+Calendar bucketing of sorted points. Buckets are hours, days or months of the wall clock of a timezone.
+"""
+
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Sequence
+from datetime import UTC, datetime, timedelta, tzinfo
+from itertools import pairwise
+from typing import Literal
+
+from aemetAntartica.util.datetime import next_month
+
+type CalendarPeriod = Literal["hour", "day", "month"]
+
+
+def bucket_floor(d: datetime, period: CalendarPeriod, tz: tzinfo) -> datetime:
+    "Start of the bucket of d. Aware datetime in tz"
+    local = d.astimezone(tz)
+    if period == "hour":
+        return local.replace(minute=0, second=0, microsecond=0)
+    if period == "day":
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "month":
+        return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unfeasible calendar period {period}")
+
+
+def next_bucket(start: datetime, period: CalendarPeriod) -> datetime:
+    """
+    Start of the bucket after the one starting at start.
+
+    Days and months follow the wall clock (23 or 25 hours days on dst changes). Hours are 3600 seconds.
+    """
+    tz = start.tzinfo
+    if period == "hour":
+        return (start.astimezone(UTC) + timedelta(hours=1)).astimezone(tz)
+    if period == "day":
+        # WALL CLOCK ARITHMETIC. THE OFFSET IS RECOMPUTED FOR THE NEW DATE.
+        return (start.replace(tzinfo=None) + timedelta(days=1)).replace(tzinfo=tz)
+    if period == "month":
+        return next_month(start.replace(tzinfo=None)).replace(tzinfo=tz)
+    raise ValueError(f"Unfeasible calendar period {period}")
+
+
+def bucket_starts(
+    date_0: datetime, date_f: datetime, period: CalendarPeriod, tz: tzinfo
+) -> list[datetime]:
+    "Starts of every bucket overlapping [date_0, date_f) plus the end of the last one"
+    starts = [bucket_floor(date_0, period, tz)]
+    while starts[-1] < date_f:
+        starts.append(next_bucket(starts[-1], period))
+    return starts
+
+
+def bucket_bounds[T](
+    data_in: Sequence[T],
+    period: CalendarPeriod,
+    tz: tzinfo,
+    date_getter: Callable[[T], datetime],
+) -> list[int]:
+    """
+    Boundaries of the non empty buckets of points sorted by date. Bucket i holds data_in[bounds[i]:bounds[i + 1]].
+
+    One bisection per bucket: O(n_buckets * log(n)) date comparisons.
+    """
+    if len(data_in) == 0:
+        return [0]
+
+    first, last = date_getter(data_in[0]), date_getter(data_in[-1])
+    starts = bucket_starts(first, last + timedelta(microseconds=1), period, tz)
+    bounds = [bisect_left(data_in, s, key=date_getter) for s in starts]
+    # EMPTY BUCKETS (GAPS) ARE DROPPED.
+    return sorted(set(bounds))
+
+
+def calendar_buckets[T](
+    data_in: Sequence[T],
+    period: CalendarPeriod,
+    tz: tzinfo,
+    date_getter: Callable[[T], datetime],
+) -> Iterator[Sequence[T]]:
+    "Points of every non empty bucket in chronological order. Points must be sorted by date"
+    bounds = bucket_bounds(data_in, period, tz, date_getter)
+    for ndx_0, ndx_f in pairwise(bounds):
+        yield data_in[ndx_0:ndx_f]
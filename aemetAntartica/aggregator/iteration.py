@@ -3,16 +3,17 @@ All aggregation functions that are based on iteration.
 """
 
 import operator as op
-from datetime import datetime, timedelta
+from datetime import datetime, tzinfo
+from functools import partial
 from itertools import filterfalse, repeat
-from math import isnan
+from math import floor, isnan
 from typing import Callable, Sequence
 
 
 from .annot import AggregatorCb
+from .bucketing import CalendarPeriod, calendar_buckets
 
 from aemetAntartica.model.fetch import WeatherDataPoint
-from aemetAntartica.util.itertools import grouper
 
 type DateAgg = Callable[[Sequence[datetime]], datetime]
 type FloatAgg = Callable[[Sequence[float]], float]
@@ -31,24 +32,57 @@ def calc_mean(vals: Sequence[float]) -> float:
     return sum(non_nan_vals) / len(non_nan_vals)
 
 
-def calc_median(vals: Sequence[float]) -> float:
+def select_kth(vals: Sequence[float], k: int) -> float:
     """
-    Calc the median of a given series.
+    K-th smallest value (0 based) without sorting.
 
-    Takes the middle point if the series is odd and the average of the two center if it's even.
+    Quickselect with three way partitions and median of three pivots: expected linear time, repeated values are fine.
+    """
+    while True:
+        pivot = sorted((vals[0], vals[len(vals) // 2], vals[-1]))[1]
+        lows = [v for v in vals if v < pivot]
+        if k < len(lows):
+            vals = lows
+            continue
+
+        highs = [v for v in vals if v > pivot]
+        n_pivots = len(vals) - len(lows) - len(highs)
+        if k < len(lows) + n_pivots:
+            return pivot
+
+        k -= len(lows) + n_pivots
+        vals = highs
+
+
+def calc_percentile(vals: Sequence[float], q: float) -> float:
+    """
+    Calc the q quantile (0 <= q <= 1) ignoring nan values. 0 if there are no values (same as calc_mean).
+
+    Linear interpolation between the closest ranks (numpy default). Two linear time selections, no sorting.
     """
     non_nan_vals = list(filterfalse(isnan, vals))
 
     if len(non_nan_vals) <= 0:
         return 0
 
-    nn_sorted = sorted(non_nan_vals)
-    len_ = len(nn_sorted)
-    if len_ % 2 == 0:
-        n = (len_ - 1) // 2
-        return (nn_sorted[n] + nn_sorted[n + 1]) / 2
-    else:
-        return nn_sorted[(len_ - 1) // 2]
+    pos = q * (len(non_nan_vals) - 1)
+    lo = floor(pos)
+    frac = pos - lo
+    lo_val = select_kth(non_nan_vals, lo)
+    if frac == 0:
+        return lo_val
+
+    hi_val = select_kth(non_nan_vals, lo + 1)
+    return lo_val * (1 - frac) + hi_val * frac
+
+
+def calc_median(vals: Sequence[float]) -> float:
+    """
+    Calc the median of a given series.
+
+    Takes the middle point if the series is odd and the average of the two center if it's even.
+    """
+    return calc_percentile(vals, 0.5)
 
 
 def do_model_calculation(
@@ -81,23 +115,6 @@ def do_model_calculation(
     )
 
 
-def calc_points_period(dates: Sequence[datetime]) -> timedelta:
-    "Given a list of points get the time between them."
-
-    periods = list(
-        map(
-            op.sub,
-            dates[1::],  # NEXT DATE...
-            dates,
-        )
-    )
-
-    # CHECK THAT THE FRECUENCY IS MORE OR LESS CONSTANT. RAISE WARNING IF NOT CONSTANT.
-
-    # TODO: ANALYZE THIS... MAKE SURE THAT ALL ARE MORE OR LESS EQUAL...
-    return periods[0]
-
-
 # AGGREGATOR FUNCTIONS.
 
 
@@ -106,18 +123,15 @@ def picker_agg_factory[T](
     date_getter: Callable[[T], datetime],
 ):
     """
-    Applies the function to a list of points directly.
+    Applies the function to the points of every calendar bucket directly.
 
     This is convenient for selectors such as first or last in group.
     """
 
-    def agg_res(data_in: Sequence[T], period: timedelta) -> Sequence[T]:
-        dates = list(map(date_getter, data_in))
-        data_freq = calc_points_period(dates)
-
-        n = period // data_freq
-
-        chunks = grouper(data_in, n)
+    def agg_res(
+        data_in: Sequence[T], period: CalendarPeriod, tz: tzinfo
+    ) -> Sequence[T]:
+        chunks = calendar_buckets(data_in, period, tz, date_getter)
         return list(map(agg_f, chunks))
 
     return agg_res
@@ -143,17 +157,15 @@ def calc_agg_factory[T](
     model_f: Callable[[Sequence[T], FloatAgg, DateAgg], T],
 ):
     """
-    Generator of numeric aggregation functions.
+    Generator of numeric aggregation functions. One result per calendar bucket.
 
     This is convenient for numeric type transformations.
     """
 
-    def calc_agg(data_in: Sequence[T], period: timedelta) -> Sequence[T]:
-        dates = list(map(date_picker, data_in))
-        data_freq = calc_points_period(dates)
-
-        n = period // data_freq
-        chunks = grouper(data_in, n)
+    def calc_agg(
+        data_in: Sequence[T], period: CalendarPeriod, tz: tzinfo
+    ) -> Sequence[T]:
+        chunks = calendar_buckets(data_in, period, tz, date_picker)
 
         agg_iter = map(model_f, chunks, repeat(agg_f), repeat(date_f))
         return list(agg_iter)
@@ -178,7 +190,19 @@ median_agg: AggregatorCb[WeatherDataPoint] = calc_agg_factory(
 )
 
 
-def identity_agg[T](data_in: Sequence[T], period: timedelta) -> Sequence[T]:
+def percentile_agg_factory(q: float) -> AggregatorCb[WeatherDataPoint]:
+    "Exact q quantile of every numeric property"
+    return calc_agg_factory(
+        agg_f=partial(calc_percentile, q=q),
+        date_f=op.itemgetter(0),
+        date_picker=op.attrgetter("fhora"),
+        model_f=do_model_calculation,
+    )
+
+
+def identity_agg[T](
+    data_in: Sequence[T], period: CalendarPeriod | None, tz: tzinfo
+) -> Sequence[T]:
     """
     Used exclusively to represent raw data. Helps polimorphism.
     """
@@ -0,0 +1,180 @@
+"""
+Mergeable quantile sketch with relative accuracy (DDSketch).
+
+Values are counted in logarithmic bins: bin i holds |values| in (gamma^(i - 1), gamma^i] with
+gamma = (1 + alpha) / (1 - alpha), so any quantile is returned within a relative error alpha. Merging adds bin counts,
+which is exact: merged sketches (i.e. cached months) answer the same as a sketch of every point of the range.
+Size is bounded by the log range of the values, a few hundred bins for weather measurements.
+
+Values far from zero (e.g. pressure, ~1000 hPa) are sketched relative to an offset, so that the relative error is of
+the distance to the offset (±0.5 hPa for pressures within 50 hPa of 1000) instead of the value (±10 hPa).
+"""
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from math import ceil, inf, isnan, log
+from typing import Any
+
+"Default relative accuracy"
+DEFAULT_ALPHA = 0.01
+
+"Absolute values under this are counted as zero"
+_MIN_INDEXABLE = 1e-9
+
+"Offset of the sketches of each variable. 0 if missing"
+VARIABLE_OFFSETS: Mapping[str, float] = {"pres": 1000.0}
+
+
+@dataclass(slots=True)
+class QuantileSketch:
+    "Approximate quantiles of a stream of values. Nan values are ignored"
+
+    "Relative accuracy of the quantiles"
+    alpha: float = DEFAULT_ALPHA
+
+    "Values are counted as value - offset. The relative accuracy is of the distance to the offset"
+    offset: float = 0.0
+
+    "Counts of positive values by bin index"
+    positive: dict[int, int] = field(default_factory=dict)
+
+    "Counts of negative values by bin index of their absolute value"
+    negative: dict[int, int] = field(default_factory=dict)
+
+    zeros: int = 0
+    count: int = 0
+
+    "Exact extremes. Quantiles are clamped to them"
+    min: float = inf
+    max: float = -inf
+
+    @property
+    def _gamma(self) -> float:
+        return (1 + self.alpha) / (1 - self.alpha)
+
+    def _value(self, index: int) -> float:
+        "Representative value of a bin. Within alpha of any value of the bin"
+        gamma = self._gamma
+        return 2 * gamma**index / (gamma + 1)
+
+    def compatible(self, other: "QuantileSketch") -> bool:
+        "Same accuracy and offset. Only compatible sketches can be merged or subtracted"
+        return (self.alpha, self.offset) == (other.alpha, other.offset)
+
+    def update(self, values: Iterable[float]):
+        vals = [v for v in values if not isnan(v)]
+        if len(vals) == 0:
+            return
+
+        positive, negative = self.positive, self.negative
+        inv_log_gamma = 1 / log(self._gamma)
+        offset = self.offset
+        for v in vals if offset == 0 else [v - offset for v in vals]:
+            if v > _MIN_INDEXABLE:
+                i = ceil(log(v) * inv_log_gamma)
+                positive[i] = positive.get(i, 0) + 1
+            elif v < -_MIN_INDEXABLE:
+                i = ceil(log(-v) * inv_log_gamma)
+                negative[i] = negative.get(i, 0) + 1
+            else:
+                self.zeros += 1
+        self.count += len(vals)
+        self.min = min(self.min, min(vals))
+        self.max = max(self.max, max(vals))
+
+    def merge(self, other: "QuantileSketch"):
+        "Add the values of other. Both must be compatible"
+        if not self.compatible(other):
+            raise ValueError(
+                f"Cannot merge sketches of different accuracy or offset: {self.alpha, self.offset} != {other.alpha, other.offset}"
+            )
+        for i, n in other.positive.items():
+            self.positive[i] = self.positive.get(i, 0) + n
+        for i, n in other.negative.items():
+            self.negative[i] = self.negative.get(i, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def subtract(self, other: "QuantileSketch"):
+        """
+        Remove the values of other, which must have been added before. Both must be compatible.
+
+        Bin counts are exact. Extremes can't be recomputed, they are kept as bounds.
+        """
+        if not self.compatible(other):
+            raise ValueError(
+                f"Cannot subtract sketches of different accuracy or offset: {self.alpha, self.offset} != {other.alpha, other.offset}"
+            )
+        for bins, other_bins in (
+            (self.positive, other.positive),
+            (self.negative, other.negative),
+        ):
+            for i, n in other_bins.items():
+                left = bins.get(i, 0) - n
+                if left < 0:
+                    raise ValueError("Cannot subtract values that were not added")
+                if left > 0:
+                    bins[i] = left
+                else:
+                    bins.pop(i, None)
+        self.zeros -= other.zeros
+        self.count -= other.count
+
+    def quantile(self, q: float) -> float:
+        "Approximate q quantile (0 <= q <= 1). 0 if there are no values (same as calc_percentile)"
+        if self.count == 0:
+            return 0
+        # CLAMPED TO THE EXACT EXTREMES.
+        return min(max(self._offset_quantile(q) + self.offset, self.min), self.max)
+
+    def _offset_quantile(self, q: float) -> float:
+        "Approximate q quantile of value - offset"
+        rank = q * (self.count - 1)
+        seen = 0
+        # ASCENDING ORDER: LARGEST NEGATIVE BINS FIRST, ZEROS, SMALLEST POSITIVE BINS FIRST.
+        for i in sorted(self.negative, reverse=True):
+            seen += self.negative[i]
+            if seen > rank:
+                return -self._value(i)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.positive):
+            seen += self.positive[i]
+            if seen > rank:
+                return self._value(i)
+        return self.max - self.offset
+
+    def to_dict(self) -> dict[str, Any]:
+        "Json serializable state"
+        return {
+            "alpha": self.alpha,
+            "offset": self.offset,
+            "positive": self.positive,
+            "negative": self.negative,
+            "zeros": self.zeros,
+            "count": self.count,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max if self.count > 0 else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "QuantileSketch":
+        "Inverse of to_dict. Json object keys (bin indexes) are strings"
+        return cls(
+            alpha=d["alpha"],
+            offset=d.get("offset", 0.0),
+            positive={int(i): n for i, n in d["positive"].items()},
+            negative={int(i): n for i, n in d["negative"].items()},
+            zeros=d["zeros"],
+            count=d["count"],
+            min=inf if d["min"] is None else d["min"],
+            max=-inf if d["max"] is None else d["max"],
+        )
+
+
+def variable_sketch(variable: str, alpha: float = DEFAULT_ALPHA) -> QuantileSketch:
+    "Empty sketch of a variable with its offset. Sketches of the same variable are compatible"
+    return QuantileSketch(alpha=alpha, offset=VARIABLE_OFFSETS.get(variable, 0.0))
@@ -0,0 +1,368 @@
+"""
+Online aggregation functions over streams of point batches (i.e. the monthly batches of timeseries_stream).
+
+Memory is constant: only the summary of the open bucket is kept (count, sum, min, max and optionally a quantile sketch of every numeric property plus
+its first and last point). Each batch is split by calendar bucket and every piece is folded into its bucket summary.
+A bucket is emitted as soon as a point of a later bucket arrives or the stream ends.
+
+Several statistics can be read from the same summary (StatsAggregator): one pass over the stream for all of them.
+Exact percentiles keep the raw values of the open bucket, so memory is bounded by the bucket instead of the range.
+
+Same calendar buckets as the iteration based aggregations. Pure python, no optional dependencies.
+"""
+
+from bisect import bisect_left
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta, tzinfo
+from itertools import pairwise
+from math import ceil, isnan, nan
+from operator import attrgetter
+from typing import Literal, NamedTuple
+
+from aemetAntartica.fetcher.batch import PointRecord, WeatherPointBatch
+from aemetAntartica.model.fetch import WeatherDataPoint
+
+from .annot import AggregatorCb
+from .bucketing import CalendarPeriod, bucket_bounds, bucket_floor, bucket_starts
+from .iteration import calc_percentile
+from .sketch import QuantileSketch, variable_sketch
+
+"""
+Aggregations that can be computed online. Quantiles are approximated with mergeable sketches, exact percentiles keep
+the raw values of the open bucket
+"""
+type StreamAggType = Literal[
+    "first", "last", "mean", "count", "min", "max", "quantile", "percentile"
+]
+
+"Numeric properties aggregated"
+VARIABLES = ("temp", "pres", "vel")
+
+
+class StreamStat(NamedTuple):
+    "Statistic of a multi statistic aggregation"
+
+    agg: StreamAggType
+    "Quantile (0 <= q <= 1) of quantile and percentile aggregations"
+    q: float = 0.5
+
+
+class BucketStats(NamedTuple):
+    "Several statistics of a calendar bucket"
+
+    "First date of the bucket"
+    fhora: datetime
+    "Aggregated point of every statistic, in the requested order"
+    points: tuple[PointRecord, ...]
+
+
+@dataclass(slots=True)
+class VariableSummary:
+    "Running count, sum, min and max of the not nan values of a numeric property"
+
+    count: int = 0
+    total: float = 0.0
+    min: float = nan
+    max: float = nan
+
+    def update(self, values: Iterable[float]):
+        vals = [v for v in values if not isnan(v)]
+        if len(vals) == 0:
+            return
+
+        lo, hi = min(vals), max(vals)
+        self.min = lo if self.count == 0 else min(self.min, lo)
+        self.max = hi if self.count == 0 else max(self.max, hi)
+        self.count += len(vals)
+        self.total += sum(vals)
+
+    @property
+    def mean(self) -> float:
+        "0 if there are no values (same as calc_mean)"
+        return self.total / self.count if self.count > 0 else 0.0
+
+
+@dataclass(slots=True)
+class BucketSummary:
+    "Summary of the points of a calendar bucket seen so far"
+
+    "Bucket start in the aggregation timezone"
+    start: datetime
+
+    first: PointRecord
+    last: PointRecord
+    variables: tuple[VariableSummary, ...] = field(
+        default_factory=lambda: tuple(VariableSummary() for _ in VARIABLES)
+    )
+
+    "Quantile sketch of every numeric property. Only kept for quantile aggregations"
+    sketches: tuple[QuantileSketch, ...] | None = None
+
+    "Raw values of every numeric property. Only kept for exact percentiles"
+    values: tuple[list[float], ...] | None = None
+
+    def update(self, last: PointRecord, columns: Sequence[Iterable[float]]):
+        self.last = last
+        for summary, values in zip(self.variables, columns):
+            summary.update(values)
+        if self.sketches is not None:
+            for sketch, values in zip(self.sketches, columns):
+                sketch.update(values)
+        if self.values is not None:
+            for raw, values in zip(self.values, columns):
+                raw.extend(values)
+
+    def result(self, agg: StreamAggType, q: float = 0.5) -> PointRecord:
+        "Aggregated point. Date is the first of the bucket. q is the quantile of quantile and percentile aggregations"
+        if agg == "first":
+            return self.first
+        if agg == "last":
+            return self.last
+
+        if agg == "mean":
+            values = [s.mean for s in self.variables]
+        elif agg == "count":
+            values = [float(s.count) for s in self.variables]
+        elif agg == "min":
+            values = [s.min for s in self.variables]
+        elif agg == "max":
+            values = [s.max for s in self.variables]
+        elif agg == "quantile" and self.sketches is not None:
+            values = [s.quantile(q) for s in self.sketches]
+        elif agg == "percentile" and self.values is not None:
+            values = [calc_percentile(v, q) for v in self.values]
+        else:
+            raise ValueError(f"Unfeasible stream aggregation {agg}")
+        return PointRecord(self.first.fhora, *values)
+
+
+def _batch_bounds(
+    batch: WeatherPointBatch, period: CalendarPeriod, tz: tzinfo
+) -> list[int]:
+    "Same as bucket_bounds over the timestamp column. No per point dates"
+    if len(batch) == 0:
+        return [0]
+
+    first = datetime.fromtimestamp(batch.fhora[0], UTC)
+    last = datetime.fromtimestamp(batch.fhora[-1], UTC)
+    starts = bucket_starts(first, last + timedelta(seconds=1), period, tz)
+    return sorted({bisect_left(batch.fhora, ceil(s.timestamp())) for s in starts})
+
+
+def _batch_record(batch: WeatherPointBatch, ndx: int) -> PointRecord:
+    return PointRecord(
+        datetime.fromtimestamp(batch.fhora[ndx], UTC),
+        batch.temp[ndx],
+        batch.pres[ndx],
+        batch.vel[ndx],
+    )
+
+
+def _to_record(point: WeatherDataPoint) -> PointRecord:
+    return PointRecord(point.fhora, point.temp, point.pres, point.vel)
+
+
+def _chunks(
+    points: Sequence[WeatherDataPoint], period: CalendarPeriod, tz: tzinfo
+) -> Iterator[tuple[PointRecord, PointRecord, Sequence[Iterable[float]]]]:
+    "First point, last point and numeric columns of the points of every non empty bucket"
+    if isinstance(points, WeatherPointBatch):
+        # COLUMN SLICES. NO PER POINT OBJECTS.
+        for ndx_0, ndx_f in pairwise(_batch_bounds(points, period, tz)):
+            yield (
+                _batch_record(points, ndx_0),
+                _batch_record(points, ndx_f - 1),
+                [getattr(points, v)[ndx_0:ndx_f] for v in VARIABLES],
+            )
+        return
+
+    for ndx_0, ndx_f in pairwise(
+        bucket_bounds(points, period, tz, attrgetter("fhora"))
+    ):
+        chunk = points[ndx_0:ndx_f]
+        yield (
+            _to_record(chunk[0]),
+            _to_record(chunk[-1]),
+            [list(map(attrgetter(v), chunk)) for v in VARIABLES],
+        )
+
+
+@dataclass
+class StatsAggregator:
+    """
+    Online calendar bucket aggregation of several statistics in a single pass. Batches must be pushed in
+    chronological order.
+
+    Every bucket is folded once into a single summary and all the statistics are read from it.
+    push returns the buckets closed by the batch, close returns the last one.
+    """
+
+    stats: Sequence[StreamStat]
+    period: CalendarPeriod
+    tz: tzinfo
+
+    "Summary of the bucket still open. None before the first point"
+    _open: BucketSummary | None = field(default=None, init=False)
+
+    def _result(self, summary: BucketSummary) -> BucketStats:
+        return BucketStats(
+            summary.first.fhora,
+            tuple(summary.result(s.agg, s.q) for s in self.stats),
+        )
+
+    def _new_summary(
+        self, start: datetime, first: PointRecord, last: PointRecord
+    ) -> BucketSummary:
+        summary = BucketSummary(start, first, last)
+        # SKETCHES AND RAW VALUES ARE SHARED BY EVERY QUANTILE OF THE SAME KIND.
+        if any(s.agg == "quantile" for s in self.stats):
+            summary.sketches = tuple(map(variable_sketch, VARIABLES))
+        if any(s.agg == "percentile" for s in self.stats):
+            summary.values = tuple([] for _ in VARIABLES)
+        return summary
+
+    def push(self, points: Sequence[WeatherDataPoint]) -> list[BucketStats]:
+        "Fold sorted points into their buckets. Statistics of the buckets closed so far"
+        closed: list[BucketStats] = []
+        for first, last, columns in _chunks(points, self.period, self.tz):
+            start = bucket_floor(first.fhora, self.period, self.tz)
+            if self._open is not None and start != self._open.start:
+                if start < self._open.start:
+                    raise ValueError(
+                        f"Points must be sorted by date: {first.fhora} is before the open bucket {self._open.start}"
+                    )
+                closed.append(self._result(self._open))
+                self._open = None
+
+            if self._open is None:
+                self._open = self._new_summary(start, first, last)
+            self._open.update(last, columns)
+
+        return closed
+
+    def close(self) -> list[BucketStats]:
+        "End of the stream. Statistics of the open bucket, if any"
+        if self._open is None:
+            return []
+
+        res = self._result(self._open)
+        self._open = None
+        return [res]
+
+
+@dataclass
+class StreamingAggregator:
+    """
+    Online calendar bucket aggregation. Batches must be pushed in chronological order.
+
+    push returns the buckets closed by the batch, close returns the last one.
+    """
+
+    agg: StreamAggType
+    period: CalendarPeriod
+    tz: tzinfo
+
+    "Quantile (0 <= q <= 1) of quantile aggregations"
+    q: float = 0.5
+
+    _stats: StatsAggregator = field(init=False)
+
+    def __post_init__(self):
+        self._stats = StatsAggregator(
+            (StreamStat(self.agg, self.q),), self.period, self.tz
+        )
+
+    def push(self, points: Sequence[WeatherDataPoint]) -> list[PointRecord]:
+        "Fold sorted points into their buckets. Aggregated points of the buckets closed so far"
+        return [s.points[0] for s in self._stats.push(points)]
+
+    def close(self) -> list[PointRecord]:
+        "End of the stream. Aggregated point of the open bucket, if any"
+        return [s.points[0] for s in self._stats.close()]
+
+
+def aggregate_stream(
+    batches: Iterable[Sequence[WeatherDataPoint]],
+    agg: StreamAggType,
+    period: CalendarPeriod,
+    tz: tzinfo,
+    q: float = 0.5,
+) -> Iterator[PointRecord]:
+    "One aggregated point per non empty bucket, yielded as soon as the bucket is closed"
+    aggregator = StreamingAggregator(agg, period, tz, q)
+    for batch in batches:
+        yield from aggregator.push(batch)
+    yield from aggregator.close()
+
+
+async def aggregate_async_stream(
+    batches: AsyncIterable[Sequence[WeatherDataPoint]],
+    agg: StreamAggType,
+    period: CalendarPeriod,
+    tz: tzinfo,
+    q: float = 0.5,
+) -> AsyncIterator[PointRecord]:
+    "Same as aggregate_stream for async streams (i.e. timeseries_stream)"
+    aggregator = StreamingAggregator(agg, period, tz, q)
+    async for batch in batches:
+        for point in aggregator.push(batch):
+            yield point
+    for point in aggregator.close():
+        yield point
+
+
+def aggregate_stream_stats(
+    batches: Iterable[Sequence[WeatherDataPoint]],
+    stats: Sequence[StreamStat],
+    period: CalendarPeriod,
+    tz: tzinfo,
+) -> Iterator[BucketStats]:
+    "Every statistic of every non empty bucket in a single pass, yielded as soon as the bucket is closed"
+    aggregator = StatsAggregator(stats, period, tz)
+    for batch in batches:
+        yield from aggregator.push(batch)
+    yield from aggregator.close()
+
+
+async def aggregate_async_stream_stats(
+    batches: AsyncIterable[Sequence[WeatherDataPoint]],
+    stats: Sequence[StreamStat],
+    period: CalendarPeriod,
+    tz: tzinfo,
+) -> AsyncIterator[BucketStats]:
+    "Same as aggregate_stream_stats for async streams (i.e. timeseries_stream)"
+    aggregator = StatsAggregator(stats, period, tz)
+    async for batch in batches:
+        for bucket in aggregator.push(batch):
+            yield bucket
+    for bucket in aggregator.close():
+        yield bucket
+
+
+def _stream_agg_factory(
+    agg: StreamAggType, q: float = 0.5
+) -> AggregatorCb[WeatherDataPoint]:
+    "Whole sequence aggregation as a single batch stream"
+
+    def agg_res(
+        data_in: Sequence[WeatherDataPoint], period: CalendarPeriod, tz: tzinfo
+    ) -> Sequence[WeatherDataPoint]:
+        return list(aggregate_stream([data_in], agg, period, tz, q))  # type: ignore
+
+    return agg_res
+
+
+"Count the not nan values of every numeric property"
+count_agg: AggregatorCb[WeatherDataPoint] = _stream_agg_factory("count")
+
+"Minimum of every numeric property"
+min_agg: AggregatorCb[WeatherDataPoint] = _stream_agg_factory("min")
+
+"Maximum of every numeric property"
+max_agg: AggregatorCb[WeatherDataPoint] = _stream_agg_factory("max")
+
+
+def approx_percentile_agg_factory(q: float) -> AggregatorCb[WeatherDataPoint]:
+    "Approximate q quantile of every numeric property (relative error under 1%, pressure relative to 1000 hPa)"
+    return _stream_agg_factory("quantile", q)
@@ -0,0 +1,205 @@
+"""
+Aggregation functions vectorized with numpy. Same calendar buckets and results as the iteration based ones.
+
+Numeric properties are read once into contiguous float64 columns (batch columns are used as they are). Every
+aggregation is then a segment operation over those columns. Segments are consecutive runs of points given by their
+boundaries. Dates are only converted for the returned points.
+
+Requires numpy (sci dependency group).
+"""
+
+from collections.abc import Callable, Sequence
+from datetime import UTC, datetime, timedelta, tzinfo
+from functools import partial
+from math import ceil
+from operator import attrgetter
+from typing import NamedTuple
+
+import numpy as np
+
+from aemetAntartica.fetcher.batch import PointRecord, WeatherPointBatch
+from aemetAntartica.model.fetch import WeatherDataPoint
+
+from .annot import AggregatorCb
+from .bucketing import CalendarPeriod, bucket_bounds, bucket_starts
+
+"Numeric properties aggregated"
+VARIABLES = ("temp", "pres", "vel")
+
+
+class PointColumns(NamedTuple):
+    "Numeric columns of a sequence of points"
+
+    temp: np.ndarray
+    pres: np.ndarray
+    vel: np.ndarray
+
+
+def to_columns(data_in: Sequence[WeatherDataPoint]) -> PointColumns:
+    """
+    Numeric columns of a sequence of points. Batches are wrapped without copies, other sequences read once per property.
+    """
+    if isinstance(data_in, WeatherPointBatch):
+        return PointColumns(
+            *(np.frombuffer(getattr(data_in, v), np.float64) for v in VARIABLES)
+        )
+
+    n = len(data_in)
+    return PointColumns(
+        *(
+            np.fromiter(map(attrgetter(v), data_in), np.float64, count=n)
+            for v in VARIABLES
+        )
+    )
+
+
+def dates_at(data_in: Sequence[WeatherDataPoint], ndx: np.ndarray) -> list[datetime]:
+    "Dates of the points at ndx. Only those are converted"
+    if isinstance(data_in, WeatherPointBatch):
+        fhora = np.frombuffer(data_in.fhora, np.int64)
+        return [datetime.fromtimestamp(t, UTC) for t in fhora[ndx].tolist()]
+    return [data_in[i].fhora for i in ndx.tolist()]
+
+
+def calendar_bounds(
+    data_in: Sequence[WeatherDataPoint], period: CalendarPeriod, tz: tzinfo
+) -> np.ndarray:
+    """
+    Boundaries of the non empty calendar buckets of points sorted by date. Same buckets as the iteration engine.
+
+    Batch dates are located with a single searchsorted over the timestamp column.
+    """
+    if not isinstance(data_in, WeatherPointBatch):
+        return np.array(bucket_bounds(data_in, period, tz, attrgetter("fhora")))
+    if len(data_in) == 0:
+        return np.zeros(1, np.int64)
+
+    fhora = np.frombuffer(data_in.fhora, np.int64)
+    first, last = dates_at(data_in, np.array([0, len(fhora) - 1]))
+    starts = bucket_starts(first, last + timedelta(seconds=1), period, tz)
+    bounds = np.searchsorted(fhora, [ceil(s.timestamp()) for s in starts])
+    # EMPTY BUCKETS (GAPS) ARE DROPPED.
+    return np.unique(bounds)
+
+
+def segment_first(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    "First value of every segment"
+    return values[bounds[:-1]]
+
+
+def segment_last(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    "Last value of every segment"
+    return values[bounds[1:] - 1]
+
+
+def _segment_sum(values: np.ndarray, bounds: np.ndarray, **kwargs) -> np.ndarray:
+    "Sum of every segment. Segments must not be empty"
+    # REDUCEAT RUNS THE LAST SEGMENT TO THE END OF THE ARRAY. CUT AT ITS BOUNDARY.
+    return np.add.reduceat(values[: bounds[-1]], bounds[:-1], **kwargs)
+
+
+def _segment_counts(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    "Not nan values per segment"
+    return _segment_sum(~np.isnan(values), bounds, dtype=np.int64)
+
+
+def segment_mean(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    "Mean of every segment ignoring nan. 0 if there are no values (same as calc_mean)"
+    if len(bounds) < 2:
+        return np.empty(0)
+
+    sums = _segment_sum(np.nan_to_num(values, nan=0.0), bounds)
+    counts = _segment_counts(values, bounds)
+    return np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
+
+
+def segment_quantile(values: np.ndarray, bounds: np.ndarray, q: float) -> np.ndarray:
+    """
+    Q quantile of every segment ignoring nan, interpolated as calc_percentile. 0 if there are no values.
+
+    Linear time selection (np.partition) of the closest ranks of each segment, no sorting.
+    """
+    res = np.zeros(max(len(bounds) - 1, 0))
+    for i, (b0, bf) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+        segment = values[b0:bf]
+        segment = segment[~np.isnan(segment)]
+        if len(segment) == 0:
+            continue
+
+        pos = q * (len(segment) - 1)
+        lo = int(pos)
+        frac = pos - lo
+        hi = min(lo + 1, len(segment) - 1)
+        selected = np.partition(segment, (lo, hi))
+        res[i] = (
+            selected[lo]
+            if frac == 0
+            else selected[lo] * (1 - frac) + selected[hi] * frac
+        )
+    return res
+
+
+def segment_median(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    "Median of every segment ignoring nan. 0 if there are no values (same as calc_median)"
+    return segment_quantile(values, bounds, 0.5)
+
+
+def _to_points(dates: list[datetime], columns: PointColumns) -> list[PointRecord]:
+    "Aggregated columns as records"
+    return list(map(PointRecord, dates, *(c.tolist() for c in columns)))
+
+
+def _picker_agg_factory(
+    pick_f: Callable[[np.ndarray, np.ndarray], np.ndarray],
+) -> AggregatorCb[WeatherDataPoint]:
+    "Aggregations that select a whole point of every segment. Points of non batch sequences are returned as they are"
+
+    def agg_res(
+        data_in: Sequence[WeatherDataPoint], period: CalendarPeriod, tz: tzinfo
+    ) -> Sequence[WeatherDataPoint]:
+        ndx = pick_f(np.arange(len(data_in)), calendar_bounds(data_in, period, tz))
+        if not isinstance(data_in, WeatherPointBatch):
+            return [data_in[i] for i in ndx.tolist()]
+
+        columns = to_columns(data_in)
+        return _to_points(
+            dates_at(data_in, ndx), PointColumns(*(c[ndx] for c in columns))
+        )  # type: ignore
+
+    return agg_res
+
+
+def _calc_agg_factory(
+    calc_f: Callable[[np.ndarray, np.ndarray], np.ndarray],
+) -> AggregatorCb[WeatherDataPoint]:
+    "Aggregations that calculate every numeric property. Date is the first of the segment"
+
+    def calc_agg(
+        data_in: Sequence[WeatherDataPoint], period: CalendarPeriod, tz: tzinfo
+    ) -> Sequence[WeatherDataPoint]:
+        bounds = calendar_bounds(data_in, period, tz)
+        columns = to_columns(data_in)
+        return _to_points(
+            dates_at(data_in, bounds[:-1]),
+            PointColumns(*(calc_f(c, bounds) for c in columns)),
+        )  # type: ignore
+
+    return calc_agg
+
+
+"Take the first measurement of the group"
+first_agg: AggregatorCb[WeatherDataPoint] = _picker_agg_factory(segment_first)
+
+"Take the last measurement of the group"
+last_agg: AggregatorCb[WeatherDataPoint] = _picker_agg_factory(segment_last)
+
+"Calculate the mean of every numeric property"
+mean_agg: AggregatorCb[WeatherDataPoint] = _calc_agg_factory(segment_mean)
+
+"Calculate the median of every numeric property"
+median_agg: AggregatorCb[WeatherDataPoint] = _calc_agg_factory(segment_median)
+
+
+def percentile_agg_factory(q: float) -> AggregatorCb[WeatherDataPoint]:
+    "Exact q quantile of every numeric property"
+    return _calc_agg_factory(partial(segment_quantile, q=q))
@@ -2,20 +2,110 @@
 Main fastapi app object with route definition
 """
 
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+from typing import TypedDict
 from uuid import uuid4
 
-from fastapi import FastAPI, Request, Response
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from structlog import get_logger
 from structlog.contextvars import (
     bind_contextvars,
 )
 
-from .dependencies import AemetAggDataQuery
-from .response import WeatherDataPointSeriesPaginationResult
+from aemetAntartica.fetcher.context import (
+    async_httpx_client_ctx,
+    hedger_ctx,
+    rate_limiter_ctx,
+    retry_policy_ctx,
+    timeout_policy_ctx,
+)
+from aemetAntartica.fetcher.deadline import LatencyHedger, TimeoutPolicy
+from aemetAntartica.fetcher.exceptions import DeadlineExceededError
+from aemetAntartica.fetcher.factory import (
+    cached_gen_memory_cache_env_var,
+    close_cached_aemet_fetcher,
+    gen_cache_warmer_env_var,
+    gen_hedger_env_var,
+    gen_httpx_client_env_var,
+    gen_rate_limiter_env_var,
+    gen_retry_policy_env_var,
+    gen_timeout_policy_env_var,
+)
+from aemetAntartica.fetcher.memory_cache import CacheStats
+from aemetAntartica.fetcher.rate_limit import AdaptiveRateLimiter, RetryPolicy
+from aemetAntartica.fetcher.warmup import CacheWarmer, WarmupProgress
+
+from .dependencies import AemetAggDataQuery, AemetStreamDataQuery
+from .response import (
+    WeatherDataPointSeriesPaginationResult,
+    WeatherStatsPaginationResult,
+)
 
 logger = get_logger(__name__)
 
-app = FastAPI()
+
+class AppState(TypedDict):
+    "Resources owned by the app lifespan. Available through request.state"
+
+    httpx_client: httpx.AsyncClient
+    rate_limiter: AdaptiveRateLimiter | None
+    retry_policy: RetryPolicy
+    timeout_policy: TimeoutPolicy
+    hedger: LatencyHedger | None
+    warmer: CacheWarmer | None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[AppState]:
+    """
+    Open process-wide resources on startup and release them on shutdown.
+    """
+    async with gen_httpx_client_env_var() as httpx_client:
+        logger.info("Pooled http client ready")
+        state: AppState = {
+            "httpx_client": httpx_client,
+            "rate_limiter": gen_rate_limiter_env_var(),
+            "retry_policy": gen_retry_policy_env_var(),
+            "timeout_policy": gen_timeout_policy_env_var(),
+            "hedger": gen_hedger_env_var(),
+            "warmer": await gen_cache_warmer_env_var(),
+        }
+
+        # BACKGROUND TASK SHARES THE RESOURCES OF REQUESTS (CONTEXT IS COPIED ON CREATION). NO DEADLINE.
+        warmup_task = None
+        if state["warmer"] is not None:
+            with (
+                async_httpx_client_ctx(httpx_client),
+                rate_limiter_ctx(state["rate_limiter"]),
+                retry_policy_ctx(state["retry_policy"]),
+                timeout_policy_ctx(state["timeout_policy"]),
+                hedger_ctx(state["hedger"]),
+            ):
+                warmup_task = asyncio.create_task(state["warmer"].run())
+
+        yield state
+
+        if warmup_task is not None:
+            warmup_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await warmup_task
+        await close_cached_aemet_fetcher()
+    logger.info("Pooled http client closed")
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded_handler(request: Request, e: DeadlineExceededError):
+    logger.warning("Request deadline exceeded", error=repr(e))
+    return JSONResponse(
+        status_code=504, content={"detail": "Upstream data source timed out"}
+    )
 
 
 @app.get(
@@ -23,13 +113,61 @@ app = FastAPI()
 )
 async def station_data(
     agg_data: AemetAggDataQuery,
-) -> WeatherDataPointSeriesPaginationResult:
+) -> WeatherDataPointSeriesPaginationResult | WeatherStatsPaginationResult:
     """
-    Fetch or agregate station timeseries data
+    Fetch or agregate station timeseries data. Several statistics at once with stats
     """
     return agg_data  # type: ignore
 
 
+@app.get(
+    "/api/antartida/datos/fechaini/{date_0}/fechafin/{date_f}/estacion/{station_id}/stream",
+    response_class=StreamingResponse,
+)
+async def station_data_stream(
+    lines: AemetStreamDataQuery,
+) -> StreamingResponse:
+    """
+    Stream raw station timeseries as NDJSON. One point per line, sent month by month.
+    """
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@app.get("/api/cache/warmup")
+async def cache_warmup(request: Request) -> WarmupProgress:
+    """
+    Progress of the background cache warm-up
+    """
+    warmer: CacheWarmer | None = request.state.warmer
+    if warmer is None:
+        raise HTTPException(status_code=404, detail="Cache warm-up is disabled")
+    return warmer.progress
+
+
+@app.get("/api/cache/memory")
+async def cache_memory() -> CacheStats:
+    """
+    Hit, miss, eviction and expiration counters of the memory cache
+    """
+    memory_cache = cached_gen_memory_cache_env_var()
+    if memory_cache is None:
+        raise HTTPException(status_code=404, detail="Memory cache is disabled")
+    return memory_cache.stats()
+
+
+@app.middleware("http")
+async def fetch_resources_context(request: Request, call_next):
+    "Inject process-wide fetch resources (pooled http client, rate limiter, retry and timeout policies)."
+    with (
+        async_httpx_client_ctx(request.state.httpx_client),
+        rate_limiter_ctx(request.state.rate_limiter),
+        retry_policy_ctx(request.state.retry_policy),
+        timeout_policy_ctx(request.state.timeout_policy),
+        hedger_ctx(request.state.hedger),
+    ):
+        return await call_next(request)
+
+
 @app.middleware("http")
 async def syslogger_context(request: Request, call_next):
     request_id = str(uuid4())
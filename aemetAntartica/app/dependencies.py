@@ -3,26 +3,50 @@ Dependencies factories for fastapi
 """
 
 import operator
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
 from typing import Annotated, Callable, TypeAlias
+from zoneinfo import ZoneInfo
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 
-from aemetAntartica.fetcher.annot import WeatherDataFetcher, WeatherPoint
+from aemetAntartica.aggregator.bucketing import bucket_starts
+from aemetAntartica.aggregator.streaming import (
+    aggregate_async_stream,
+    aggregate_async_stream_stats,
+)
+from aemetAntartica.fetcher.annot import (
+    AggregatingFetcher,
+    QuantileFetcher,
+    WeatherDataFetcher,
+    WeatherPoint,
+)
+from aemetAntartica.fetcher.batch import WeatherPointBatch
+from aemetAntartica.fetcher.context import current_timeout_policy, deadline_ctx
 from aemetAntartica.fetcher.factory import cached_gen_aemet_fetcher_env_var
-from aemetAntartica.model.factory import change_series_timezone_os
-from aemetAntartica.model.fetch import WeatherDataPoint
+from aemetAntartica.model.factory import (
+    change_series_timezone_os,
+    result_timezone_os,
+    stream_aggregation_months_os,
+)
+from aemetAntartica.model.fetch import WeatherDataPoint, WeatherDataPointSeries
 from aemetAntartica.util.bisect import find_between
+from aemetAntartica.util.datetime import month_starts
 
 from .enum import AggTimeOpts, AggTypeOpts
 from .params import (
+    AggregationOptions,
     AggregationOptionsParam,
     Date0PathParam,
     DateFPathParam,
     StationIdPathParam,
+    StreamOptionsParam,
 )
 from .response import (
     WeatherDataPointSeriesPaginationResult,
+    WeatherStatsPaginationResult,
     pagination_series_to_response,
+    stats_to_response,
     weather_data_point_pagination_factory,
 )
 
@@ -35,40 +59,140 @@ TimezonePointConvert: TypeAlias = Annotated[
     Depends(change_series_timezone_os),
 ]
 
+ResultTimezone: TypeAlias = Annotated[ZoneInfo, Depends(result_timezone_os)]
+
+StreamAggregationMonths: TypeAlias = Annotated[
+    int, Depends(stream_aggregation_months_os)
+]
+
+
+async def request_deadline() -> AsyncIterator[None]:
+    """
+    Bound the whole request by the injected timeout policy.
+
+    Only for routes that answer once everything is fetched. Streams are bounded per upstream call instead.
+    """
+    with deadline_ctx(current_timeout_policy().deadline()):
+        yield
+
+
+RequestDeadline: TypeAlias = Annotated[None, Depends(request_deadline)]
+
+
+def validate_points(points: Sequence[WeatherPoint]) -> Sequence[WeatherDataPoint]:
+    """
+    Validate fetched points. Trusted batches (i.e. sql cache hits) skip pydantic and are returned as records.
+    """
+    if isinstance(points, WeatherPointBatch) and points.trusted:
+        return points.records()  # type: ignore
+
+    # BULK VALIDATION. CHEAPER THAN ONE CALL PER POINT.
+    return WeatherDataPointSeries.model_validate({"points": points}).points
+
+
+def filter_points(
+    points: Sequence[WeatherPoint], date_0: datetime, date_f: datetime, columnar: bool
+) -> Sequence[WeatherDataPoint]:
+    """
+    Validated points in [date_0, date_f). Trusted batches are sliced as they are for columnar consumers.
+    """
+    if columnar and isinstance(points, WeatherPointBatch) and points.trusted:
+        # COLUMNS GO STRAIGHT TO THE AGGREGATION. NO PER POINT OBJECTS.
+        return points.between(date_0, date_f)  # type: ignore
+
+    models = validate_points(points)
+    return find_between(models, date_0, date_f, key=operator.attrgetter("fhora"))
+
 
 async def aggregate_aemet_data(
+    _deadline: RequestDeadline,
     date_0: Date0PathParam,
     date_f: DateFPathParam,
     station_id: StationIdPathParam,
     agg_opts: AggregationOptionsParam,
     data_fetch: AemetDataFetcher,
     tz_convert: TimezonePointConvert,
-) -> WeatherDataPointSeriesPaginationResult:
+    tz: ResultTimezone,
+    stream_months: StreamAggregationMonths,
+) -> WeatherDataPointSeriesPaginationResult | WeatherStatsPaginationResult:
     """
     Aggregation top level functions
 
     It starts the fetching process, filters, sorts, aggregates, changes timezone...
     """
+    if len(agg_opts.stats) > 0:
+        return await aggregate_aemet_stats(
+            date_0, date_f, station_id, agg_opts, data_fetch, tz
+        )
+
     agg_opt = agg_opts.agg_opt
     time_opt = agg_opts.time_opt
 
-    # TODO: RAISE ERROR.
     # BOTH HAVE TO BE INFORMED TOGETHER. CANNOT AGGREGATE OVER NULL TIME FRAME.
     if (agg_opt == AggTypeOpts.NONE) != (time_opt == AggTimeOpts.NONE):
-        ...
+        raise HTTPException(
+            status_code=422,
+            detail="Aggregation type and time have to be informed together",
+        )
 
     agg_f = agg_opt.to_agg_f()
-    agg_td = time_opt.to_period()
-
-    ts = await data_fetch.timeseries(date_0, date_f, station_id)
+    agg_period = time_opt.to_period()
 
-    # TODO: MOVE TO SERIES...
-    models_ts = list(map(WeatherDataPoint.model_validate, ts))
-    filtered_models_ts = find_between(
-        models_ts, date_0, date_f, key=operator.attrgetter("fhora")
+    # SAME CALENDAR BUCKETS AS THE PYTHON AGGREGATIONS.
+    buckets = (
+        bucket_starts(date_0, date_f, agg_period, tz) if agg_period is not None else []
     )
 
-    agg_data = agg_f(filtered_models_ts, agg_td)
+    # PUSH DOWN TO THE SOURCE IF POSSIBLE (I.E. FULLY CACHED IN SQL). ONLY AGGREGATED ROWS ARE READ.
+    agg_data: Sequence[WeatherDataPoint] | None = None
+    sql_agg = agg_opt.to_sql_agg()
+    if (
+        sql_agg is not None
+        and agg_period is not None
+        and isinstance(data_fetch, AggregatingFetcher)
+    ):
+        agg_data = await data_fetch.aggregate(
+            date_0, date_f, station_id, sql_agg, buckets
+        )
+
+    q = agg_opt.quantile()
+    if (
+        agg_data is None
+        and q is not None
+        and agg_opt.is_approximate()
+        # CACHED SKETCHES ARE MONTHLY. SHORTER BUCKETS WOULD BE READ RAW ANYWAY.
+        and agg_period == "month"
+        and isinstance(data_fetch, QuantileFetcher)
+    ):
+        agg_data = await data_fetch.quantiles(date_0, date_f, station_id, q, buckets)
+
+    # WHOLE SERIES (VECTORIZED) UNLESS THE RANGE IS TOO LONG TO HOLD IN MEMORY OR THERE IS NO VECTORIZED ENGINE.
+    stream_agg = agg_opt.to_stream_agg()
+    n_months = len(month_starts(date_0, date_f)) - 1
+    if (
+        agg_data is None
+        and stream_agg is not None
+        and agg_period is not None
+        and (not agg_opt.is_vectorized() or n_months > stream_months)
+    ):
+        # ONLINE AGGREGATION. A SINGLE BATCH (USUALLY A MONTH) OF RAW POINTS IN MEMORY AT A TIME.
+        batches = (
+            filter_points(batch, date_0, date_f, columnar=True)
+            async for batch in data_fetch.timeseries_stream(date_0, date_f, station_id)
+        )
+        agg_data = [
+            point
+            async for point in aggregate_async_stream(
+                batches, stream_agg, agg_period, tz, q if q is not None else 0.5
+            )
+        ]  # type: ignore
+
+    if agg_data is None:
+        ts = await data_fetch.timeseries(date_0, date_f, station_id)
+        filtered_models_ts = filter_points(
+            ts, date_0, date_f, columnar=agg_opt.is_vectorized()
+        )
+        agg_data = agg_f(filtered_models_ts, agg_period, tz)  # type: ignore
 
     # TODO: CONVERT TIMEZONE.
 
@@ -81,6 +205,82 @@ async def aggregate_aemet_data(
     return pagination_series_to_response(pagination, agg_opts.data_props)
 
 
+async def aggregate_aemet_stats(
+    date_0: datetime,
+    date_f: datetime,
+    station_id: str,
+    agg_opts: AggregationOptions,
+    data_fetch: WeatherDataFetcher[WeatherPoint],
+    tz: ZoneInfo,
+) -> WeatherStatsPaginationResult:
+    """
+    Several aggregations in a single fetch and a single pass over every bucket. One column per statistic and property.
+    """
+    agg_period = agg_opts.time_opt.to_period()
+    if agg_period is None:
+        raise HTTPException(
+            status_code=422, detail="Aggregation statistics need an aggregation time"
+        )
+
+    # REPEATED STATISTICS WOULD GIVE REPEATED COLUMNS.
+    agg_types = [
+        opt for opt in dict.fromkeys(agg_opts.stats) if opt != AggTypeOpts.NONE
+    ]
+    stats = [opt.to_stream_stat() for opt in agg_types]
+
+    batches = (
+        filter_points(batch, date_0, date_f, columnar=True)
+        async for batch in data_fetch.timeseries_stream(date_0, date_f, station_id)
+    )
+    rows = [
+        row
+        async for row in aggregate_async_stream_stats(
+            batches,
+            stats,  # type: ignore
+            agg_period,
+            tz,
+        )
+    ]
+
+    return stats_to_response(
+        rows,
+        [opt.value for opt in agg_types],
+        agg_opts.data_props,
+        agg_opts.skip,
+        agg_opts.limit,
+        tz,
+    )
+
+
 AemetAggDataQuery: TypeAlias = Annotated[
     WeatherDataFetcher[WeatherPoint], Depends(aggregate_aemet_data)
 ]
+
+
+async def stream_aemet_data(
+    date_0: Date0PathParam,
+    date_f: DateFPathParam,
+    station_id: StationIdPathParam,
+    stream_opts: StreamOptionsParam,
+    data_fetch: AemetDataFetcher,
+    tz_convert: TimezonePointConvert,
+) -> AsyncIterator[str]:
+    """
+    Streaming top level function. Raw data only.
+
+    Returns NDJSON lines. Every monthly batch is validated, filtered and converted as soon as it arrives.
+    """
+    include = {"fhora", *stream_opts.data_props} if stream_opts.data_props else None
+
+    async def ndjson_lines():
+        async for batch in data_fetch.timeseries_stream(date_0, date_f, station_id):
+            filtered_models = filter_points(batch, date_0, date_f, columnar=False)
+            for model in map(tz_convert, filtered_models):
+                yield model.model_dump_json(include=include) + "\n"
+
+    return ndjson_lines()
+
+
+AemetStreamDataQuery: TypeAlias = Annotated[
+    AsyncIterator[str], Depends(stream_aemet_data)
+]
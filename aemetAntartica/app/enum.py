@@ -2,18 +2,34 @@
 Raw enum types.
 """
 
-from datetime import timedelta
 from enum import Enum
 
+from aemetAntartica.fetcher.annot import SqlAggType
 from aemetAntartica.model.fetch import WeatherDataPoint
 from aemetAntartica.aggregator.annot import AggregatorCb
+from aemetAntartica.aggregator.bucketing import CalendarPeriod
 from aemetAntartica.aggregator.iteration import (
     first_agg,
     last_agg,
     mean_agg,
     median_agg,
     identity_agg,
+    percentile_agg_factory,
 )
+from aemetAntartica.aggregator.streaming import (
+    StreamAggType,
+    StreamStat,
+    approx_percentile_agg_factory,
+    count_agg,
+    max_agg,
+    min_agg,
+)
+
+try:
+    # NUMPY IS OPTIONAL (SCI GROUP). PYTHON AGGREGATIONS OTHERWISE.
+    from aemetAntartica.aggregator import vectorized
+except ImportError:
+    vectorized = None
 
 
 class AggTimeOpts(str, Enum):
@@ -26,19 +42,18 @@ class AggTimeOpts(str, Enum):
     DAILY = "daily"
     MONTHLY = "monthly"
 
-    def to_period(self) -> timedelta:
+    def to_period(self) -> CalendarPeriod | None:
         """
-        Return period given
+        Return calendar period given. None if not aggregated
         """
         if self == AggTimeOpts.NONE:
-            # INVALID TD. SHOULDN'T BE USE.
-            return timedelta(hours=0)
+            return None
         if self == AggTimeOpts.HOURLY:
-            return timedelta(hours=1)
+            return "hour"
         if self == AggTimeOpts.DAILY:
-            return timedelta(days=1)
+            return "day"
         if self == AggTimeOpts.MONTHLY:
-            return timedelta(days=30)
+            return "month"
         raise ValueError(f"Unfeasible enum value {self}")
 
 
@@ -52,10 +67,42 @@ class AggTypeOpts(str, Enum):
     LAST = "last"
     MEAN = "mean"
     MEDIAN = "median"
+    COUNT = "count"
+    MIN = "min"
+    MAX = "max"
+    P10 = "p10"
+    P90 = "p90"
+    P99 = "p99"
+    P10_APPROX = "p10_approx"
+    P90_APPROX = "p90_approx"
+    P99_APPROX = "p99_approx"
 
     def to_agg_f(self) -> AggregatorCb[WeatherDataPoint]:
+        "Numpy vectorized aggregation if available. Iteration based otherwise"
         if self == AggTypeOpts.NONE:
             return identity_agg
+        if self == AggTypeOpts.COUNT:
+            return count_agg
+        if self == AggTypeOpts.MIN:
+            return min_agg
+        if self == AggTypeOpts.MAX:
+            return max_agg
+
+        q = self.quantile()
+        if q is not None and self.is_approximate():
+            return approx_percentile_agg_factory(q)
+        if q is not None and vectorized is not None:
+            return vectorized.percentile_agg_factory(q)
+        if q is not None:
+            return percentile_agg_factory(q)
+
+        if vectorized is not None:
+            return {
+                AggTypeOpts.FIRST: vectorized.first_agg,
+                AggTypeOpts.LAST: vectorized.last_agg,
+                AggTypeOpts.MEAN: vectorized.mean_agg,
+                AggTypeOpts.MEDIAN: vectorized.median_agg,
+            }[self]
         if self == AggTypeOpts.FIRST:
             return first_agg
         if self == AggTypeOpts.LAST:
@@ -65,3 +112,67 @@ class AggTypeOpts(str, Enum):
         if self == AggTypeOpts.MEDIAN:
             return median_agg
         raise ValueError(f"Unfeasible enum value {self}")
+
+    def is_vectorized(self) -> bool:
+        "to_agg_f works on columns. Trusted batches may be passed as they are, without records"
+        return vectorized is not None and self in (
+            AggTypeOpts.FIRST,
+            AggTypeOpts.LAST,
+            AggTypeOpts.MEAN,
+            AggTypeOpts.MEDIAN,
+            AggTypeOpts.P10,
+            AggTypeOpts.P90,
+            AggTypeOpts.P99,
+        )
+
+    def quantile(self) -> float | None:
+        "Quantile of percentile aggregations (i.e. 0.9 for p90 and p90_approx). None otherwise"
+        return {
+            AggTypeOpts.P10: 0.1,
+            AggTypeOpts.P90: 0.9,
+            AggTypeOpts.P99: 0.99,
+            AggTypeOpts.P10_APPROX: 0.1,
+            AggTypeOpts.P90_APPROX: 0.9,
+            AggTypeOpts.P99_APPROX: 0.99,
+        }.get(self)
+
+    def is_approximate(self) -> bool:
+        "Percentile approximated with mergeable sketches (relative error under 1%, pressure relative to 1000 hPa)"
+        return self in (
+            AggTypeOpts.P10_APPROX,
+            AggTypeOpts.P90_APPROX,
+            AggTypeOpts.P99_APPROX,
+        )
+
+    def to_stream_agg(self) -> StreamAggType | None:
+        "Aggregation that can be computed online over the fetcher stream. None if it needs every point (i.e. median)"
+        if self.is_approximate():
+            return "quantile"
+        if (
+            self in (AggTypeOpts.NONE, AggTypeOpts.MEDIAN)
+            or self.quantile() is not None
+        ):
+            return None
+        return self.value  # type: ignore
+
+    def to_stream_stat(self) -> StreamStat | None:
+        "Statistic of multi statistic aggregations. Exact percentiles keep the values of a bucket. None if raw"
+        if self == AggTypeOpts.NONE:
+            return None
+        if self == AggTypeOpts.MEDIAN:
+            return StreamStat("percentile", 0.5)
+
+        q = self.quantile()
+        if q is not None:
+            return StreamStat("quantile" if self.is_approximate() else "percentile", q)
+        return StreamStat(self.value)  # type: ignore
+
+    def to_sql_agg(self) -> SqlAggType | None:
+        "Aggregation that can be pushed down to the source. None if python only (i.e. median)"
+        if self == AggTypeOpts.FIRST:
+            return "first"
+        if self == AggTypeOpts.LAST:
+            return "last"
+        if self == AggTypeOpts.MEAN:
+            return "mean"
+        return None
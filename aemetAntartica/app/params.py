@@ -41,17 +41,38 @@ AggTypeQueryParam: TypeAlias = Annotated[
     ),
 ]
 
+AggStatsQueryParam: TypeAlias = Annotated[
+    list[AggTypeOpts],
+    Query(
+        title="Aggregation statistics",
+        description="Several aggregation types computed in a single pass. One column per statistic and property "
+        "(i.e. temp_mean). Replaces agg_opt when informed.",
+    ),
+]
+
 
 class AggregationOptions(BaseModel):
     """
-    This model includes aggregation time options, aggregation type and pagination options.
+    This model includes aggregation time options, aggregation types and pagination options.
     """
 
     time_opt: AggTimeQueryParam = AggTimeOpts.NONE
     agg_opt: AggTypeQueryParam = AggTypeOpts.NONE
+    stats: AggStatsQueryParam = Field(default_factory=list)
     skip: int = 0
     limit: int = 10  # TODO: ADD VALIDATION, 100 MAX
     data_props: list[WeatherPointResponseKey] = Field(default_factory=list)
 
 
 AggregationOptionsParam: TypeAlias = Annotated[AggregationOptions, Query()]
+
+
+class StreamOptions(BaseModel):
+    """
+    Options for streamed raw responses. No pagination since the whole range is streamed.
+    """
+
+    data_props: list[WeatherPointResponseKey] = Field(default_factory=list)
+
+
+StreamOptionsParam: TypeAlias = Annotated[StreamOptions, Query()]
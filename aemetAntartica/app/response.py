@@ -3,9 +3,10 @@ Models used for data response
 """
 
 from collections.abc import Sequence
-from datetime import datetime
+from datetime import datetime, tzinfo
 from typing import Literal, TypedDict
 
+from aemetAntartica.aggregator.streaming import BucketStats
 from aemetAntartica.model.fetch import WeatherDataPoint, WeatherDataPointSeries
 
 from pydantic import BaseModel
@@ -89,3 +90,38 @@ def pagination_series_to_response(
         has_previous=series.has_previous,
         has_next=series.has_next,
     )
+
+
+class WeatherStatsPaginationResult(PaginationMixin):
+    "Pagination class of multi statistic aggregations. One column per statistic and property (i.e. temp_mean)."
+
+    points: list[dict[str, datetime | float]]
+
+
+def stats_to_response(
+    rows: Sequence[BucketStats],
+    stats: Sequence[str],
+    keys: Sequence[WeatherPointResponseKey],
+    skip: int,
+    limit: int,
+    tz: tzinfo,
+) -> WeatherStatsPaginationResult:
+    """
+    Factory of multi statistic response series. Bucket stats hold one point per statistic, in stats order.
+    """
+    ndx_f = skip + limit
+
+    # RETURN ALL TYPES WHEN NO KEYS PROVIDED
+    props = keys if len(keys) > 0 else ("temp", "pres", "vel")
+
+    def row_d(row: BucketStats) -> dict[str, datetime | float]:
+        d: dict[str, datetime | float] = {"fhora": row.fhora.astimezone(tz)}
+        for stat, point in zip(stats, row.points):
+            d.update({f"{k}_{stat}": getattr(point, k) for k in props})
+        return d
+
+    return WeatherStatsPaginationResult(
+        points=list(map(row_d, rows[skip:ndx_f])),
+        has_previous=skip > 0,
+        has_next=ndx_f < len(rows),
+    )
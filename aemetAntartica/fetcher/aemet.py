@@ -2,10 +2,12 @@
 Fetcher service for aemet open data
 """
 
+import asyncio
 import logging
 import operator as op
-from asyncio import TaskGroup
+from abc import ABC, abstractmethod
 from collections.abc import (
+    AsyncIterator,
     Awaitable,
     Callable,
     Coroutine,
@@ -13,38 +15,44 @@ from collections.abc import (
     Mapping,
     Sequence,
 )
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import partial
 from datetime import datetime, timedelta
 from itertools import chain, repeat
 from string import Template
 
 import structlog
 import asyncstdlib
-import httpx
 
-from aemetAntartica.fetcher.fetch_functions import aemet_2_step_fetch
-from aemetAntartica.util.itertools import grouper
+from aemetAntartica.fetcher.fetch_functions import (
+    aemet_2_step_fetch,
+    aemet_fetch_data,
+    aemet_fetch_ticket,
+)
+from aemetAntartica.util.asyncio import SingleFlight, bounded_map, pipeline_map
 
-from .annot import AemetWeatherPoint, StationMetaData
-from .context import api_key_ctx, async_httpx_client_ctx
+from .annot import AemetTicketResponse, StationMetaData, WeatherPoint
+from .context import api_key_ctx, async_httpx_client_scope
 from .exceptions import (
     DateRangeValueError,
     EndDateValueError,
+    FetchAbandonedError,
     IniDateValueError,
     StationIdValueError,
 )
+from .memory_cache import MemoryCache
 
 logger = structlog.getLogger(__name__)
 
 
 @dataclass(frozen=True)
-class AemetWeatherDataFetcherMixin:
+class AemetWeatherDataFetcherMixin(ABC):
     """
     Fetch data from aemet open portal. https://opendata.aemet.es/...
 
     Stations metadata in memory and requests timesereis from aemet opendata portal.
 
-    Timeseries method stub only. Implement in subclass.
+    Abstract: subclasses implement timeseries_stream. Timeseries gathers the whole stream in memory.
 
     Naieve implementation. This will only work for requests with a max range of 1 month.
     """
@@ -75,6 +83,34 @@ class AemetWeatherDataFetcherMixin:
     async def stations(self) -> list[str]:
         return list(self.stations_metadata.keys())
 
+    @abstractmethod
+    def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        """
+        Yield batches of points (usually a month) in chronological order as soon as they are available.
+        """
+        ...
+
+    async def timeseries(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> Sequence[WeatherPoint]:
+        res_matrix = await asyncstdlib.list(
+            self.timeseries_stream(date_0, date_f, station_id)
+        )
+        return list(chain.from_iterable(res_matrix))
+
+    async def timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, Sequence[WeatherPoint]]:
+        """
+        One timeseries request after another. Override for shared scheduling.
+        """
+        return {
+            station_id: await self.timeseries(date_0, date_f, station_id)
+            for station_id in dict.fromkeys(stations)
+        }
+
     async def time_range(self, station_id: str) -> tuple[datetime, datetime]:
         station_metadata = self._get_station_metadata(station_id)
         return (
@@ -128,7 +164,7 @@ class AemetWeatherDataFetcherNaive(AemetWeatherDataFetcherMixin):
 
     async def timeseries(
         self, date_0: datetime, date_f: datetime, station_id: str
-    ) -> Sequence[AemetWeatherPoint]:
+    ) -> Sequence[WeatherPoint]:
         """
         Directly fetch as much as possible in one request.
         """
@@ -148,15 +184,18 @@ class AemetWeatherDataFetcherNaive(AemetWeatherDataFetcherMixin):
             station_metadata["station_id"],
         )
 
-        async with (
-            httpx.AsyncClient() as client,
-        ):
-            with (
-                async_httpx_client_ctx(client),
-                api_key_ctx(self.api_key),
-            ):
+        async with async_httpx_client_scope():
+            with api_key_ctx(self.api_key):
                 return await aemet_2_step_fetch(ticket_uri)
 
+    async def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        """
+        Single batch since everything is fetched in one request.
+        """
+        yield await self.timeseries(date_0, date_f, station_id)
+
 
 @dataclass(frozen=True, kw_only=True)
 class AemetWeatherDataFetcherSerial(AemetWeatherDataFetcherMixin):
@@ -170,14 +209,17 @@ class AemetWeatherDataFetcherSerial(AemetWeatherDataFetcherMixin):
     date_generator: Callable[[datetime, datetime], Iterable[datetime]]
 
     "Used to simply fetch the data from (presumably) aemet services"
-    fetch_function: Callable[[str], Awaitable[list[AemetWeatherPoint]]]
+    fetch_function: Callable[[str], Awaitable[Sequence[WeatherPoint]]]
 
     "Move the end of the day request few minutes before the start of the next one to avoid overlapping intervals"
     last_date_offset: timedelta = timedelta(minutes=10)
 
-    async def timeseries(
+    async def timeseries_stream(
         self, date_0: datetime, date_f: datetime, station_id: str
-    ) -> Sequence[AemetWeatherPoint]:
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        """
+        Yield every month as soon as it's fetched.
+        """
         # PARAMETER VALIDATION
         self._common_timeseries_param_validation(date_0, date_f, station_id)
 
@@ -194,16 +236,6 @@ class AemetWeatherDataFetcherSerial(AemetWeatherDataFetcherMixin):
         )
         uris_l = list(uris)
 
-        async def req_iterable():
-            async with httpx.AsyncClient() as client:
-                with (
-                    async_httpx_client_ctx(client),
-                    api_key_ctx(self.api_key),
-                ):
-                    for ticket_uri in uris_l:
-                        logger.debug("uri request", ticket_uri=ticket_uri)
-                        yield await self.fetch_function(ticket_uri)
-
         logger.info(
             "Starting serial request",
             n_requests=len(uris_l),
@@ -217,13 +249,16 @@ class AemetWeatherDataFetcherSerial(AemetWeatherDataFetcherMixin):
             ),
         )
 
-        # MUST DO THIS IN MEMORY SINCE ASYNC ITERABLE DON'T ALLOW FOR YIELD_FROM.
-        res_matrix = await asyncstdlib.list(req_iterable())
-        res_l = list(chain.from_iterable(res_matrix))
-
-        logger.info("Serial fetch complete", n_points=len(res_l))
+        n_points = 0
+        async with async_httpx_client_scope():
+            with api_key_ctx(self.api_key):
+                for ticket_uri in uris_l:
+                    logger.debug("uri request", ticket_uri=ticket_uri)
+                    res = await self.fetch_function(ticket_uri)
+                    n_points += len(res)
+                    yield res
 
-        return res_l
+        logger.info("Serial fetch complete", n_points=n_points)
 
 
 @dataclass(frozen=True, kw_only=True)
@@ -238,7 +273,7 @@ class AemetWeatherDataFetcherConcurrent(AemetWeatherDataFetcherMixin):
     date_generator: Callable[[datetime, datetime], Iterable[datetime]]
 
     "Used to simply fetch the data from (presumably) aemet services"
-    fetch_function: Callable[[str], Coroutine[None, None, Sequence[AemetWeatherPoint]]]
+    fetch_function: Callable[[str], Coroutine[None, None, Sequence[WeatherPoint]]]
 
     "Max number of concurrent requests"
     max_concurrent_requests: int = 10
@@ -246,9 +281,12 @@ class AemetWeatherDataFetcherConcurrent(AemetWeatherDataFetcherMixin):
     "Move the end of the day request few minutes before the start of the next one to avoid overlapping intervals"
     last_date_offset: timedelta = timedelta(minutes=10)
 
-    async def timeseries(
+    async def timeseries_stream(
         self, date_0: datetime, date_f: datetime, station_id: str
-    ) -> Sequence[AemetWeatherPoint]:
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        """
+        Yield months in order as soon as they are available.
+        """
         # PARAMETER VALIDATION
         self._common_timeseries_param_validation(date_0, date_f, station_id)
 
@@ -264,27 +302,197 @@ class AemetWeatherDataFetcherConcurrent(AemetWeatherDataFetcherMixin):
             repeat(station_metadata["station_id"]),
         )
 
-        coros = map(self.fetch_function, uris)
-        concurrency_rate = min(self.max_concurrent_requests, len(dates_0) - 1)
-        coros_chunks = grouper(coros, concurrency_rate)
-
-        # DIVIDED IN 2 FUNCTIONS FOR EASIER READIBILITY.
-        async def parallel_req():
-            async with (
-                httpx.AsyncClient() as client,
-            ):
-                with (
-                    async_httpx_client_ctx(client),
-                    api_key_ctx(self.api_key),
+        async with async_httpx_client_scope():
+            with api_key_ctx(self.api_key):
+                # SLIDING WINDOW: A SLOT IS REFILLED AS SOON AS ANY REQUEST FINISHES.
+                async for res in bounded_map(
+                    self.fetch_function, uris, self.max_concurrent_requests
                 ):
-                    for coros_chunk in coros_chunks:
-                        async with TaskGroup() as tg:
-                            tasks = list(map(tg.create_task, coros_chunk))
-                        for t in tasks:
-                            yield t.result()
+                    yield res
+
+    async def timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, Sequence[WeatherPoint]]:
+        """
+        Every (station, month) request shares the same sliding window and client.
+        """
+        # PARAMETER VALIDATION
+        stations = list(dict.fromkeys(stations))
+        for station_id in stations:
+            self._common_timeseries_param_validation(date_0, date_f, station_id)
+
+        dates_0 = list(self.date_generator(date_0, date_f))
+        dates_f = list(map(op.sub, dates_0[1:], repeat(self.last_date_offset)))
+
+        jobs = [
+            (
+                station_id,
+                self._params_to_uri(
+                    d0, df, self._get_station_metadata(station_id)["station_id"]
+                ),
+            )
+            for station_id in stations
+            for d0, df in zip(dates_0, dates_f)
+        ]
+
+        logger.info(
+            "Starting multi-station request",
+            n_stations=len(stations),
+            n_requests=len(jobs),
+            date_0=date_0,
+            date_f=date_f,
+        )
+
+        res: dict[str, list[WeatherPoint]] = {station_id: [] for station_id in stations}
+        async with async_httpx_client_scope():
+            with api_key_ctx(self.api_key):
+                batches = bounded_map(
+                    self.fetch_function,
+                    map(op.itemgetter(1), jobs),
+                    self.max_concurrent_requests,
+                )
+                async for (station_id, _), batch in asyncstdlib.zip(jobs, batches):
+                    res[station_id].extend(batch)
+
+        return res
+
 
-        # MUST DO THIS IN MEMORY SINCE ASYNC ITERABLE DON'T ALLOW FOR YIELD_FROM.
-        res_matrix = await asyncstdlib.list(parallel_req())
-        res_l = list(chain.from_iterable(res_matrix))
+@dataclass(frozen=True, kw_only=True)
+class AemetWeatherDataFetcherPipelined(AemetWeatherDataFetcherMixin):
+    """
+    Parallel requests for multiple-months with separate ticket and data stages.
+
+    Ticket requests are small and quota-bound. Data downloads are large and bandwidth-bound.
+    Each stage has its own concurrency limit so a slow download doesn't hold a ticket slot.
+
+    This implementation may include overfetching. Filter in data validation step
+    """
+
+    "Used to generate monthly dates. Very relevant for caching."
+    date_generator: Callable[[datetime, datetime], Iterable[datetime]]
+
+    "Ticket stage: ticket uri to ticket"
+    ticket_function: Callable[[str], Awaitable[AemetTicketResponse]] = (
+        aemet_fetch_ticket
+    )
+
+    "Data stage: data uri to points"
+    data_function: Callable[[str], Awaitable[Sequence[WeatherPoint]]] = aemet_fetch_data
 
-        return res_l
+    "Max number of ticket requests in flight"
+    max_concurrent_tickets: int = 4
+
+    "Max number of data downloads in flight"
+    max_concurrent_downloads: int = 8
+
+    "Months by ticket uri. Checked before the pipeline. No caching if None"
+    cache: MemoryCache[str, Sequence[WeatherPoint]] | None = None
+
+    "Months in flight by ticket uri. Concurrent requests of the same month share one ticket and download"
+    flights: SingleFlight[str, Sequence[WeatherPoint]] = field(
+        default_factory=SingleFlight, compare=False, repr=False
+    )
+
+    "Move the end of the day request few minutes before the start of the next one to avoid overlapping intervals"
+    last_date_offset: timedelta = timedelta(minutes=10)
+
+    async def _resolve_ticket(self, ticket_uri: str) -> tuple[str, str]:
+        ticket = await self.ticket_function(ticket_uri)
+        return ticket_uri, ticket["datos"]
+
+    async def _download(
+        self,
+        flights: Mapping[str, asyncio.Future[Sequence[WeatherPoint]]],
+        job: tuple[str, str],
+    ) -> Sequence[WeatherPoint]:
+        ticket_uri, data_uri = job
+        res = await self.data_function(data_uri)
+        # FOLLOWERS GET THE MONTH AS SOON AS IT IS DOWNLOADED, NOT WHEN THE LEADER CONSUMES IT.
+        if ticket_uri in flights:
+            flights[ticket_uri].set_result(res)
+        return res
+
+    async def _join(
+        self, ticket_uri: str, flight: Awaitable[Sequence[WeatherPoint]]
+    ) -> Sequence[WeatherPoint]:
+        try:
+            return await flight
+        except FetchAbandonedError:
+            # THE LEADING REQUEST WAS CLOSED BEFORE THIS MONTH. FETCHED HERE INSTEAD.
+            return await self._download({}, await self._resolve_ticket(ticket_uri))
+
+    async def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        """
+        Yield months in order as soon as they are available.
+
+        Months already in flight for a concurrent request are awaited instead of fetched again.
+        """
+        # PARAMETER VALIDATION
+        self._common_timeseries_param_validation(date_0, date_f, station_id)
+
+        dates_0 = list(self.date_generator(date_0, date_f))
+        dates_f = map(op.sub, dates_0[1:], repeat(self.last_date_offset))
+
+        station_metadata = self._get_station_metadata(station_id)
+
+        uris = list(
+            map(
+                self._params_to_uri,
+                dates_0,
+                dates_f,
+                repeat(station_metadata["station_id"]),
+            )
+        )
+
+        cached = [None if self.cache is None else self.cache.get(uri) for uri in uris]
+        missing_uris = [uri for uri, res in zip(uris, cached) if res is None]
+
+        joined = {
+            uri: flight
+            for uri in missing_uris
+            if (flight := self.flights.join(uri)) is not None
+        }
+        led = {uri: self.flights.lead(uri) for uri in missing_uris if uri not in joined}
+
+        logger.info(
+            "Starting pipelined request",
+            n_requests=len(led),
+            n_joined=len(joined),
+            n_cached=len(uris) - len(missing_uris),
+            date_0=date_0,
+            date_f=date_f,
+        )
+
+        try:
+            async with async_httpx_client_scope():
+                with api_key_ctx(self.api_key):
+                    fetched = pipeline_map(
+                        self._resolve_ticket,
+                        partial(self._download, led),
+                        list(led),
+                        self.max_concurrent_tickets,
+                        self.max_concurrent_downloads,
+                    )
+                    async with asyncstdlib.scoped_iter(fetched) as fetched_iter:
+                        for uri, res in zip(uris, cached):
+                            if uri in led:
+                                res = await anext(fetched_iter)
+                                if self.cache is not None:
+                                    self.cache.put(uri, res)
+                            elif uri in joined:
+                                res = await self._join(uri, joined[uri])
+                            yield res  # type: ignore
+        except Exception as e:
+            for flight in led.values():
+                if not flight.done():
+                    flight.set_exception(e)
+            raise
+        finally:
+            # ABANDONED BY THE CONSUMER (I.E. CLIENT DISCONNECTED).
+            for uri, flight in led.items():
+                if not flight.done():
+                    flight.set_exception(
+                        FetchAbandonedError(f"Fetch of {uri} abandoned")
+                    )
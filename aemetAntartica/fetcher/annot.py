@@ -2,8 +2,8 @@
 Purely declarative type definitions
 """
 
-from collections.abc import Sequence
-from typing import Protocol, TypedDict
+from collections.abc import AsyncIterator, Mapping, Sequence
+from typing import Literal, Protocol, TypedDict, runtime_checkable
 from datetime import datetime
 
 
@@ -45,13 +45,78 @@ class WeatherDataFetcher[T: WeatherPoint](Protocol):
         """
         ...
 
+    def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[Sequence[T]]:
+        """
+        Request station data to external API. Yield batches of points (usually a month) as soon as they arrive.
+        """
+        ...
+
+    async def timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, Sequence[T]]:
+        """
+        Request data of several stations at once. Points by station id.
+        """
+        ...
+
+
+"Aggregations that a fetcher may compute at the source"
+type SqlAggType = Literal["first", "last", "mean"]
+
+
+@runtime_checkable
+class AggregatingFetcher[T](Protocol):
+    """
+    Fetcher able to aggregate at the source (i.e. sql) without returning raw points
+    """
+
+    async def aggregate(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        agg: SqlAggType,
+        buckets: Sequence[datetime],
+    ) -> Sequence[T] | None:
+        """
+        One aggregated point per non empty bucket. Bucket i is [buckets[i], buckets[i + 1]) clipped to [date_0, date_f).
+
+        None if it can't be aggregated at the source. Python aggregation must be used instead.
+        """
+        ...
+
+
+@runtime_checkable
+class QuantileFetcher[T](Protocol):
+    """
+    Fetcher able to approximate quantiles at the source (i.e. merging cached sketches) without returning raw points
+    """
+
+    async def quantiles(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        q: float,
+        buckets: Sequence[datetime],
+    ) -> Sequence[T] | None:
+        """
+        Approximate q quantile of every numeric property per non empty bucket. Same buckets as AggregatingFetcher.
+
+        None if it can't be computed at the source. Python aggregation must be used instead.
+        """
+        ...
+
 
 class WeatherPoint(TypedDict):
     """
     Miniumum information for fetcher return.
     """
 
-    fhora: str
+    # ISO STRING AS RETURNED BY AEMET OR UTC DATETIME IF DECODED INTO A BATCH.
+    fhora: str | datetime
     temp: float
     pres: float
     vel: float
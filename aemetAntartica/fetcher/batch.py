@@ -0,0 +1,204 @@
+"""
+Compact columnar representation of fetched points.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from functools import cache
+from math import ceil, nan
+from operator import attrgetter, itemgetter
+from typing import Any, NamedTuple, overload
+
+import msgspec
+
+from .annot import WeatherPoint
+
+"Fields used downstream. Always decoded"
+PROJECTED_FIELDS = ("fhora", "temp", "pres", "vel")
+
+
+class PointRecord(NamedTuple):
+    "Point with attribute access. Same fields as the validated model"
+
+    fhora: datetime
+    temp: float
+    pres: float
+    vel: float
+
+
+@dataclass(frozen=True, slots=True)
+class WeatherPointBatch(Sequence[WeatherPoint]):
+    """
+    Columnar batch of points. Only projected fields (and optionally some extended ones) are kept.
+
+    Behaves as a read-only sequence of point dicts materialised on access. Fits anywhere a sequence of points does.
+    """
+
+    "Measurement dates as UTC POSIX timestamps in seconds"
+    fhora: array
+
+    "Temperature column (float64)"
+    temp: array
+
+    "Pressure column (float64)"
+    pres: array
+
+    "Wind speed column (float64)"
+    vel: array
+
+    "Extended field columns by name. Raw decoded values, None if missing"
+    extra: Mapping[str, Sequence[Any]] = field(default_factory=dict)
+
+    "Already validated (i.e. read from the sql cache). Consumers may skip validation"
+    trusted: bool = False
+
+    def __len__(self) -> int:
+        return len(self.fhora)
+
+    @overload
+    def __getitem__(self, ndx: int) -> WeatherPoint: ...
+
+    @overload
+    def __getitem__(self, ndx: slice) -> "WeatherPointBatch": ...
+
+    def __getitem__(self, ndx: int | slice) -> "WeatherPointBatch | WeatherPoint":
+        if isinstance(ndx, slice):
+            return WeatherPointBatch(
+                fhora=self.fhora[ndx],
+                temp=self.temp[ndx],
+                pres=self.pres[ndx],
+                vel=self.vel[ndx],
+                extra={k: v[ndx] for k, v in self.extra.items()},
+                trusted=self.trusted,
+            )
+
+        point = {
+            "fhora": datetime.fromtimestamp(self.fhora[ndx], UTC),
+            "temp": self.temp[ndx],
+            "pres": self.pres[ndx],
+            "vel": self.vel[ndx],
+        }
+        for k, v in self.extra.items():
+            point[k] = v[ndx]
+        return point  # type: ignore
+
+    @property
+    def nbytes(self) -> int:
+        "Approximate memory footprint"
+        columns = (self.fhora, self.temp, self.pres, self.vel)
+        return sum(c.itemsize * len(c) for c in columns) + sum(
+            8 * len(v) for v in self.extra.values()
+        )
+
+    @classmethod
+    def from_points(cls, points: Iterable[WeatherPoint]) -> "WeatherPointBatch":
+        "Build from point dicts. fhora may be either datetime or iso string"
+        return _rows_to_batch(list(points), ())
+
+    @classmethod
+    def concat(cls, batches: Iterable["WeatherPointBatch"]) -> "WeatherPointBatch":
+        "Single batch with the points of every batch in order. Extended fields are dropped"
+        batches = list(batches)
+        res = cls(
+            fhora=array("q"),
+            temp=array("d"),
+            pres=array("d"),
+            vel=array("d"),
+            trusted=all(b.trusted for b in batches),
+        )
+        for batch in batches:
+            res.fhora.extend(batch.fhora)
+            res.temp.extend(batch.temp)
+            res.pres.extend(batch.pres)
+            res.vel.extend(batch.vel)
+        return res
+
+    def between(self, date_0: datetime, date_f: datetime) -> "WeatherPointBatch":
+        "Points in [date_0, date_f). Points must be sorted by date (i.e. cache reads)"
+        ndx0 = bisect_left(self.fhora, ceil(date_0.timestamp()))
+        ndxf = bisect_left(self.fhora, ceil(date_f.timestamp()))
+        return self[ndx0:ndxf]
+
+    def records(self) -> list[PointRecord]:
+        "Projected fields as records with UTC datetimes. No dicts nor validation"
+        fhoras = [datetime.fromtimestamp(t, UTC) for t in self.fhora]
+        return list(map(PointRecord, fhoras, self.temp, self.pres, self.vel))
+
+
+class _ProjectedPoint(msgspec.Struct):
+    "Projected fields of an aemet point. The decoder skips every other field without materialising it"
+
+    fhora: str
+    temp: float | str | None = None
+    pres: float | str | None = None
+    vel: float | str | None = None
+
+
+@cache
+def _decoder(extra_fields: tuple[str, ...]) -> msgspec.json.Decoder:
+    "Typed projection decoder. Extended fields are kept as raw values"
+    if len(extra_fields) == 0:
+        return msgspec.json.Decoder(list[_ProjectedPoint])
+
+    extended = msgspec.defstruct(
+        "_ExtendedPoint",
+        [(k, Any, None) for k in extra_fields],
+        bases=(_ProjectedPoint,),
+    )
+    return msgspec.json.Decoder(list[extended])
+
+
+def _to_float(v: Any) -> float:
+    "Numeric value. Numeric strings are parsed (as pydantic did), null and non numeric values are nan"
+    if isinstance(v, float):
+        return v
+    if v is None:
+        return nan
+    try:
+        return float(v)
+    except ValueError:
+        return nan
+
+
+def _to_timestamp(fhora: datetime | str) -> int:
+    if isinstance(fhora, str):
+        fhora = datetime.fromisoformat(fhora)
+    return int(fhora.timestamp())
+
+
+def _float_column(rows: Sequence[Mapping], key: str) -> array:
+    return array("d", (_to_float(r.get(key)) for r in rows))
+
+
+def _rows_to_batch(
+    rows: Sequence[Mapping], extra_fields: Sequence[str]
+) -> WeatherPointBatch:
+    return WeatherPointBatch(
+        fhora=array("q", map(_to_timestamp, map(itemgetter("fhora"), rows))),
+        temp=_float_column(rows, "temp"),
+        pres=_float_column(rows, "pres"),
+        vel=_float_column(rows, "vel"),
+        extra={k: [r.get(k) for r in rows] for k in extra_fields},
+    )
+
+
+def decode_aemet_points(
+    content: str | bytes, extra_fields: Sequence[str] = ()
+) -> WeatherPointBatch:
+    """
+    Decode aemet data payload into a columnar batch.
+
+    Only projected fields and requested extra_fields are decoded (typed msgspec projection), the rest of every point
+    is skipped. Numeric strings are parsed. Missing, null or non numeric values are decoded as nan.
+    """
+    points = _decoder(tuple(extra_fields)).decode(content)
+    return WeatherPointBatch(
+        fhora=array("q", map(_to_timestamp, map(attrgetter("fhora"), points))),
+        temp=array("d", map(_to_float, map(attrgetter("temp"), points))),
+        pres=array("d", map(_to_float, map(attrgetter("pres"), points))),
+        vel=array("d", map(_to_float, map(attrgetter("vel"), points))),
+        extra={k: list(map(attrgetter(k), points)) for k in extra_fields},
+    )
@@ -2,11 +2,15 @@
 Common variables injected throught context.
 """
 
+from contextlib import asynccontextmanager
 from contextvars import ContextVar
 from aemetAntartica.util.ctxvar import context_manager_factory
 
 import httpx
 
+from .deadline import LatencyHedger, TimeoutPolicy
+from .rate_limit import AdaptiveRateLimiter, RetryPolicy
+
 
 "Injectable httpx client"
 async_httpx_client_var: ContextVar[httpx.AsyncClient] = ContextVar(
@@ -21,3 +25,71 @@ api_key_var: ContextVar[str] = ContextVar("httpx_client_context")
 
 "Safe api key context setter"
 api_key_ctx = context_manager_factory(api_key_var)
+
+"Injectable process-wide rate limiter. No throttling if None"
+rate_limiter_var: ContextVar[AdaptiveRateLimiter | None] = ContextVar(
+    "rate_limiter_context", default=None
+)
+
+"Safe rate limiter context setter"
+rate_limiter_ctx = context_manager_factory(rate_limiter_var)
+
+"Injectable retry policy. No retries if None"
+retry_policy_var: ContextVar[RetryPolicy | None] = ContextVar(
+    "retry_policy_context", default=None
+)
+
+"Safe retry policy context setter"
+retry_policy_ctx = context_manager_factory(retry_policy_var)
+
+
+def current_retry_policy() -> RetryPolicy:
+    "Injected retry policy. No retries if not injected"
+    policy = retry_policy_var.get()
+    return RetryPolicy(max_retries=0) if policy is None else policy
+
+
+"Injectable per call timeouts. Defaults apply if None"
+timeout_policy_var: ContextVar[TimeoutPolicy | None] = ContextVar(
+    "timeout_policy_context", default=None
+)
+
+"Safe timeout policy context setter"
+timeout_policy_ctx = context_manager_factory(timeout_policy_var)
+
+
+def current_timeout_policy() -> TimeoutPolicy:
+    "Injected per call timeouts. Default budgets if not injected"
+    policy = timeout_policy_var.get()
+    return TimeoutPolicy() if policy is None else policy
+
+
+"Injectable absolute deadline (monotonic clock) of the current api request. No deadline if None"
+deadline_var: ContextVar[float | None] = ContextVar("deadline_context", default=None)
+
+"Safe deadline context setter"
+deadline_ctx = context_manager_factory(deadline_var)
+
+"Injectable hedger for data downloads. No hedging if None"
+hedger_var: ContextVar[LatencyHedger | None] = ContextVar(
+    "hedger_context", default=None
+)
+
+"Safe hedger context setter"
+hedger_ctx = context_manager_factory(hedger_var)
+
+
+@asynccontextmanager
+async def async_httpx_client_scope():
+    """
+    Reuse the injected httpx client if there is one (i.e. the app-wide pool).
+
+    Otherwise open a short-lived client for the duration of the scope.
+    """
+    if async_httpx_client_var.get(None) is not None:
+        yield
+        return
+
+    async with httpx.AsyncClient() as client:
+        with async_httpx_client_ctx(client):
+            yield
@@ -0,0 +1,132 @@
+"""
+Deadlines, timeouts and hedging for upstream requests.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+import structlog
+
+from .exceptions import DeadlineExceededError
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class TimeoutPolicy:
+    """
+    Time budgets in seconds. None to wait forever.
+    """
+
+    "Budget of a whole api request. Shared by every upstream call it makes"
+    request: float | None = 120.0
+
+    "Budget of each ticket call"
+    ticket: float | None = 15.0
+
+    "Budget of each data download"
+    data: float | None = 60.0
+
+    def deadline(self, clock: Callable[[], float] = time.monotonic) -> float | None:
+        "Absolute request deadline starting now"
+        if self.request is None:
+            return None
+        return clock() + self.request
+
+
+def remaining_timeout(
+    deadline: float | None,
+    timeout: float | None,
+    clock: Callable[[], float] = time.monotonic,
+) -> float | None:
+    """
+    Effective timeout of a call: timeout or whatever is left until the deadline, the lowest.
+
+    Raises DeadlineExceededError if the deadline has already passed.
+    """
+    if deadline is None:
+        return timeout
+
+    remaining = deadline - clock()
+    if remaining <= 0:
+        raise DeadlineExceededError("Request deadline exceeded")
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+
+@dataclass
+class LatencyHedger:
+    """
+    Hedge slow calls. Once a call takes longer than a percentile of recent latencies an identical call is started.
+
+    The first call to succeed wins and the other one is cancelled. Calls are not hedged until min_samples latencies are known.
+    Hedged calls count against upstream quota. Keep percentile high.
+    """
+
+    "Latency percentile (0, 1] that triggers the hedged call"
+    percentile: float = 0.95
+
+    "Latencies observed before hedging starts"
+    min_samples: int = 20
+
+    "Number of recent latencies kept"
+    window: int = 200
+
+    "Monotonic clock in seconds. Injectable for testing"
+    clock: Callable[[], float] = time.monotonic
+
+    _samples: deque[float] = field(init=False)
+
+    def __post_init__(self):
+        if not 0 < self.percentile <= 1:
+            raise ValueError(f"Percentile must be in (0, 1]: {self.percentile}")
+        self._samples = deque(maxlen=self.window)
+
+    def observe(self, latency: float):
+        "Record the latency of a successful call"
+        self._samples.append(latency)
+
+    def hedge_delay(self) -> float | None:
+        "Seconds to wait before hedging. None if there are not enough samples"
+        if len(self._samples) < self.min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[math.ceil(self.percentile * len(samples)) - 1]
+
+    async def run[T](self, f: Callable[[], Awaitable[T]]) -> T:
+        """
+        Call f. Call it once more if it's slower than the hedge delay. Return the first success.
+
+        If every call fails the first error is raised.
+        """
+        delay = self.hedge_delay()
+        t0 = self.clock()
+        tasks = [asyncio.ensure_future(f())]
+
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+                if not tasks[0].done():
+                    logger.debug("Hedging slow call", delay=delay)
+                    tasks.append(asyncio.ensure_future(f()))
+
+            while True:
+                for task in tasks:
+                    if task.done() and task.exception() is None:
+                        self.observe(self.clock() - t0)
+                        return task.result()
+
+                pending = [task for task in tasks if not task.done()]
+                if len(pending) == 0:
+                    raise tasks[0].exception()  # type: ignore
+
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -17,3 +17,32 @@ class EndDateValueError(ValueError):
 
 class DateRangeValueError(ValueError):
     "Both d0 and df are to blame. i.e. when df < d0"
+
+
+class AemetResponseError(ValueError):
+    "Upstream answered with a non OK status. Either in http status or in ticket content."
+
+    def __init__(
+        self,
+        message: str,
+        uri: str,
+        status_code: int,
+        retry_after: float | None = None,
+    ):
+        super().__init__(message, uri, status_code)
+        self.uri = uri
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        "Throttling and server errors may succeed later"
+        return self.status_code == 429 or self.status_code >= 500
+
+
+class DeadlineExceededError(TimeoutError):
+    "The time budget of the api request is exhausted. Not retried."
+
+
+class FetchAbandonedError(RuntimeError):
+    "A coalesced fetch was abandoned by the request leading it (i.e. client disconnected). Followers fetch it again."
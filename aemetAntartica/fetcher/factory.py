@@ -3,21 +3,38 @@ Functions to create instance
 """
 
 import json
+from collections.abc import Awaitable, Callable, Sequence
 from os import environ
+from pathlib import Path
 
+import httpx
 import structlog
 
+from aemetAntartica.model.factory import result_timezone_os
 from aemetAntartica.util.datetime import date_range_30, monthly_date_range
 
 from .aemet import (
     AemetWeatherDataFetcherConcurrent,
     AemetWeatherDataFetcherNaive,
+    AemetWeatherDataFetcherPipelined,
     AemetWeatherDataFetcherSerial,
 )
 from .annot import WeatherDataFetcher, WeatherPoint
-from .fetch_functions import aemet_2_step_fetch, cached_aemet_2_step_fetch
+from .batch import WeatherPointBatch
+from .deadline import LatencyHedger, TimeoutPolicy
+from .fetch_functions import coalesced_aemet_2_step_fetch
+from .memory_cache import (
+    MemoryCache,
+    MemoryCachedFetch,
+    points_sizeof,
+    ticket_uri_ttl_factory,
+)
+from .rate_limit import AdaptiveRateLimiter, RetryPolicy
 from .sql_cache import sqlite_cache_fetcher_proxy_factory
+from .sql_retention import RetentionPolicy
 from .static import named_station_metadata
+from .transport import HostLimitedTransport
+from .warmup import CacheWarmer
 
 logger = structlog.get_logger()
 
@@ -28,11 +45,22 @@ async def gen_aemet_fetcher_env_var() -> WeatherDataFetcher[WeatherPoint]:
 
     Environment Variables:
     - AEMET_API_KEY: aemet open data api key. (required)
-    - AEMET_FETCHER_TYPE: serial, concurrent or naive (default: serial)
+    - AEMET_FETCHER_TYPE: serial, concurrent, pipelined or naive (default: serial)
+    - AEMET_MAX_CONCURRENT_TICKETS: ticket requests in flight for pipelined fetcher (default: 4)
+    - AEMET_MAX_CONCURRENT_DOWNLOADS: data downloads in flight for pipelined fetcher (default: 8)
     - AEMET_CACHED: none or memory (default: memory)
+    - AEMET_CACHE_MAX_BYTES: memory cache budget in bytes (default: 268435456)
+    - AEMET_CACHE_OPEN_TTL: seconds the still open month is kept in memory cache (default: 600)
     - AEMET_DATE_GEN: month or naive (default: month)
     - AEMET_STATIONS_METADATA_JSON: path to the stations metadata file (default data if none)
     - AEMET_SQLITE_URL: including sqlite cache if informed. (default data if none)
+    - AEMET_SQLITE_READERS: persistent sqlite reader connections (default: 4)
+    - AEMET_SQLITE_MAX_ROWS: max cached points. none for unlimited (default: none)
+    - AEMET_SQLITE_MAX_STATION_ROWS: max cached points per station. none for unlimited (default: none)
+    - AEMET_SQLITE_MAX_BYTES: max used bytes of the sqlite file. none for unlimited (default: none)
+    - AEMET_SQLITE_MAINTENANCE_INTERVAL: seconds between retention and compaction passes. none to disable (default: 3600)
+    - AEMET_SQLITE_WRITE_QUEUE: max pending background writes. 0 for synchronous writes (default: 16)
+    - AEMET_PARQUET_DIR: including parquet cache in this directory if informed. Requires pyarrow. (default none)
     """
 
     # TODO: EXPAND THE ENVIRONMENT VARIABLES FOR ALL OPTIONAL ARGUMENTS.
@@ -40,22 +68,21 @@ async def gen_aemet_fetcher_env_var() -> WeatherDataFetcher[WeatherPoint]:
 
     api_key = environ["AEMET_API_KEY"]
     fetcher_type = environ.get("AEMET_FETCHER_TYPE", "SERIAL").upper()
-    cached_env = environ.get("AEMET_CACHED", "MEMORY").upper()
     date_gen_env = environ.get("AEMET_DATE_GEN", "MONTH").upper()
     meta_json_path = environ.get("AEMET_STATIONS_METADATA_JSON")
     sqlite_uri = environ.get("AEMET_SQLITE_URL")
+    parquet_dir = environ.get("AEMET_PARQUET_DIR")
+
+    if sqlite_uri is not None and parquet_dir is not None:
+        raise ValueError("AEMET_SQLITE_URL and AEMET_PARQUET_DIR are exclusive")
 
     if meta_json_path is not None:
         station_metadata = json.loads(meta_json_path)
     else:
         station_metadata = named_station_metadata
 
-    if cached_env == "MEMORY":
-        fetch_f = cached_aemet_2_step_fetch
-    elif cached_env == "NONE":
-        fetch_f = aemet_2_step_fetch
-    else:
-        raise ValueError(f"value fop AEMET_CACHED {cached_env} not supported")
+    memory_cache = cached_gen_memory_cache_env_var()
+    fetch_f = gen_fetch_function_env_var()
 
     if date_gen_env == "MONTH":
         date_gen = monthly_date_range
@@ -78,6 +105,19 @@ async def gen_aemet_fetcher_env_var() -> WeatherDataFetcher[WeatherPoint]:
             fetch_function=fetch_f,
             api_key=api_key,
         )
+    elif fetcher_type == "PIPELINED":
+        fetcher = AemetWeatherDataFetcherPipelined(
+            stations_metadata=station_metadata,
+            date_generator=date_gen,
+            max_concurrent_tickets=int(
+                environ.get("AEMET_MAX_CONCURRENT_TICKETS", "4")
+            ),
+            max_concurrent_downloads=int(
+                environ.get("AEMET_MAX_CONCURRENT_DOWNLOADS", "8")
+            ),
+            cache=memory_cache,
+            api_key=api_key,
+        )
     elif fetcher_type == "NAIVE":
         fetcher = AemetWeatherDataFetcherNaive(
             stations_metadata=station_metadata,
@@ -89,22 +129,193 @@ async def gen_aemet_fetcher_env_var() -> WeatherDataFetcher[WeatherPoint]:
     logger.debug(
         "Creating fetcher with environment configuration",
         fetcher_type=fetcher_type,
-        cached_env=cached_env,
+        memory_cached=memory_cache is not None,
         date_gen_env=date_gen_env,
         meta_json_path=meta_json_path,
         sqlite_uri=sqlite_uri,
+        parquet_dir=parquet_dir,
     )
 
     if sqlite_uri is not None:
         return await sqlite_cache_fetcher_proxy_factory(
             fetcher=fetcher,
             sqlite_uri=sqlite_uri,
+            n_readers=int(environ.get("AEMET_SQLITE_READERS", "4")),
+            retention=RetentionPolicy(
+                max_rows=_optional_int_env_var("AEMET_SQLITE_MAX_ROWS", "none"),
+                max_station_rows=_optional_int_env_var(
+                    "AEMET_SQLITE_MAX_STATION_ROWS", "none"
+                ),
+                max_bytes=_optional_int_env_var("AEMET_SQLITE_MAX_BYTES", "none"),
+            ),
+            maintenance_interval=_optional_float_env_var(
+                "AEMET_SQLITE_MAINTENANCE_INTERVAL", "3600"
+            ),
+            write_queue_size=int(environ.get("AEMET_SQLITE_WRITE_QUEUE", "16")),
+            # ROLLUPS IN THE BUCKETS OF THE AGGREGATIONS.
+            rollup_timezone=result_timezone_os(),
         )
 
+    if parquet_dir is not None:
+        # PYARROW IS OPTIONAL (SCI GROUP). ONLY IMPORTED IF REQUESTED.
+        from .parquet_cache import parquet_cache_fetcher_proxy_factory
+
+        return parquet_cache_fetcher_proxy_factory(fetcher=fetcher, root=parquet_dir)
+
     return fetcher
 
 
+def gen_fetch_function_env_var() -> Callable[[str], Awaitable[WeatherPointBatch]]:
+    """
+    Return the ticket uri fetch function of the aemet fetchers. Cached in the process-wide memory cache unless disabled.
+
+    Environment Variables: see gen_memory_cache_env_var
+    """
+    memory_cache = cached_gen_memory_cache_env_var()
+    if memory_cache is None:
+        return coalesced_aemet_2_step_fetch
+    return MemoryCachedFetch(
+        fetch_function=coalesced_aemet_2_step_fetch,
+        cache=memory_cache,
+    )
+
+
+def gen_memory_cache_env_var() -> MemoryCache[str, Sequence[WeatherPoint]] | None:
+    """
+    Return the memory cache of fetched months based on environment variables.
+
+    Environment Variables:
+    - AEMET_CACHED: none or memory (default: memory)
+    - AEMET_CACHE_MAX_BYTES: memory cache budget in bytes (default: 268435456)
+    - AEMET_CACHE_OPEN_TTL: seconds the still open month is kept in memory cache (default: 600)
+    """
+    cached_env = environ.get("AEMET_CACHED", "MEMORY").upper()
+
+    if cached_env == "NONE":
+        return None
+    if cached_env != "MEMORY":
+        raise ValueError(f"value fop AEMET_CACHED {cached_env} not supported")
+
+    return MemoryCache(
+        max_bytes=int(environ.get("AEMET_CACHE_MAX_BYTES", "268435456")),
+        sizeof=points_sizeof,
+        ttl=ticket_uri_ttl_factory(
+            open_ttl=float(environ.get("AEMET_CACHE_OPEN_TTL", "600"))
+        ),
+    )
+
+
+def gen_httpx_client_env_var() -> httpx.AsyncClient:
+    """
+    Return a long-lived pooled httpx client based on environment variables.
+
+    Meant to be owned by the app lifespan and shared by every request.
+
+    Environment Variables:
+    - AEMET_HTTP_MAX_CONNECTIONS: max number of open connections in the pool (default: 20)
+    - AEMET_HTTP_MAX_KEEPALIVE: max number of idle keep-alive connections (default: 10)
+    - AEMET_HTTP_KEEPALIVE_EXPIRY: seconds an idle connection is kept open (default: 30)
+    - AEMET_HTTP_MAX_PER_HOST: max requests in flight per host. Unlimited if none (default: none)
+    - AEMET_HTTP2: true or false. Requires h2 (poetry install --with http2) (default: false)
+    """
+
+    max_connections = int(environ.get("AEMET_HTTP_MAX_CONNECTIONS", "20"))
+    max_keepalive = int(environ.get("AEMET_HTTP_MAX_KEEPALIVE", "10"))
+    keepalive_expiry = float(environ.get("AEMET_HTTP_KEEPALIVE_EXPIRY", "30"))
+    max_per_host_env = environ.get("AEMET_HTTP_MAX_PER_HOST")
+    http2_env = environ.get("AEMET_HTTP2", "FALSE").upper()
+
+    if http2_env not in ("TRUE", "FALSE"):
+        raise ValueError(f"value for AEMET_HTTP2 {http2_env} not supported")
+    http2 = http2_env == "TRUE"
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+    transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(
+        limits=limits, http2=http2
+    )
+    if max_per_host_env is not None:
+        transport = HostLimitedTransport(transport, int(max_per_host_env))
+
+    logger.debug(
+        "Creating pooled http client with environment configuration",
+        max_connections=max_connections,
+        max_keepalive=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+        max_per_host=max_per_host_env,
+        http2=http2,
+    )
+
+    return httpx.AsyncClient(transport=transport)
+
+
+def gen_rate_limiter_env_var() -> AdaptiveRateLimiter | None:
+    """
+    Return the process-wide upstream rate limiter based on environment variables.
+
+    Environment Variables:
+    - AEMET_RATE_LIMIT: initial requests per second. none to disable throttling (default: 2)
+    - AEMET_RATE_LIMIT_BURST: requests that may be sent back to back (default: 5)
+    - AEMET_RATE_LIMIT_MIN: lower bound of the adaptive rate (default: 0.1)
+    - AEMET_RATE_LIMIT_MAX: upper bound of the adaptive rate (default: 10)
+    """
+    rate_env = environ.get("AEMET_RATE_LIMIT", "2")
+
+    if rate_env.upper() == "NONE":
+        logger.debug("Upstream throttling disabled")
+        return None
+
+    rate_limiter = AdaptiveRateLimiter(
+        rate=float(rate_env),
+        burst=int(environ.get("AEMET_RATE_LIMIT_BURST", "5")),
+        min_rate=float(environ.get("AEMET_RATE_LIMIT_MIN", "0.1")),
+        max_rate=float(environ.get("AEMET_RATE_LIMIT_MAX", "10")),
+    )
+
+    logger.debug(
+        "Creating rate limiter with environment configuration",
+        rate=rate_limiter.rate,
+        burst=rate_limiter.burst,
+        min_rate=rate_limiter.min_rate,
+        max_rate=rate_limiter.max_rate,
+    )
+
+    return rate_limiter
+
+
+def gen_retry_policy_env_var() -> RetryPolicy:
+    """
+    Return upstream retry policy based on environment variables.
+
+    Environment Variables:
+    - AEMET_MAX_RETRIES: retries on throttling, server or transport errors (default: 3)
+    - AEMET_RETRY_BASE_DELAY: backoff upper bound of the first retry in seconds (default: 0.5)
+    - AEMET_RETRY_MAX_DELAY: backoff upper bound in seconds (default: 30)
+    """
+    return RetryPolicy(
+        max_retries=int(environ.get("AEMET_MAX_RETRIES", "3")),
+        base_delay=float(environ.get("AEMET_RETRY_BASE_DELAY", "0.5")),
+        max_delay=float(environ.get("AEMET_RETRY_MAX_DELAY", "30")),
+    )
+
+
 __fetcher = None
+__memory_cache = None
+__memory_cache_created = False
+
+
+def cached_gen_memory_cache_env_var() -> (
+    MemoryCache[str, Sequence[WeatherPoint]] | None
+):
+    "Process-wide memory cache. Shared by the cached fetcher and the stats route"
+    global __memory_cache, __memory_cache_created
+    if not __memory_cache_created:
+        __memory_cache = gen_memory_cache_env_var()
+        __memory_cache_created = True
+    return __memory_cache
 
 
 async def cached_gen_aemet_fetcher_env_var():
@@ -112,3 +323,99 @@ async def cached_gen_aemet_fetcher_env_var():
     if __fetcher is None:
         __fetcher = await gen_aemet_fetcher_env_var()
     return __fetcher
+
+
+async def close_cached_aemet_fetcher():
+    "Release resources held by the cached fetcher (i.e. sqlite connections) if any"
+    global __fetcher, __memory_cache, __memory_cache_created
+    fetcher, __fetcher = __fetcher, None
+    __memory_cache, __memory_cache_created = None, False
+    aclose = getattr(fetcher, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+def _optional_float_env_var(name: str, default: str) -> float | None:
+    "Float environment variable. none for None"
+    value = environ.get(name, default)
+    return None if value.upper() == "NONE" else float(value)
+
+
+def _optional_int_env_var(name: str, default: str) -> int | None:
+    "Integer environment variable. none for None"
+    value = environ.get(name, default)
+    return None if value.upper() == "NONE" else int(value)
+
+
+def gen_timeout_policy_env_var() -> TimeoutPolicy:
+    """
+    Return upstream time budgets based on environment variables.
+
+    Environment Variables:
+    - AEMET_REQUEST_TIMEOUT: seconds budget of each aggregation request. none to disable (default: 120)
+    - AEMET_TICKET_TIMEOUT: seconds budget of each ticket call. none to disable (default: 15)
+    - AEMET_DATA_TIMEOUT: seconds budget of each data download. none to disable (default: 60)
+    """
+    return TimeoutPolicy(
+        request=_optional_float_env_var("AEMET_REQUEST_TIMEOUT", "120"),
+        ticket=_optional_float_env_var("AEMET_TICKET_TIMEOUT", "15"),
+        data=_optional_float_env_var("AEMET_DATA_TIMEOUT", "60"),
+    )
+
+
+def gen_hedger_env_var() -> LatencyHedger | None:
+    """
+    Return the process-wide data download hedger based on environment variables.
+
+    Environment Variables:
+    - AEMET_HEDGE_PERCENTILE: latency percentile (0, 1] that triggers a hedged download. none to disable (default: none)
+    - AEMET_HEDGE_MIN_SAMPLES: downloads observed before hedging starts (default: 20)
+    """
+    percentile = _optional_float_env_var("AEMET_HEDGE_PERCENTILE", "none")
+
+    if percentile is None:
+        logger.debug("Download hedging disabled")
+        return None
+
+    return LatencyHedger(
+        percentile=percentile,
+        min_samples=int(environ.get("AEMET_HEDGE_MIN_SAMPLES", "20")),
+    )
+
+
+async def gen_cache_warmer_env_var() -> CacheWarmer | None:
+    """
+    Return the background cache warmer of the cached fetcher based on environment variables.
+
+    Environment Variables:
+    - AEMET_WARMUP: true or false. Warm up the cache with the history of every station on startup. Requires
+      AEMET_SQLITE_URL or AEMET_PARQUET_DIR (default: false)
+    - AEMET_WARMUP_INTERVAL: seconds between consecutive month fetches (default: 5)
+    - AEMET_WARMUP_STATE: json file of completed months. Resumes from it after restart. Not resumable if none (default: none)
+    - AEMET_WARMUP_RETRIES: retry rounds of failed months, with exponential backoff between rounds (default: 3)
+    """
+    warmup_env = environ.get("AEMET_WARMUP", "FALSE").upper()
+
+    if warmup_env not in ("TRUE", "FALSE"):
+        raise ValueError(f"value for AEMET_WARMUP {warmup_env} not supported")
+    if warmup_env == "FALSE":
+        logger.debug("Cache warm-up disabled")
+        return None
+
+    # WITHOUT A PERSISTENT TIER THE WHOLE HISTORY WOULD BE FETCHED AND DROPPED.
+    if "AEMET_SQLITE_URL" not in environ and "AEMET_PARQUET_DIR" not in environ:
+        raise ValueError(
+            "AEMET_WARMUP requires a persistent cache: AEMET_SQLITE_URL or AEMET_PARQUET_DIR"
+        )
+
+    state_path = environ.get("AEMET_WARMUP_STATE", "none")
+    return CacheWarmer(
+        fetcher=await cached_gen_aemet_fetcher_env_var(),
+        interval=float(environ.get("AEMET_WARMUP_INTERVAL", "5")),
+        state_path=None if state_path.upper() == "NONE" else Path(state_path),
+        retry_policy=RetryPolicy(
+            max_retries=int(environ.get("AEMET_WARMUP_RETRIES", "3")),
+            base_delay=60,
+            max_delay=900,
+        ),
+    )
@@ -2,61 +2,188 @@
 Pure functions to be used by different fetcher service implementations
 """
 
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from contextlib import asynccontextmanager
+from functools import partial
+
 import httpx
+import structlog
 
-from .annot import AemetTicketResponse, AemetWeatherPoint
-from .context import async_httpx_client_var, api_key_var
-from asyncstdlib import lru_cache
+from aemetAntartica.util.asyncio import single_flight
 
+from .annot import AemetTicketResponse
+from .batch import WeatherPointBatch, decode_aemet_points
+from .context import (
+    api_key_var,
+    async_httpx_client_var,
+    current_retry_policy,
+    current_timeout_policy,
+    deadline_var,
+    hedger_var,
+    rate_limiter_var,
+)
+from .deadline import remaining_timeout
+from .exceptions import AemetResponseError, DeadlineExceededError
+from .rate_limit import parse_retry_after
 
-async def aemet_fetch_ticket(ticket_uri: str) -> AemetTicketResponse:
+logger = structlog.get_logger(__name__)
+
+
+@asynccontextmanager
+async def upstream_timeout(
+    uri: str, timeout: float | None = None
+) -> AsyncIterator[None]:
     """
-    Fetch the ticket for antartica data.
+    Bound an upstream call by timeout and by the injected request deadline, whatever comes first.
+
+    Raises DeadlineExceededError once the deadline is exhausted. TimeoutError otherwise.
+    """
+    deadline = deadline_var.get()
+    try:
+        async with asyncio.timeout(remaining_timeout(deadline, timeout)):
+            yield
+    except TimeoutError as e:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceededError("Request deadline exceeded", uri) from e
+        raise
+
+
+async def with_retries[T](f: Callable[[str], Awaitable[T]], uri: str) -> T:
+    """
+    Call f with the injected retry policy. Only throttling, server, transport and timeout errors are retried.
+
+    Retries that can't start before the request deadline are not attempted.
+    """
+    retry_policy = current_retry_policy()
+    attempt = 0
+    while True:
+        try:
+            return await f(uri)
+        except DeadlineExceededError:
+            raise
+        except AemetResponseError as e:
+            if not e.retryable:
+                raise
+            error, retry_after = e, e.retry_after
+        except (httpx.TransportError, TimeoutError) as e:
+            error, retry_after = e, None
+
+        if attempt >= retry_policy.max_retries:
+            raise error
+
+        delay = retry_policy.delay(attempt, retry_after)
+        remaining = remaining_timeout(deadline_var.get(), None)
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceededError("Request deadline exceeded", uri) from error
+
+        logger.warning(
+            "Retrying aemet request",
+            uri=uri,
+            attempt=attempt + 1,
+            delay=delay,
+            error=repr(error),
+        )
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def aemet_get(uri: str, timeout: float | None = None) -> httpx.Response:
+    """
+    Throttled GET request to aemet. Raises AemetResponseError on non OK status.
+
+    The call (excluding throttling) is bounded by timeout. Both are bounded by the request deadline.
     """
     client = async_httpx_client_var.get()
     api_key = api_key_var.get()
+    rate_limiter = rate_limiter_var.get()
+
+    if rate_limiter is not None:
+        async with upstream_timeout(uri):
+            await rate_limiter.acquire()
+
     headers = {"api_key": api_key}
-    ticketReq = await client.get(ticket_uri, headers=headers)
+    async with upstream_timeout(uri, timeout):
+        res = await client.get(uri, headers=headers)
+
+    if res.status_code == httpx.codes.TOO_MANY_REQUESTS:
+        retry_after = parse_retry_after(res.headers.get("Retry-After"))
+        if rate_limiter is not None:
+            rate_limiter.on_throttle(retry_after)
+        raise AemetResponseError(
+            "Aemet request throttled", uri, res.status_code, retry_after
+        )
+
+    if res.status_code != httpx.codes.OK:
+        raise AemetResponseError("Aemet request non OK response", uri, res.status_code)
 
-    if ticketReq.status_code != httpx.codes.OK:
-        raise ValueError("Aemet ticket request non OK response", ticket_uri, ticketReq)
+    if rate_limiter is not None:
+        rate_limiter.on_success()
+
+    return res
+
+
+async def _aemet_fetch_ticket(ticket_uri: str) -> AemetTicketResponse:
+    ticketReq = await aemet_get(ticket_uri, current_timeout_policy().ticket)
     ticketJson: AemetTicketResponse = ticketReq.json()
+
+    # QUOTA ERRORS MAY ALSO COME IN THE CONTENT OF AN HTTP OK RESPONSE.
+    if ticketJson["estado"] == httpx.codes.TOO_MANY_REQUESTS:
+        rate_limiter = rate_limiter_var.get()
+        if rate_limiter is not None:
+            rate_limiter.on_throttle()
+
     if ticketJson["estado"] != 200:
-        raise ValueError(
+        raise AemetResponseError(
             "Aemet ticket content non OK status",
             ticket_uri,
-            ticketReq,
-            ticketJson,
+            ticketJson["estado"],
         )
 
     return ticketJson
 
 
-async def aemet_fetch_data(data_uri: str) -> list[AemetWeatherPoint]:
+async def aemet_fetch_ticket(ticket_uri: str) -> AemetTicketResponse:
     """
-    Fetch data given the uri in a ticket.
+    Fetch the ticket for antartica data.
     """
-    client = async_httpx_client_var.get()
-    api_key = api_key_var.get()
+    return await with_retries(_aemet_fetch_ticket, ticket_uri)
 
-    headers = {"api_key": api_key}
-    dataReq = await client.get(data_uri, headers=headers)
-    if dataReq.status_code != httpx.codes.OK:
-        raise ValueError("Aemet data request non OK response", data_uri, dataReq)
-    # IMPLICIT TYPE CASTING...
-    return dataReq.json()
+
+async def _aemet_fetch_data(
+    data_uri: str, extra_fields: Sequence[str] = ()
+) -> WeatherPointBatch:
+    get = partial(aemet_get, data_uri, current_timeout_policy().data)
+    hedger = hedger_var.get()
+    dataReq = await (get() if hedger is None else hedger.run(get))
+    # AEMET DECLARES THE PAYLOAD CHARSET (ISO-8859-15). LET HTTPX DECODE IT.
+    return decode_aemet_points(dataReq.text, extra_fields)
+
+
+async def aemet_fetch_data(
+    data_uri: str, extra_fields: Sequence[str] = ()
+) -> WeatherPointBatch:
+    """
+    Fetch data given the uri in a ticket. Only projected fields (and extra_fields) are decoded.
+    """
+    return await with_retries(
+        partial(_aemet_fetch_data, extra_fields=extra_fields), data_uri
+    )
 
 
-async def aemet_2_step_fetch(ticket_uri: str) -> list[AemetWeatherPoint]:
+async def aemet_2_step_fetch(
+    ticket_uri: str, extra_fields: Sequence[str] = ()
+) -> WeatherPointBatch:
     """
     Wrapper around ticket and data fetching.
     """
 
     ticket = await aemet_fetch_ticket(ticket_uri)
-    return await aemet_fetch_data(ticket["datos"])
+    return await aemet_fetch_data(ticket["datos"], extra_fields)
 
 
-@lru_cache
-async def cached_aemet_2_step_fetch(ticket_uri: str) -> list[AemetWeatherPoint]:
-    "Cached wrapper around aemet_2_step_fetch"
+@single_flight
+async def coalesced_aemet_2_step_fetch(ticket_uri: str) -> WeatherPointBatch:
+    "Concurrent calls for the same ticket uri share one upstream round trip"
     return await aemet_2_step_fetch(ticket_uri)
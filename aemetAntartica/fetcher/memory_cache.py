@@ -0,0 +1,183 @@
+"""
+Bounded in-memory cache for fetch functions.
+"""
+
+import re
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Mapping, Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
+
+import structlog
+
+from .batch import WeatherPointBatch
+
+logger = structlog.get_logger(__name__)
+
+_FECHAFIN_RE = re.compile(r"/fechafin/([^/]+)/")
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    "Counters of a memory cache since its creation"
+
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    n_items: int
+    n_bytes: int
+
+
+class _Entry[V](NamedTuple):
+    value: V
+    n_bytes: int
+    expires_at: float | None
+
+
+class MemoryCache[K, V]:
+    """
+    LRU cache bounded by an (approximate) byte budget with optional per-entry TTL.
+
+    - sizeof: approximate size in bytes of a value.
+    - ttl: seconds a value may be kept given its key. None to keep it until evicted.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[V], int],
+        ttl: Callable[[K, V], float | None],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[K, _Entry[V]] = OrderedDict()
+        self._n_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: K) -> V | None:
+        "Return cached value or None. Refreshes LRU position."
+        entry = self._entries.get(key)
+
+        if (
+            entry is not None
+            and entry.expires_at is not None
+            and entry.expires_at <= self._clock()
+        ):
+            self._remove(key)
+            self._expirations += 1
+            entry = None
+
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry.value
+
+    def put(self, key: K, value: V):
+        "Insert value. Least recently used values are evicted until it fits in budget."
+        if key in self._entries:
+            self._remove(key)
+
+        n_bytes = self._sizeof(value)
+        if n_bytes > self.max_bytes:
+            logger.debug("Value too large for cache", n_bytes=n_bytes)
+            return
+
+        ttl = self._ttl(key, value)
+        expires_at = None if ttl is None else self._clock() + ttl
+
+        while self._n_bytes + n_bytes > self.max_bytes:
+            lru_key = next(iter(self._entries))
+            self._remove(lru_key)
+            self._evictions += 1
+
+        self._entries[key] = _Entry(value, n_bytes, expires_at)
+        self._n_bytes += n_bytes
+
+    def _remove(self, key: K):
+        entry = self._entries.pop(key)
+        self._n_bytes -= entry.n_bytes
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            expirations=self._expirations,
+            n_items=len(self._entries),
+            n_bytes=self._n_bytes,
+        )
+
+
+def points_sizeof(points: Sequence[Mapping]) -> int:
+    """
+    Approximate memory footprint of a list of points. Keys are ignored since they are shared strings.
+    """
+    if isinstance(points, WeatherPointBatch):
+        return sys.getsizeof(points) + points.nbytes
+
+    return sys.getsizeof(points) + sum(
+        sys.getsizeof(p) + sum(map(sys.getsizeof, p.values())) for p in points
+    )
+
+
+def ticket_uri_ttl_factory(
+    open_ttl: float,
+    closed_after: timedelta = timedelta(days=1),
+    uri_date_format: str = "%Y-%m-%dT%H:%M:%SUTC",
+) -> Callable[[str, object], float | None]:
+    """
+    TTL policy for ticket uris. Requests of closed months are kept until evicted. Still open months expire after open_ttl seconds.
+
+    A month is closed once its end date is more than closed_after in the past (data may arrive late).
+    Uris without a parseable end date are considered open.
+    """
+
+    def ttl(ticket_uri: str, _) -> float | None:
+        match = _FECHAFIN_RE.search(ticket_uri)
+        if match is None:
+            return open_ttl
+        try:
+            date_f = datetime.strptime(match.group(1), uri_date_format)
+        except ValueError:
+            return open_ttl
+
+        if date_f.replace(tzinfo=UTC) + closed_after < datetime.now(UTC):
+            return None
+        return open_ttl
+
+    return ttl
+
+
+@dataclass(frozen=True)
+class MemoryCachedFetch[V]:
+    """
+    Fetch function wrapper. Answers from the memory cache when possible.
+    """
+
+    "Wrapped fetch function. Called on cache miss"
+    fetch_function: Callable[[str], Awaitable[V]]
+
+    "Cache by uri"
+    cache: MemoryCache[str, V]
+
+    async def __call__(self, uri: str) -> V:
+        cached = self.cache.get(uri)
+        if cached is not None:
+            return cached
+
+        value = await self.fetch_function(uri)
+        self.cache.put(uri, value)
+        return value
@@ -3,10 +3,10 @@ Mock fetcher for testing and simulations.
 """
 
 import operator as op
+from collections.abc import AsyncIterator, Mapping, Sequence
 from dataclasses import dataclass
 from datetime import datetime
-from itertools import compress, repeat
-from typing import Mapping, Sequence
+from itertools import compress, groupby, repeat
 
 from .annot import StationMetaData, WeatherPoint
 from .exceptions import EndDateValueError, IniDateValueError, StationIdValueError
@@ -69,9 +69,32 @@ class MockWeatherDataFetcher:
         fhoras: map[str] = map(op.itemgetter("fhora"), timeseries_data)
         timeseries_dates: list[datetime] = list(map(datetime.fromisoformat, fhoras))
 
-        gt_d0_mask: map[bool] = map(op.gt, timeseries_dates, repeat(date0))
+        ge_d0_mask: map[bool] = map(op.ge, timeseries_dates, repeat(date0))
         lt_df_mask: map[bool] = map(op.lt, timeseries_dates, repeat(dateF))
 
-        dates_mask: map[bool] = map(op.and_, gt_d0_mask, lt_df_mask)
+        dates_mask: map[bool] = map(op.and_, ge_d0_mask, lt_df_mask)
 
         return list(compress(timeseries_data, dates_mask))
+
+    async def timeseries_stream(
+        self, date0: datetime, dateF: datetime, station_id: str
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        """
+        Same as timeseries but yielding one batch per calendar month. Emulates monthly fetching.
+        """
+        timeseries_data = await self.timeseries(date0, dateF, station_id)
+
+        def month_key(point: WeatherPoint) -> tuple[int, int]:
+            fhora = datetime.fromisoformat(point["fhora"])
+            return fhora.year, fhora.month
+
+        for _, month_points in groupby(timeseries_data, key=month_key):
+            yield list(month_points)
+
+    async def timeseries_many(
+        self, stations: Sequence[str], date0: datetime, dateF: datetime
+    ) -> Mapping[str, Sequence[WeatherPoint]]:
+        return {
+            station_id: await self.timeseries(date0, dateF, station_id)
+            for station_id in dict.fromkeys(stations)
+        }
@@ -0,0 +1,300 @@
+"""
+Columnar cache logic. One parquet file per station and calendar month.
+
+Requires pyarrow (sci dependency group).
+"""
+
+import asyncio
+import operator
+import os
+from array import array
+from collections import defaultdict
+from collections.abc import AsyncIterator, Mapping, Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from itertools import pairwise
+from pathlib import Path
+from urllib.parse import quote
+
+import asyncstdlib
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import structlog
+
+from aemetAntartica.fetcher.annot import WeatherDataFetcher, WeatherPoint
+from aemetAntartica.model.fetch import WeatherDataPoint, WeatherDataPointSeries
+from aemetAntartica.util.bisect import find_between
+from aemetAntartica.util.datetime import month_floor, month_starts, next_month
+
+from .batch import WeatherPointBatch
+
+logger = structlog.get_logger(__name__)
+
+"Schema of every month file. Dates are UTC timestamps in seconds"
+PARQUET_SCHEMA = pa.schema(
+    [
+        ("fhora", pa.timestamp("s", tz="UTC")),
+        ("temp", pa.float64()),
+        ("pres", pa.float64()),
+        ("vel", pa.float64()),
+    ]
+)
+
+_ROW_GROUP_SIZE = 1008  # A WEEK OF 10 MINUTES DATA. GRANULARITY OF PREDICATE PUSH-DOWN
+
+
+def models_to_table(points: Sequence[WeatherDataPoint]) -> pa.Table:
+    "Arrow table of validated points"
+    return pa.table(
+        {
+            "fhora": pa.array(
+                [p.fhora for p in points], PARQUET_SCHEMA.field("fhora").type
+            ),
+            "temp": pa.array([p.temp for p in points], pa.float64()),
+            "pres": pa.array([p.pres for p in points], pa.float64()),
+            "vel": pa.array([p.vel for p in points], pa.float64()),
+        },
+        schema=PARQUET_SCHEMA,
+    )
+
+
+def table_to_batch(table: pa.Table) -> WeatherPointBatch:
+    """
+    Trusted batch from an arrow table of PARQUET_SCHEMA. Columns are copied as buffers, no per-row objects.
+    """
+
+    def column(name: str, typecode: str, arrow_type: pa.DataType) -> array:
+        res = array(typecode)
+        res.frombytes(table[name].cast(arrow_type).to_numpy().tobytes())
+        return res
+
+    return WeatherPointBatch(
+        fhora=column("fhora", "q", pa.int64()),
+        temp=column("temp", "d", pa.float64()),
+        pres=column("pres", "d", pa.float64()),
+        vel=column("vel", "d", pa.float64()),
+        trusted=True,
+    )
+
+
+def _write_table(path: Path, table: pa.Table):
+    "Atomic write. Concurrent writers of the same month leave one complete file"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{id(table)}.tmp")
+    pq.write_table(table, tmp_path, row_group_size=_ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+
+def _read_table(path: Path, date_0: datetime, date_f: datetime) -> pa.Table:
+    "Memory mapped read of the points in [date_0, date_f). Row groups outside the interval are skipped"
+    return pq.read_table(
+        path,
+        columns=PARQUET_SCHEMA.names,
+        filters=[("fhora", ">=", date_0), ("fhora", "<", date_f)],
+        memory_map=True,
+        schema=PARQUET_SCHEMA,
+    )
+
+
+@dataclass
+class ParquetCacheFetcherProxy:
+    """
+    Proxy fetcher that stores each fetched (station, month) as a parquet file. Answers from files if possible.
+
+    A month file only exists once the whole month has been fetched (empty months included). Missing months are
+    fetched as whole months, clipped to the station time range, in a single fetcher call per run of missing months.
+    Files are immutable: months newer than settle are served from the network but never written.
+    """
+
+    fetcher: WeatherDataFetcher[WeatherPoint]
+
+    "Root directory. Layout: station=<quoted id>/<YYYY-MM>.parquet"
+    root: Path
+
+    "Recent data may still arrive late upstream. Months ending after now - settle are not stored"
+    settle: timedelta = timedelta(days=1)
+
+    async def stations(self) -> Sequence[str]:
+        "Call fetcher"
+        return await self.fetcher.stations()
+
+    async def time_range(self, station_id: str) -> tuple[datetime, datetime]:
+        "Call fetcher"
+        return await self.fetcher.time_range(station_id)
+
+    def month_path(self, station_id: str, month: datetime) -> Path:
+        "File of a station month. Station ids are quoted so any id is a valid directory name"
+        return (
+            self.root
+            / f"station={quote(station_id, safe='')}"
+            / f"{month:%Y-%m}.parquet"
+        )
+
+    async def timeseries(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> WeatherPointBatch:
+        "Concatenation of timeseries_stream"
+        batches = await asyncstdlib.list(
+            self.timeseries_stream(date_0, date_f, station_id)
+        )
+        return WeatherPointBatch.concat(batches)
+
+    async def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[WeatherPointBatch]:
+        """
+        Yield one batch per month in chronological order. Stored months are read from disk, the rest fetched and stored.
+        """
+        months = month_starts(date_0, date_f)
+        cached = [self.month_path(station_id, m).exists() for m in months[:-1]]
+
+        logger.debug(
+            "Searching for missing months",
+            req_d0=date_0,
+            req_df=date_f,
+            n_months=len(cached),
+            n_missing=cached.count(False),
+        )
+
+        file_points = 0
+        fetch_points = 0
+
+        ndx = 0
+        while ndx < len(cached):
+            if cached[ndx]:
+                batch = await self._read_month(station_id, months[ndx], date_0, date_f)
+                file_points += len(batch)
+                yield batch
+                ndx += 1
+                continue
+
+            # RUN OF CONSECUTIVE MISSING MONTHS. SINGLE FETCHER CALL.
+            ndx_f = ndx
+            while ndx_f < len(cached) and not cached[ndx_f]:
+                ndx_f += 1
+
+            async for batch in self._fetch_months(
+                station_id, months[ndx : ndx_f + 1], date_0, date_f
+            ):
+                fetch_points += len(batch)
+                yield batch
+            ndx = ndx_f
+
+        logger.info(
+            "Parquet cache return", file_points=file_points, fetch_points=fetch_points
+        )
+
+    async def timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, WeatherPointBatch]:
+        "Stations are read concurrently. Missing months are fetched per station"
+        stations = list(dict.fromkeys(stations))
+        batches = await asyncio.gather(
+            *(self.timeseries(date_0, date_f, station_id) for station_id in stations)
+        )
+        return dict(zip(stations, batches))
+
+    async def scan(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        columns: Sequence[str] = PARQUET_SCHEMA.names,
+    ) -> pa.Table:
+        """
+        Arrow table of the stored points in [date_0, date_f). Only the requested columns are read.
+
+        Meant for multi-year scans and vectorized aggregations. Months not stored yet are not included.
+        """
+        paths = [
+            path
+            for m in month_starts(date_0, date_f)[:-1]
+            if (path := self.month_path(station_id, m)).exists()
+        ]
+        if len(paths) == 0:
+            return PARQUET_SCHEMA.empty_table().select(list(columns))
+
+        dataset = ds.dataset(paths, schema=PARQUET_SCHEMA, format="parquet")
+        flt = (pc.field("fhora") >= date_0) & (pc.field("fhora") < date_f)
+        return await asyncio.to_thread(
+            dataset.to_table, columns=list(columns), filter=flt
+        )
+
+    async def _read_month(
+        self, station_id: str, month: datetime, date_0: datetime, date_f: datetime
+    ) -> WeatherPointBatch:
+        table = await asyncio.to_thread(
+            _read_table,
+            self.month_path(station_id, month),
+            max(date_0, month),
+            min(date_f, next_month(month)),
+        )
+        logger.debug("Fetched points from parquet", month=month, n_points=len(table))
+        return table_to_batch(table)
+
+    async def _fetch_months(
+        self,
+        station_id: str,
+        months: Sequence[datetime],
+        date_0: datetime,
+        date_f: datetime,
+    ) -> AsyncIterator[WeatherPointBatch]:
+        """
+        Fetch the whole months in [months[0], months[-1]) clipped to the station time range. Store settled ones.
+
+        Yield the points in [date_0, date_f) of each month as soon as the month is complete.
+        """
+        station_d0, station_df = await self.fetcher.time_range(station_id)
+        fetch_d0 = max(months[0], station_d0)
+        fetch_df = min(months[-1], station_df)
+        settled = datetime.now(UTC) - self.settle
+
+        pending: defaultdict[datetime, list[WeatherDataPoint]] = defaultdict(list)
+
+        async def flush(month: datetime) -> WeatherPointBatch:
+            table = models_to_table(pending.pop(month, []))
+            if next_month(month) <= settled:
+                path = self.month_path(station_id, month)
+                await asyncio.to_thread(_write_table, path, table)
+                logger.debug("Month stored", month=month, n_points=len(table))
+
+            fhora = table["fhora"]
+            in_range = pc.and_(
+                pc.greater_equal(fhora, pa.scalar(date_0, fhora.type)),
+                pc.less(fhora, pa.scalar(date_f, fhora.type)),
+            )
+            return table_to_batch(table.filter(in_range))
+
+        flushed = 0
+        if fetch_d0 < fetch_df:
+            logger.debug("Fetching months", d0=fetch_d0, df=fetch_df)
+            async for batch in self.fetcher.timeseries_stream(
+                fetch_d0, fetch_df, station_id
+            ):
+                points = WeatherDataPointSeries.model_validate({"points": batch}).points
+                points = find_between(
+                    points, fetch_d0, fetch_df, key=operator.attrgetter("fhora")
+                )
+                for point in points:
+                    pending[month_floor(point.fhora.astimezone(UTC))].append(point)
+
+                # CHRONOLOGICAL STREAM: MONTHS BEFORE THE LAST POINT ARE COMPLETE.
+                if len(points) > 0:
+                    last_month = month_floor(points[-1].fhora.astimezone(UTC))
+                    while months[flushed] < last_month:
+                        yield await flush(months[flushed])
+                        flushed += 1
+
+        for month, _ in pairwise(months[flushed:]):
+            yield await flush(month)
+
+
+def parquet_cache_fetcher_proxy_factory(
+    fetcher: WeatherDataFetcher[WeatherPoint], root: str | Path
+) -> ParquetCacheFetcherProxy:
+    "Creates root directory if needed"
+    logger.info("Creating parquet proxy for fetcher", root=str(root))
+    Path(root).mkdir(parents=True, exist_ok=True)
+    return ParquetCacheFetcherProxy(fetcher=fetcher, root=Path(root))
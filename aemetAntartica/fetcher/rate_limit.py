@@ -0,0 +1,140 @@
+"""
+Throttling and retry policies for upstream requests.
+"""
+
+import asyncio
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Seconds to wait given a Retry-After header. Supports both delay-seconds and http-date formats.
+    """
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, (date - datetime.now(UTC)).total_seconds())
+
+
+@dataclass
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every upstream request of the process.
+
+    The rate adapts to upstream feedback: additive increase on success and multiplicative decrease on throttling.
+    Throttling responses may also pause the whole bucket (i.e. Retry-After header).
+    """
+
+    "Initial requests per second"
+    rate: float
+
+    "Max number of tokens. Number of requests that may be sent back to back"
+    burst: int = 1
+
+    "Rate is never decreased below this value"
+    min_rate: float = 0.1
+
+    "Rate is never increased above this value"
+    max_rate: float = 10.0
+
+    "Rate increment after every successful request"
+    increase_step: float = 0.05
+
+    "Rate multiplier after every throttled request"
+    decrease_factor: float = 0.5
+
+    "Monotonic clock in seconds. Injectable for testing"
+    clock: Callable[[], float] = time.monotonic
+
+    _tokens: float = field(init=False)
+    _updated: float = field(init=False)
+    _paused_until: float = field(init=False, default=0.0)
+    _lock: asyncio.Lock = field(init=False, default_factory=asyncio.Lock)
+
+    def __post_init__(self):
+        if self.rate <= 0:
+            raise ValueError(f"Rate must be positive: rate={self.rate}")
+        self.rate = min(max(self.rate, self.min_rate), self.max_rate)
+        self._tokens = float(self.burst)
+        self._updated = self.clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Wait until a request may be sent. Waiters are served in arrival order.
+        """
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = max(
+                    self._paused_until - self.clock(),
+                    (1 - self._tokens) / self.rate,
+                )
+                if wait <= 0:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(wait)
+
+    def on_success(self):
+        "Upstream accepted the request. Probe for a higher rate"
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after: float | None = None):
+        "Upstream rejected the request because of quota. Back off"
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._tokens = min(self._tokens, 0.0)
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, self.clock() + retry_after)
+        logger.warning("Upstream throttling", rate=self.rate, retry_after=retry_after)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+    """
+
+    "Number of retries after the first attempt. 0 to disable retries"
+    max_retries: int = 3
+
+    "Backoff upper bound of the first retry in seconds"
+    base_delay: float = 0.5
+
+    "Backoff upper bound in seconds. Retry-After may still ask for more"
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Seconds to wait before retry number `attempt` (0 based). Never less than retry_after.
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is None:
+            return backoff
+        return max(backoff, retry_after)
@@ -2,24 +2,75 @@
 SQL cache logic
 """
 
+import asyncio
+import json
 import operator
-from collections.abc import Sequence
-from dataclasses import dataclass
-from datetime import UTC, datetime, timedelta
+import time
+from array import array
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator, Iterable, Iterator, Mapping, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta, tzinfo
+from itertools import count, pairwise
 from math import isinf, isnan
-from string import Template
 
 import aiosqlite
 import asyncstdlib
 import structlog
 
-from aemetAntartica.fetcher.annot import WeatherDataFetcher, WeatherPoint
+from aemetAntartica.aggregator.bucketing import CalendarPeriod
+from aemetAntartica.aggregator.sketch import variable_sketch
+from aemetAntartica.fetcher.annot import SqlAggType, WeatherDataFetcher, WeatherPoint
 from aemetAntartica.model.fetch import WeatherDataPoint, WeatherDataPointSeries
-from aemetAntartica.model.tz_fetch import change_series_timezone
-from aemetAntartica.util.bisect import remove_gap
+from aemetAntartica.util.bisect import find_between
+from aemetAntartica.util.datetime import month_floor, month_starts, next_month
+
+from .batch import PointRecord, WeatherPointBatch
+from .sql_retention import (
+    BACKFILL_ACCESS_STATEMENT,
+    CREATE_ACCESS_TABLE_STATEMENT,
+    DELETE_MONTH_ACCESS_STATEMENT,
+    DELETE_MONTH_POINTS_STATEMENT,
+    FETCH_EVICTION_CANDIDATES_STATEMENT,
+    UPSERT_ACCESS_STATEMENT,
+    USED_BYTES_STATEMENT,
+    EvictionCandidate,
+    RetentionPolicy,
+    plan_evictions,
+)
+from .sql_rollup import (
+    COUNT_POINTS_STATEMENT,
+    CREATE_ROLLUP_TABLE_STATEMENT,
+    DELETE_ROLLUPS_STATEMENT,
+    FETCH_ROLLUP_STATEMENT,
+    REFRESH_ROLLUP_STATEMENT,
+    ROLLUP_PERIODS,
+    Rollup,
+    parse_rollup_row,
+    rollup_buckets_param,
+    rollup_period,
+    rollup_record,
+    rollup_refresh_range,
+)
+from .sql_sketch import (
+    CREATE_SKETCH_TABLE_STATEMENT,
+    DELETE_MONTH_SKETCH_STATEMENT,
+    FETCH_FIRST_FHORA_STATEMENT,
+    FETCH_SKETCH_STATEMENT,
+    SKETCH_VARIABLES,
+    UPSERT_SKETCH_STATEMENT,
+    month_parts,
+    parse_sketch_row,
+    sketch_params,
+)
+from .sqlite_pool import SqlitePool
 
 logger = structlog.get_logger(__name__)
 
+"Storage errors of the background tasks. Logged and the task goes on, anything else is a bug and stops it"
+STORAGE_ERRORS = (aiosqlite.Error, OSError)
+
 # SQL STATEMENTS FUNCTIONS AND DECLARATIONS
 
 _SQL_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -33,65 +84,346 @@ CREATE TABLE IF NOT EXISTS datapoints(
     pres FLOAT,
     PRIMARY KEY(fhora, station)
 );
+
+CREATE TABLE IF NOT EXISTS coverage(
+    station VARCHAR,
+    date_0 DATETIME,
+    date_f DATETIME,
+    PRIMARY KEY(station, date_0)
+);
 """.strip()
 
 
-_FETCH_COLUMNS = ["fhora", "vel", "temp", "pres"]
-_FETCH_INTERVAL_TEMPLATE = Template(
-    """
+# DATES ARE READ AS UTC POSIX TIMESTAMPS. NO PARSING NEEDED TO BUILD BATCHES.
+_FETCH_INTERVAL_STATEMENT = """
 SELECT
-    fhora,
+    unixepoch(fhora),
     vel,
     temp,
     pres
 FROM datapoints
 WHERE
-    station == "$station_id"
-    and fhora between "$date_0" and "$date_f"
+    station == :station_id
+    and fhora >= :date_0
+    and fhora < :date_f
 ORDER BY fhora;
 """.strip()
+
+
+# CALENDAR BUCKETS COMPUTED BY THE CALLER AS A JSON ARRAY OF [start, end] SQL DATES. ONE INDEX RANGE SCAN PER BUCKET.
+_AGG_POINTS_CTE = """
+WITH buckets AS (
+    SELECT
+        key AS bucket,
+        max(value ->> 0, :date_0) AS bucket_0,
+        min(value ->> 1, :date_f) AS bucket_f
+    FROM json_each(:buckets)
+),
+bucketed AS (
+    SELECT
+        buckets.bucket,
+        datapoints.fhora,
+        datapoints.vel,
+        datapoints.temp,
+        datapoints.pres
+    FROM buckets
+    JOIN datapoints ON
+        datapoints.station == :station_id
+        and datapoints.fhora >= buckets.bucket_0
+        and datapoints.fhora < buckets.bucket_f
 )
+""".strip()
+
+
+def _sql_mean(v: str) -> str:
+    "Mean ignoring nan (stored as text). 0 if there are no values, same as calc_mean"
+    return f"coalesce(avg(CASE WHEN typeof({v}) IN ('integer', 'real') THEN {v} END), 0) AS {v}"
+
+
+"Aggregation statements by aggregation type. Parameters: station_id, date_0, date_f and buckets (json)"
+_AGGREGATE_STATEMENTS: Mapping[SqlAggType, str] = {
+    # BARE COLUMNS OF A min/max AGGREGATE QUERY ARE TAKEN FROM THE min/max ROW.
+    "first": f"""
+{_AGG_POINTS_CTE}
+SELECT unixepoch(min(fhora)) AS fhora, vel, temp, pres
+FROM bucketed
+GROUP BY bucket
+ORDER BY bucket;
+""".strip(),
+    "last": f"""
+{_AGG_POINTS_CTE}
+SELECT unixepoch(max(fhora)) AS fhora, vel, temp, pres
+FROM bucketed
+GROUP BY bucket
+ORDER BY bucket;
+""".strip(),
+    "mean": f"""
+{_AGG_POINTS_CTE}
+SELECT unixepoch(min(fhora)) AS fhora, {_sql_mean("vel")}, {_sql_mean("temp")}, {_sql_mean("pres")}
+FROM bucketed
+GROUP BY bucket
+ORDER BY bucket;
+""".strip(),
+}
+
 
+_INSERT_STATEMENT = """
+INSERT INTO datapoints (fhora, station, vel, temp, pres)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(fhora, station) DO UPDATE SET
+    vel = excluded.vel,
+    temp = excluded.temp,
+    pres = excluded.pres;
+""".strip()
+
+
+"Covered intervals overlapping the [date_0, date_f) interval"
+_FETCH_COVERAGE_STATEMENT = """
+SELECT
+    date_0,
+    date_f
+FROM coverage
+WHERE
+    station == :station_id
+    and date_0 < :date_f
+    and date_f > :date_0
+ORDER BY date_0;
+""".strip()
+
+
+"Covered intervals overlapping or adjacent to the [date_0, date_f] interval"
+_FETCH_TOUCHING_COVERAGE_STATEMENT = """
+SELECT
+    min(date_0),
+    max(date_f)
+FROM coverage
+WHERE
+    station == :station_id
+    and date_0 <= :date_f
+    and date_f >= :date_0;
+""".strip()
+
+_DELETE_TOUCHING_COVERAGE_STATEMENT = """
+DELETE FROM coverage
+WHERE
+    station == :station_id
+    and date_0 <= :date_f
+    and date_f >= :date_0;
+""".strip()
+
+_INSERT_COVERAGE_STATEMENT = """
+INSERT INTO coverage (station, date_0, date_f)
+VALUES (:station_id, :date_0, :date_f);
+""".strip()
 
-def insert_statement_gen(d_in: Sequence[WeatherDataPoint], station: str) -> str:
+_DELETE_COVERAGE_STATEMENT = """
+DELETE FROM coverage
+WHERE
+    station == :station_id
+    and date_0 == :date_0;
+""".strip()
+
+
+def _sql_date(d: datetime) -> str:
+    return d.astimezone(UTC).strftime(_SQL_DATE_FORMAT)
+
+
+def _parse_sql_date(d: str) -> datetime:
+    return datetime.strptime(d, _SQL_DATE_FORMAT).replace(tzinfo=UTC)
+
+
+def _float_param(d: float) -> float | str:
+    "Sqlite stores nan as NULL. Keep it as text to read it back as nan"
+    if isnan(d) or isinf(d):
+        return "NaN"
+    return d
+
+
+def insert_rows_gen(
+    d_in: Iterable[WeatherDataPoint], station: str
+) -> Iterator[tuple[str, str, float | str, float | str, float | str]]:
+    """
+    Parameters of _INSERT_STATEMENT for every point.
+    """
+    for d in d_in:
+        yield (
+            _sql_date(d.fhora),
+            station,
+            _float_param(d.vel),
+            _float_param(d.temp),
+            _float_param(d.pres),
+        )
+
+
+def _float_column(values: Iterable[float | str]) -> array:
+    "Nan is stored as text"
+    return array("d", (float(v) if v.__class__ is str else v for v in values))
+
+
+def sql_rows_to_batch(rows: Sequence[tuple]) -> WeatherPointBatch:
     """
-    Insert statement function generator.
+    Batch from _FETCH_INTERVAL_STATEMENT rows. Cached data is trusted: no validation.
     """
+    if len(rows) == 0:
+        return WeatherPointBatch.concat(())
+
+    fhora, vel, temp, pres = zip(*rows)
+    return WeatherPointBatch(
+        fhora=array("q", fhora),
+        temp=_float_column(temp),
+        pres=_float_column(pres),
+        vel=_float_column(vel),
+        trusted=True,
+    )
 
-    def float_format(d: float) -> str:
-        if isnan(d):
-            return '"NaN"'
-        if isinf(d):
-            return '"NaN"'
-        return f"{d}"
 
-    def data_upd_gen():
-        for d in d_in:
-            date = d.fhora.strftime(_SQL_DATE_FORMAT)
-            yield f'("{date}", "{station}", {float_format(d.vel)}, {float_format(d.temp)}, {float_format(d.pres)})'
+def models_to_batch(points: Sequence[WeatherDataPoint]) -> WeatherPointBatch:
+    "Batch from validated points"
+    return WeatherPointBatch(
+        fhora=array("q", (int(p.fhora.timestamp()) for p in points)),
+        temp=array("d", (p.temp for p in points)),
+        pres=array("d", (p.pres for p in points)),
+        vel=array("d", (p.vel for p in points)),
+        trusted=True,
+    )
 
-    values = ",\n".join(data_upd_gen())
 
-    return f"""
-INSERT INTO datapoints (fhora, station, vel, temp, pres )
-values {values};
-    """.strip()
+def coverage_segments(
+    date_0: datetime,
+    date_f: datetime,
+    covered: Iterable[tuple[datetime, datetime]],
+) -> list[tuple[datetime, datetime, bool]]:
+    """
+    Split [date_0, date_f) in consecutive (seg_0, seg_f, is_covered) segments given sorted covered intervals.
+    """
+    segments: list[tuple[datetime, datetime, bool]] = []
+    d = date_0
+    for cov_0, cov_f in covered:
+        cov_0, cov_f = max(cov_0, date_0), min(cov_f, date_f)
+        if cov_f <= d:
+            continue
+        if d < cov_0:
+            segments.append((d, cov_0, False))
+        segments.append((max(d, cov_0), cov_f, True))
+        d = cov_f
+    if d < date_f:
+        segments.append((d, date_f, False))
+    return segments
 
 
 # PROXY CLASS:
 
 
+@dataclass(slots=True)
+class CacheWrite:
+    """
+    Pending write of a station. Points are inserted before the interval is marked as covered.
+
+    done is resolved once committed. Cancelled if the write failed or coverage lost the points it requires.
+    """
+
+    station_id: str
+    points: Sequence[WeatherDataPoint] = ()
+    "Interval [date_0, date_f) to mark as covered, if any"
+    coverage: tuple[datetime, datetime] | None = None
+    "Point writes that must be committed before coverage is merged"
+    requires: Sequence[asyncio.Future[None]] = ()
+    done: asyncio.Future[None] = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
 @dataclass
 class SqliteCacheFetcherProxy:
     """
     Proxy fetcher that captures requests. Answers with sqlite data if possible and delegates on fetcher for true data-source.
 
+    Fetched intervals are recorded in a coverage table (empty ones included). Only uncovered sub-intervals are fetched.
+
     Don't istanciate directly. Use sqlite_cache_fetcher_proxy_factory.
     """
 
     fetcher: WeatherDataFetcher[WeatherPoint]
-    sqlite_uri: str
-    date_offset: timedelta = timedelta(minutes=10)
+    "Persistent sqlite connections. Owned by the proxy"
+    pool: SqlitePool
+
+    "Number of cached rows per yielded batch"
+    read_batch_size: int = 4464  # A MONTH OF 10 MINUTES DATA
+
+    "Recent data may still arrive late upstream. Intervals newer than this are fetched but never marked as covered"
+    coverage_settle: timedelta = timedelta(days=1)
+
+    "Calendar of the rollup buckets. Only aggregations over buckets of this timezone are served from rollups"
+    rollup_timezone: tzinfo = UTC
+
+    "In-flight gap fetches by (station, date_0, date_f). Coalesces identical concurrent gaps"
+    _gap_flights: dict[tuple[str, datetime, datetime], asyncio.Future[bool]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    "Size limits enforced by maintain"
+    retention: RetentionPolicy = field(default_factory=RetentionPolicy)
+
+    "Last access time by (station, sql month). Kept in memory and written by maintain, so reads never write"
+    _accessed: dict[tuple[str, str], float] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    "Months being read by (station, sql month). Never evicted while read"
+    _read_pins: Counter[tuple[str, str]] = field(
+        default_factory=Counter, init=False, repr=False
+    )
+
+    "Months being evicted by (station, sql month). Set once their eviction is committed"
+    _evicting: dict[tuple[str, str], asyncio.Event] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    """
+    Last invalidation of the sketch of each (station, sql month) pending a refresh. A refresh is discarded if a write
+    invalidated it meanwhile. Dropped once refreshed or evicted
+    """
+    _sketch_versions: dict[tuple[str, str], int] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    "Invalidation numbers. Never reused, so a dropped version can't come back"
+    _sketch_invalidations: Iterator[int] = field(
+        default_factory=count, init=False, repr=False
+    )
+
+    _maintenance_task: asyncio.Task | None = field(default=None, init=False, repr=False)
+
+    "Writes committed per transaction by the background writer"
+    write_batch_size: int = 32
+
+    "Pending writes of the background writer. Writes are synchronous if None"
+    _write_queue: asyncio.Queue[CacheWrite] | None = field(
+        default=None, init=False, repr=False
+    )
+    _writer_task: asyncio.Task | None = field(default=None, init=False, repr=False)
+
+    def start_write_behind(self, max_pending: int):
+        """
+        Commit writes in a background task. At most max_pending writes are queued, further writes wait.
+
+        Network points are returned without waiting for sqlite. Pending writes are flushed by aclose.
+        """
+        self._write_queue = asyncio.Queue(max_pending)
+        self._writer_task = asyncio.create_task(self._drain_writes())
+
+    async def aclose(self):
+        "Stop periodic maintenance. Flush pending writes. Release sqlite connections"
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            await asyncio.gather(self._maintenance_task, return_exceptions=True)
+            self._maintenance_task = None
+        if self._writer_task is not None:
+            await self.flush()
+            self._writer_task.cancel()
+            await asyncio.gather(self._writer_task, return_exceptions=True)
+            self._writer_task, self._write_queue = None, None
+        await self.pool.close()
 
     async def stations(self) -> Sequence[str]:
         "Call fetcher"
@@ -103,134 +435,956 @@ class SqliteCacheFetcherProxy:
 
     async def timeseries(
         self, date_0: datetime, date_f: datetime, station_id: str
-    ) -> Sequence[WeatherDataPoint]:
+    ) -> WeatherPointBatch:
         """
         Fetch data from sql. Check for gaps. Fetch those gaps in the network and finally insert them back to sql.
         """
-        sel_stmt = _FETCH_INTERVAL_TEMPLATE.substitute(
-            {
-                "date_0": date_0.strftime(_SQL_DATE_FORMAT),
-                "date_f": (date_f - self.date_offset).strftime(_SQL_DATE_FORMAT),
-                "station_id": station_id,
-            }
+        res_matrix = await asyncstdlib.list(
+            self.timeseries_stream(date_0, date_f, station_id)
         )
+        return WeatherPointBatch.concat(res_matrix)
 
-        async def fetch_rows():
-            async with (
-                aiosqlite.connect(self.sqlite_uri) as db,
-                db.execute(sel_stmt) as cursor,
-            ):
-                async for row in cursor:
-                    yield row
+    async def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[WeatherPointBatch]:
+        """
+        Yield points in chronological order: covered segments from sql and uncovered ones from the network.
 
-        rows = await asyncstdlib.list(fetch_rows())
+        Network batches are validated and inserted back to sql as they arrive. Cached batches are trusted and not validated.
+        """
+        async with self._pin_months(date_0, date_f, [station_id]):
+            segments = await self._coverage_segments(date_0, date_f, station_id)
 
-        logger.debug(
-            "Fetched points from sql",
-            n_points=len(rows),
+            logger.debug(
+                "Searching for gaps",
+                req_d0=date_0,
+                req_df=date_f,
+                n_gaps=sum(not is_covered for *_, is_covered in segments),
+            )
+
+            sql_points = 0
+            fetch_points = 0
+
+            for seg_0, seg_f, is_covered in segments:
+                if is_covered:
+                    async for batch in self._read_cached(seg_0, seg_f, station_id):
+                        sql_points += len(batch)
+                        yield batch
+                else:
+                    async for batch in self._fetch_gap(seg_0, seg_f, station_id):
+                        fetch_points += len(batch)
+                        yield batch
+
+        logger.info(
+            "Sql cache return",
+            sql_points=sql_points,
+            fetch_points=fetch_points,
         )
 
-        def row_to_dict(row: tuple) -> dict:
-            return dict(zip(_FETCH_COLUMNS, row))
+    async def timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, WeatherPointBatch]:
+        """
+        Same as timeseries for several stations. Stations sharing a gap get it in a single fetcher.timeseries_many call.
+
+        Coverage queries, gap fetches and cached reads of every station run concurrently.
+        """
+        stations = list(dict.fromkeys(stations))
+        async with self._pin_months(date_0, date_f, stations):
+            return await self._timeseries_many(stations, date_0, date_f)
 
-        sql_res_series = WeatherDataPointSeries.model_validate(
-            {"points": list(map(row_to_dict, rows))}  # type: ignore
+    async def _timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, WeatherPointBatch]:
+        "timeseries_many of distinct and pinned stations"
+        segments = dict(
+            zip(
+                stations,
+                await asyncio.gather(
+                    *(self._coverage_segments(date_0, date_f, s) for s in stations)
+                ),
+            )
         )
-        sql_res_series_tz = change_series_timezone(UTC, sql_res_series)
 
-        async def complete_fetching():
-            """
-            Fetch all the data not in sql database
-            """
+        stations_by_gap: defaultdict[tuple[datetime, datetime], list[str]] = (
+            defaultdict(list)
+        )
+        for station_id, station_segments in segments.items():
+            for seg_0, seg_f, is_covered in station_segments:
+                if not is_covered:
+                    stations_by_gap[(seg_0, seg_f)].append(station_id)
 
-            if len(sql_res_series_tz.points) <= 0:
-                logger.debug(
-                    "No points fetchd. Taking all information from net provider"
-                )
-                return await self.fetcher.timeseries(date_0, date_f, station_id)
+        logger.debug("Multi-station gaps", n_gaps=len(stations_by_gap))
+
+        # DISTINCT GAPS ARE FETCHED AT ONCE. THE FETCHER AND THE RATE LIMITER BOUND UPSTREAM CONCURRENCY.
+        gaps_points = await asyncio.gather(
+            *(
+                self._fetch_gap_many(gap_d0, gap_df, gap_stations)
+                for (gap_d0, gap_df), gap_stations in stations_by_gap.items()
+            )
+        )
+        fetched: dict[tuple[str, datetime, datetime], WeatherPointBatch] = {
+            (station_id, gap_d0, gap_df): points
+            for (gap_d0, gap_df), gap_points in zip(stations_by_gap, gaps_points)
+            for station_id, points in gap_points.items()
+        }
+
+        async def station_batch(station_id: str) -> WeatherPointBatch:
+            batches: list[WeatherPointBatch] = []
+            for seg_0, seg_f, is_covered in segments[station_id]:
+                if is_covered:
+                    async for batch in self._read_cached(seg_0, seg_f, station_id):
+                        batches.append(batch)
+                else:
+                    batches.append(fetched[(station_id, seg_0, seg_f)])
+            return WeatherPointBatch.concat(batches)
+
+        return dict(zip(stations, await asyncio.gather(*map(station_batch, stations))))
+
+    async def _coverage_segments(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> list[tuple[datetime, datetime, bool]]:
+        """
+        Covered and uncovered segments of the [date_0, date_f) interval in chronological order.
+        """
+        params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+        }
+
+        async with (
+            self.pool.reader() as db,
+            db.execute(_FETCH_COVERAGE_STATEMENT, params) as cursor,
+        ):
+            rows = await cursor.fetchall()
+
+        covered = [(_parse_sql_date(d0), _parse_sql_date(df)) for d0, df in rows]
+        return coverage_segments(date_0, date_f, covered)
+
+    async def aggregate(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        agg: SqlAggType,
+        buckets: Sequence[datetime],
+    ) -> Sequence[PointRecord] | None:
+        """
+        Aggregate [date_0, date_f) in sqlite over the buckets [buckets[i], buckets[i + 1]). Empty buckets are skipped.
+
+        Buckets fully inside the interval are read from the rollups if they are buckets of rollup_timezone.
+        The rest (edges, other timezones or stale rollups) are aggregated with a GROUP BY. Only aggregated rows are read.
+
+        None if the interval is not fully covered. The caller must fetch and aggregate in python instead.
+        """
+        async with self._pin_months(date_0, date_f, [station_id]):
+            segments = await self._coverage_segments(date_0, date_f, station_id)
+            if not all(is_covered for _, _, is_covered in segments):
+                return None
+            self._touch(date_0, date_f, station_id)
 
-            sql_d0 = sql_res_series_tz.points[0].fhora
-            sql_df = sql_res_series_tz.points[-1].fhora
+            inner = [b for b in buckets if date_0 <= b <= date_f]
+            period = (
+                rollup_period(inner, self.rollup_timezone) if len(inner) > 1 else None
+            )
+
+            async with self.pool.reader() as db:
+                rolled_up: list[PointRecord] = []
+                raw_buckets = list(pairwise(buckets))
+                if period is not None:
+                    rollups = await self._read_rollups(
+                        db, inner[0], inner[-1], station_id, period
+                    )
+                    if rollups is not None:
+                        rolled_up = [rollup_record(r, agg) for r in rollups]
+                        raw_buckets = [
+                            (b0, bf)
+                            for b0, bf in raw_buckets
+                            if b0 < inner[0] or bf > inner[-1]
+                        ]
 
-            async def fetch_gap(d0: datetime, df: datetime):
-                df_ = df
-                if df_ <= d0:
-                    return []
-                logger.debug("Fetching gap", d0=d0, df=df_)
-                return await self.fetcher.timeseries(d0, df, station_id)
+                params = {
+                    "date_0": _sql_date(date_0),
+                    "date_f": _sql_date(date_f),
+                    "station_id": station_id,
+                    "buckets": json.dumps(
+                        [[_sql_date(b0), _sql_date(bf)] for b0, bf in raw_buckets]
+                    ),
+                }
+                async with db.execute(_AGGREGATE_STATEMENTS[agg], params) as cursor:
+                    rows = await cursor.fetchall()
 
             logger.debug(
-                "Searching for gaps",
-                req_d0=date_0,
-                sql_d0=sql_d0,
-                sql_df=sql_df,
-                req_df=date_f,
+                "Aggregated points in sql",
+                agg=agg,
+                n_points=len(rows) + len(rolled_up),
+                n_rollups=len(rolled_up),
+            )
+            # BUCKETS DON'T OVERLAP: SORTING BY DATE SORTS BY BUCKET.
+            return sorted(
+                [*sql_rows_to_batch(rows).records(), *rolled_up],
+                key=operator.attrgetter("fhora"),
             )
 
-            pre_extra = await fetch_gap(date_0, sql_d0)
-            # THIS DATE OFFSET MAY HELP HELP THE DATE GENERATOR LATER...
-            pos_extra = await fetch_gap(sql_df + self.date_offset, date_f)
-            return [
-                *pre_extra,
-                *pos_extra,
-            ]
-
-        extra_fetching = await complete_fetching()
-        fetch_res_series = WeatherDataPointSeries.model_validate(
-            {"points": extra_fetching}
-        )
+    async def _read_rollups(
+        self,
+        db: aiosqlite.Connection,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        period: CalendarPeriod,
+    ) -> list[Rollup] | None:
+        """
+        Rollups of the buckets of [date_0, date_f). Bounds must be buckets starts of rollup_timezone.
 
-        async def insert_missing_data():
-            """
-            If there is data to insert include it in the database
-            """
+        None if they don't count every cached point of the interval (cached before rollups existed or partially evicted).
+        """
+        params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+            "tz": str(self.rollup_timezone),
+            "period": period,
+        }
+        async with db.execute(FETCH_ROLLUP_STATEMENT, params) as cursor:
+            rollups = list(map(parse_rollup_row, await cursor.fetchall()))
+        async with db.execute(COUNT_POINTS_STATEMENT, params) as cursor:
+            (n,) = await cursor.fetchone()  # type: ignore
+
+        if sum(r.n for r in rollups) != n:
+            logger.warning(
+                "Stale rollups. Aggregated raw instead", period=period, n_points=n
+            )
+            return None
+        return rollups
+
+    async def quantiles(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        q: float,
+        buckets: Sequence[datetime],
+    ) -> Sequence[PointRecord] | None:
+        """
+        Approximate q quantile of [date_0, date_f) over the buckets [buckets[i], buckets[i + 1]). Empty buckets are skipped.
+
+        UTC months mostly inside a bucket are answered by their cached sketches (minus the raw points of the month
+        outside the bucket). Only the rest is read raw, i.e. the hours a local month is shifted from its UTC month.
+
+        None if the interval is not fully covered. The caller must fetch and aggregate in python instead.
+        """
+        async with self._pin_months(date_0, date_f, [station_id]):
+            segments = await self._coverage_segments(date_0, date_f, station_id)
+            if not all(is_covered for _, _, is_covered in segments):
+                return None
+            self._touch(date_0, date_f, station_id)
+
+            params = {
+                "date_0": _sql_date(date_0),
+                "date_f": _sql_date(date_f),
+                "station_id": station_id,
+            }
+
+            res: list[PointRecord] = []
+            n_raw_points = 0
+            async with self.pool.reader() as db:
+                async with db.execute(FETCH_SKETCH_STATEMENT, params) as cursor:
+                    cached = {
+                        s.month: s
+                        for s in map(parse_sketch_row, await cursor.fetchall())
+                    }
+
+                for bucket_0, bucket_f in pairwise(buckets):
+                    sketches = list(map(variable_sketch, SKETCH_VARIABLES))
+                    n = 0
+                    first_fhora: datetime | None = None
+                    for part_0, part_f, month in month_parts(
+                        max(bucket_0, date_0), min(bucket_f, date_f)
+                    ):
+                        # MONTHS WITHOUT A (COMPATIBLE) SKETCH ARE READ RAW: CACHED BEFORE SKETCHES EXISTED OR NOT
+                        # REFRESHED YET AFTER A WRITE.
+                        cached_month = None if month is None else cached.get(month[0])
+                        if cached_month is None or not all(
+                            s.compatible(getattr(cached_month, v))
+                            for s, v in zip(sketches, SKETCH_VARIABLES)
+                        ):
+                            batch = await self._read_batch(
+                                db, part_0, part_f, station_id
+                            )
+                            n_raw_points += len(batch)
+                            n += len(batch)
+                            for sketch, v in zip(sketches, SKETCH_VARIABLES):
+                                sketch.update(getattr(batch, v))
+                            if first_fhora is None and len(batch) > 0:
+                                first_fhora = datetime.fromtimestamp(
+                                    batch.fhora[0], UTC
+                                )
+                            continue
+
+                        # MONTH SKETCH MINUS THE RAW POINTS OF THE MONTH OUTSIDE THE PART.
+                        n += cached_month.n
+                        for sketch, v in zip(sketches, SKETCH_VARIABLES):
+                            sketch.merge(getattr(cached_month, v))
+                        for out_0, out_f in ((month[0], part_0), (part_f, month[1])):
+                            if out_0 >= out_f:
+                                continue
+                            batch = await self._read_batch(db, out_0, out_f, station_id)
+                            n_raw_points += len(batch)
+                            n -= len(batch)
+                            for sketch, v in zip(sketches, SKETCH_VARIABLES):
+                                batch_sketch = variable_sketch(v)
+                                batch_sketch.update(getattr(batch, v))
+                                sketch.subtract(batch_sketch)
+                        if first_fhora is None and part_0 == month[0]:
+                            first_fhora = cached_month.first_fhora
+                        elif first_fhora is None:
+                            first_fhora = await self._first_fhora(
+                                db, part_0, part_f, station_id
+                            )
+
+                    if n > 0 and first_fhora is not None:
+                        res.append(
+                            PointRecord(first_fhora, *(s.quantile(q) for s in sketches))
+                        )
+
+            logger.debug(
+                "Quantiles from sql sketches",
+                n_points=len(res),
+                n_months=len(cached),
+                n_raw_points=n_raw_points,
+            )
+            return res
+
+    async def _first_fhora(
+        self,
+        db: aiosqlite.Connection,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+    ) -> datetime | None:
+        "First cached date in [date_0, date_f). Single index seek"
+        params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+        }
+        async with db.execute(FETCH_FIRST_FHORA_STATEMENT, params) as cursor:
+            (first_fhora,) = await cursor.fetchone()  # type: ignore
+        return None if first_fhora is None else _parse_sql_date(first_fhora)
+
+    async def _read_batch(
+        self,
+        db: aiosqlite.Connection,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+    ) -> WeatherPointBatch:
+        "Cached points of [date_0, date_f) as a single batch"
+        params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+        }
+        async with db.execute(_FETCH_INTERVAL_STATEMENT, params) as cursor:
+            return sql_rows_to_batch(await cursor.fetchall())
+
+    async def rollups(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+        period: CalendarPeriod,
+    ) -> list[Rollup]:
+        """
+        Cached rollups of a period with bucket start in [date_0, date_f). Buckets of rollup_timezone.
+
+        Buckets only reflect cached points. Check coverage before trusting them.
+        """
+        params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+            "tz": str(self.rollup_timezone),
+            "period": period,
+        }
+
+        async with (
+            self.pool.reader() as db,
+            db.execute(FETCH_ROLLUP_STATEMENT, params) as cursor,
+        ):
+            rows = await cursor.fetchall()
+
+        logger.debug("Fetched rollups from sql", period=period, n_rollups=len(rows))
+        return list(map(parse_rollup_row, rows))
+
+    async def _read_cached(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[WeatherPointBatch]:
+        """
+        Read cached points of [date_0, date_f) in batches of read_batch_size rows.
+
+        Rows are copied straight into columns. Cached data was validated on insert so pydantic is skipped.
+        """
+        self._touch(date_0, date_f, station_id)
+        sel_params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+        }
+
+        async with (
+            self.pool.reader() as db,
+            db.execute(_FETCH_INTERVAL_STATEMENT, sel_params) as cursor,
+        ):
+            while rows := await cursor.fetchmany(self.read_batch_size):
+                logger.debug("Fetched points from sql", n_points=len(rows))
+                yield sql_rows_to_batch(rows)
+
+    async def _fetch_gap(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+    ) -> AsyncIterator[WeatherPointBatch]:
+        """
+        Fetch a gap from the network, insert it in sql and mark it as covered. Overfetched points are dropped.
+        """
+        if date_f <= date_0:
+            return
+
+        # SINGLE FLIGHT: FOLLOWERS WAIT FOR THE LEADER AND READ ITS INSERTED POINTS FROM SQL.
+        # PREFERRED OVER SHARING THE BATCHES SO THAT MEMORY STAYS BOUNDED WHILE STREAMING.
+        key = (station_id, date_0, date_f)
+        while (flight := self._gap_flights.get(key)) is not None:
+            logger.debug("Waiting for in-flight gap", d0=date_0, df=date_f)
+            if await asyncio.shield(flight):
+                async for batch in self._read_cached(date_0, date_f, station_id):
+                    yield batch
+                return
+
+        flight = asyncio.get_running_loop().create_future()
+        self._gap_flights[key] = flight
+        written: asyncio.Future[None] | None = None
+
+        try:
+            logger.debug("Fetching gap", d0=date_0, df=date_f)
+            inserts: list[asyncio.Future[None]] = []
+            async for batch in self.fetcher.timeseries_stream(
+                date_0, date_f, station_id
+            ):
+                points = self._validate_between(batch, date_0, date_f)
+                if len(points) > 0:
+                    inserts.append(await self._write(CacheWrite(station_id, points)))
+
+                yield models_to_batch(points)
+            written = await self._write(
+                CacheWrite(station_id, coverage=(date_0, date_f), requires=inserts)
+            )
+        finally:
+            # FOLLOWERS OF AN INCOMPLETE GAP (ERROR OR CONSUMER GONE) FETCH IT THEMSELVES.
+            self._land_flights({key: flight}, written)
+
+    async def _fetch_gap_many(
+        self,
+        date_0: datetime,
+        date_f: datetime,
+        stations: Sequence[str],
+    ) -> Mapping[str, WeatherPointBatch]:
+        """
+        Fetch the same gap for several stations with one fetcher call. Insert it in sql and mark it as covered.
+
+        Stations whose gap is already in flight wait for it as in _fetch_gap.
+        """
+        leaders = [s for s in stations if (s, date_0, date_f) not in self._gap_flights]
+        followers = [s for s in stations if s not in leaders]
+
+        loop = asyncio.get_running_loop()
+        flights = {(s, date_0, date_f): loop.create_future() for s in leaders}
+        self._gap_flights.update(flights)
+
+        res: dict[str, WeatherPointBatch] = {}
+        try:
+            if len(leaders) > 0:
+                logger.debug(
+                    "Fetching gap", d0=date_0, df=date_f, n_stations=len(leaders)
+                )
+                batches = await self.fetcher.timeseries_many(leaders, date_0, date_f)
+                for station_id in leaders:
+                    points = self._validate_between(batches[station_id], date_0, date_f)
+                    # POINTS AND COVERAGE IN A SINGLE WRITE: ONE TRANSACTION.
+                    written = await self._write(
+                        CacheWrite(station_id, points, coverage=(date_0, date_f))
+                    )
+                    # EACH STATION LANDS ON ITS OWN WRITE. A FAILED ONE DOESN'T COMPLETE THE OTHERS.
+                    key = (station_id, date_0, date_f)
+                    self._land_flights({key: flights.pop(key)}, written)
+                    res[station_id] = models_to_batch(points)
+        finally:
+            # STATIONS NOT WRITTEN (FETCH ERROR OR CANCELLED) ARE RELEASED AS INCOMPLETE.
+            self._land_flights(flights, None)
+
+        for station_id in followers:
+            batches = await asyncstdlib.list(
+                self._fetch_gap(date_0, date_f, station_id)
+            )
+            res[station_id] = WeatherPointBatch.concat(batches)
+
+        return res
+
+    def _validate_between(
+        self, batch: Sequence[WeatherPoint], date_0: datetime, date_f: datetime
+    ) -> Sequence[WeatherDataPoint]:
+        """
+        Validate network points. Only points in [date_0, date_f) are kept.
+        """
+        points = WeatherDataPointSeries.model_validate({"points": batch}).points
+        return find_between(points, date_0, date_f, key=operator.attrgetter("fhora"))
+
+    async def _write(self, write: CacheWrite) -> asyncio.Future[None]:
+        """
+        Queue a write for the background writer. Waits while the queue is full (backpressure on the network stream).
+
+        Written synchronously if write-behind is disabled. The returned future is done once the write is committed.
+        """
+        if self._write_queue is None:
+            await self._commit_writes([write])
+        else:
+            await self._write_queue.put(write)
+        return write.done
+
+    def _land_flights(
+        self,
+        flights: Mapping[tuple[str, datetime, datetime], asyncio.Future[bool]],
+        written: asyncio.Future[None] | None,
+    ):
+        """
+        Release in-flight gaps once their coverage is committed. Followers read them from sql then.
+
+        Gaps without committed coverage (fetch error, consumer gone or failed write) are released as incomplete.
+        """
 
-            if len(sql_res_series_tz.points) > 0:
-                sql_d0 = sql_res_series_tz.points[0].fhora
-                sql_df = sql_res_series_tz.points[-1].fhora
+        def land(written: asyncio.Future[None] | None):
+            complete = written is not None and not written.cancelled()
+            for key, flight in flights.items():
+                del self._gap_flights[key]
+                flight.set_result(complete)
 
-                insert_points = remove_gap(
-                    fetch_res_series.points,
-                    sql_d0,
-                    sql_df,
-                    key=operator.attrgetter("fhora"),
+        if written is None:
+            land(None)
+        else:
+            written.add_done_callback(land)
+
+    async def flush(self):
+        "Wait until every queued write is committed (or failed)"
+        if self._write_queue is not None:
+            await self._write_queue.join()
+
+    async def _drain_writes(self):
+        """
+        Background writer. Commits queued writes in batches of up to write_batch_size, one transaction per batch.
+
+        Runs until cancelled. Batches failed by storage errors are logged and their writes cancelled.
+        """
+        assert self._write_queue is not None
+        while True:
+            writes = [await self._write_queue.get()]
+            while len(writes) < self.write_batch_size and not self._write_queue.empty():
+                writes.append(self._write_queue.get_nowait())
+            try:
+                await self._commit_writes(writes)
+            except STORAGE_ERRORS as e:
+                logger.error(
+                    "Sql cache write failed", n_writes=len(writes), error=repr(e)
                 )
-            else:
-                insert_points = fetch_res_series.points
+            finally:
+                for _ in writes:
+                    self._write_queue.task_done()
+
+    async def _commit_writes(self, writes: Sequence[CacheWrite]):
+        """
+        Insert the points and coverage of several writes in a single transaction.
 
-            insert_stmt = insert_statement_gen(insert_points, station_id)
+        Points overwrite cached ones and the rollups of their buckets are recomputed.
+        Coverage is only merged if the point writes it requires were committed.
 
-            # LOG
-            async with aiosqlite.connect(self.sqlite_uri) as db:
-                await db.execute(insert_stmt)
+        The sketches of the written months are recomputed after the commit, so the write lock isn't held meanwhile.
+        """
+        stale: set[tuple[str, str]] = set()
+        try:
+            async with self.pool.writer() as db:
+                # WRITE LOCK BEFORE READING SO THAT MERGES FROM OTHER PROCESSES DON'T LOSE INTERVALS.
+                await db.execute("BEGIN IMMEDIATE")
+                # COVERAGE WRITES WHOSE POINTS WERE LOST. NOT MERGED.
+                unmet: list[CacheWrite] = []
+                for write in writes:
+                    if len(write.points) > 0:
+                        stale |= await self._insert_points(
+                            db, write.points, write.station_id
+                        )
+                    if write.coverage is None:
+                        continue
+                    # PENDING REQUIREMENTS ARE PART OF THIS TRANSACTION.
+                    if any(f.cancelled() for f in write.requires):
+                        unmet.append(write)
+                    else:
+                        await self._merge_coverage(
+                            db, *write.coverage, write.station_id
+                        )
                 await db.commit()
-            logger.debug(
-                "Point insert complete",
-                n_points=len(fetch_res_series.points),
+                # UNDER THE WRITE LOCK, SO A REFRESH CHECKING ITS VERSION UNDER IT CAN'T MISS THIS WRITE.
+                for key in stale:
+                    self._sketch_versions[key] = next(self._sketch_invalidations)
+        except BaseException:
+            # FAILED WRITES ARE CANCELLED: COVERAGE AND FOLLOWERS DEPENDING ON THEM TREAT THEM AS MISSING.
+            for write in writes:
+                write.done.cancel()
+            raise
+
+        # UNMET COVERAGE IS CANCELLED TOO: FOLLOWERS WAITING FOR IT FETCH THE GAP THEMSELVES.
+        for write in unmet:
+            write.done.cancel()
+        for write in writes:
+            if not write.done.done():
+                write.done.set_result(None)
+        logger.debug(
+            "Cache writes committed",
+            n_writes=len(writes),
+            n_points=sum(len(w.points) for w in writes),
+        )
+        await self._refresh_sketches(stale)
+
+    async def _insert_points(
+        self,
+        db: aiosqlite.Connection,
+        points: Sequence[WeatherDataPoint],
+        station_id: str,
+    ) -> set[tuple[str, str]]:
+        """
+        Include network points in the database. Already cached points are overwritten.
+
+        Rollups of the affected buckets are recomputed in the same transaction. The sketches of the months with points
+        are deleted (reads use the raw points meanwhile) and returned by (station, sql month) to be refreshed.
+        """
+        fhora_0 = min(p.fhora for p in points)
+        fhora_f = max(p.fhora for p in points)
+        self._touch(fhora_0, next_month(fhora_f.astimezone(UTC)), station_id)
+
+        await db.executemany(_INSERT_STATEMENT, insert_rows_gen(points, station_id))
+        date_0, date_f = rollup_refresh_range(fhora_0, fhora_f, self.rollup_timezone)
+        for period in ROLLUP_PERIODS:
+            await db.execute(
+                REFRESH_ROLLUP_STATEMENT,
+                {
+                    "station_id": station_id,
+                    "tz": str(self.rollup_timezone),
+                    "period": period,
+                    "buckets": rollup_buckets_param(
+                        date_0, date_f, period, self.rollup_timezone
+                    ),
+                },
             )
 
-        if len(fetch_res_series.points) > 0:
-            await insert_missing_data()
+        months = {month_floor(p.fhora.astimezone(UTC)) for p in points}
+        for month in sorted(months):
+            await db.execute(
+                DELETE_MONTH_SKETCH_STATEMENT,
+                {
+                    "station_id": station_id,
+                    "date_0": _sql_date(month),
+                    "date_f": _sql_date(next_month(month)),
+                },
+            )
+        return {(station_id, _sql_date(month)) for month in months}
 
-        logger.info(
-            "Sql cache return",
-            sql_points=len(sql_res_series_tz.points),
-            fetch_points=len(fetch_res_series.points),
+    async def _refresh_sketches(self, months: Iterable[tuple[str, str]]):
+        """
+        Recompute the sketches of (station, sql month) pairs from their raw points.
+
+        Points are read and sketched without the write lock, which is only held to upsert. A sketch invalidated by a
+        write meanwhile is discarded: that write refreshes it. Failures are logged, the month is read raw until then.
+        """
+        for key in sorted(months):
+            station_id, month = key
+            version = self._sketch_versions.get(key)
+            # ALREADY REFRESHED AFTER THE WRITE (OR EVICTED).
+            if version is None:
+                continue
+            month_0 = _parse_sql_date(month)
+            try:
+                async with self.pool.reader() as db:
+                    batch = await self._read_batch(
+                        db, month_0, next_month(month_0), station_id
+                    )
+                if len(batch) == 0:
+                    if self._sketch_versions.get(key) == version:
+                        del self._sketch_versions[key]
+                    continue
+
+                sketches = list(map(variable_sketch, SKETCH_VARIABLES))
+                for sketch, v in zip(sketches, SKETCH_VARIABLES):
+                    sketch.update(getattr(batch, v))
+                first_fhora = datetime.fromtimestamp(batch.fhora[0], UTC)
+                async with self.pool.writer() as db:
+                    if self._sketch_versions.get(key) != version:
+                        continue
+                    await db.execute(
+                        UPSERT_SKETCH_STATEMENT,
+                        sketch_params(
+                            station_id,
+                            month,
+                            len(batch),
+                            _sql_date(first_fhora),
+                            sketches,
+                        ),
+                    )
+                    await db.commit()
+                    del self._sketch_versions[key]
+            except aiosqlite.Error as e:
+                logger.warning(
+                    "Sketch refresh failed",
+                    station_id=station_id,
+                    month=month,
+                    error=repr(e),
+                )
+
+    async def _merge_coverage(
+        self,
+        db: aiosqlite.Connection,
+        date_0: datetime,
+        date_f: datetime,
+        station_id: str,
+    ):
+        """
+        Mark [date_0, date_f) as fetched. Overlapping and adjacent intervals are merged. Unsettled recent data is left uncovered.
+        """
+        date_f = min(date_f, datetime.now(UTC) - self.coverage_settle)
+        if date_f <= date_0:
+            return
+
+        params = {
+            "date_0": _sql_date(date_0),
+            "date_f": _sql_date(date_f),
+            "station_id": station_id,
+        }
+
+        async with db.execute(_FETCH_TOUCHING_COVERAGE_STATEMENT, params) as cursor:
+            touching_0, touching_f = await cursor.fetchone()  # type: ignore
+        merged = dict(params)
+        if touching_0 is not None:
+            merged["date_0"] = min(params["date_0"], touching_0)
+            merged["date_f"] = max(params["date_f"], touching_f)
+        await db.execute(_DELETE_TOUCHING_COVERAGE_STATEMENT, params)
+        await db.execute(_INSERT_COVERAGE_STATEMENT, merged)
+
+        logger.debug(
+            "Coverage update complete", d0=merged["date_0"], df=merged["date_f"]
         )
 
-        return [
-            *sql_res_series_tz.points,
-            *fetch_res_series.points,
+    def _touch(self, date_0: datetime, date_f: datetime, station_id: str):
+        "Record an access to the months overlapping [date_0, date_f)"
+        now = time.time()
+        for month in month_starts(date_0, date_f)[:-1]:
+            self._accessed[(station_id, _sql_date(month))] = now
+
+    @asynccontextmanager
+    async def _pin_months(
+        self, date_0: datetime, date_f: datetime, stations: Sequence[str]
+    ) -> AsyncIterator[None]:
+        """
+        Keep the months overlapping [date_0, date_f) from being evicted between a coverage check and the reads after it.
+
+        Waits for the evictions of those months already started. Their coverage is gone once they are committed.
+        """
+        months = [
+            (station_id, _sql_date(month))
+            for station_id in stations
+            for month in month_starts(date_0, date_f)[:-1]
+        ]
+        while evicting := [e for m in months if (e := self._evicting.get(m))]:
+            await evicting[0].wait()
+        # NO AWAIT BETWEEN THE CHECK AND THE PIN: _evict_month SEES IT.
+        self._read_pins.update(months)
+        try:
+            yield
+        finally:
+            self._read_pins.subtract(months)
+            self._read_pins += Counter()  # DROP THE ZEROS.
+
+    def _pinned_months(self) -> set[tuple[str, str]]:
+        "Months being read or of in-flight gaps (their points may be inserted before their coverage)"
+        return set(self._read_pins) | {
+            (station_id, _sql_date(month))
+            for station_id, date_0, date_f in self._gap_flights
+            for month in month_starts(date_0, date_f)[:-1]
+        }
+
+    async def maintain(self) -> list[EvictionCandidate]:
+        """
+        Single maintenance pass: record accesses, evict least recently used months over the retention limits and compact.
+
+        Evicted months lose their points, rollups and coverage. They are fetched again on the next request.
+        Every step is a short write transaction. WAL readers are never blocked.
+        """
+        accessed, self._accessed = self._accessed, {}
+        async with self.pool.writer() as db:
+            await db.executemany(
+                UPSERT_ACCESS_STATEMENT,
+                ((station, month, t) for (station, month), t in accessed.items()),
+            )
+            await db.execute(BACKFILL_ACCESS_STATEMENT)
+            await db.commit()
+
+        async with self.pool.reader() as db:
+            async with db.execute(FETCH_EVICTION_CANDIDATES_STATEMENT) as cursor:
+                candidates = [
+                    EvictionCandidate(*row) for row in await cursor.fetchall()
+                ]
+            async with db.execute(USED_BYTES_STATEMENT) as cursor:
+                (used_bytes,) = await cursor.fetchone()  # type: ignore
+
+        evictions = plan_evictions(
+            candidates, self.retention, used_bytes, pinned=self._pinned_months()
+        )
+        # MONTHS PINNED SINCE THE PLAN ARE SKIPPED.
+        evictions = [
+            eviction
+            for eviction in evictions
+            if await self._evict_month(eviction.station, eviction.month)
         ]
 
+        await self._compact()
+        logger.info(
+            "Sql cache maintenance complete",
+            n_months=len(candidates),
+            n_rows=sum(c.n for c in candidates),
+            used_bytes=used_bytes,
+            evicted_months=len(evictions),
+            evicted_rows=sum(c.n for c in evictions),
+        )
+        return evictions
+
+    async def run_maintenance(self, interval: float):
+        "Call maintain every interval seconds. Runs until cancelled. Storage errors are logged"
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.maintain()
+            except STORAGE_ERRORS as e:
+                logger.error("Sql cache maintenance failed", error=repr(e))
+
+    async def _evict_month(self, station_id: str, month: str) -> bool:
+        """
+        Delete the points, rollups, sketches and access of a month. Coverage intervals are split around it.
+
+        False (nothing deleted) if the month is pinned. Reads starting meanwhile wait for the eviction to commit.
+        """
+        key = (station_id, month)
+        if key in self._pinned_months():
+            return False
+        evicted = self._evicting[key] = asyncio.Event()
+        try:
+            await self._delete_month(station_id, month)
+        finally:
+            del self._evicting[key]
+            evicted.set()
+        return True
+
+    async def _delete_month(self, station_id: str, month: str):
+        "Single transaction of _evict_month"
+        params = {
+            "station_id": station_id,
+            "date_0": month,
+            "date_f": _sql_date(next_month(_parse_sql_date(month))),
+        }
+
+        async with self.pool.writer() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute(_FETCH_COVERAGE_STATEMENT, params) as cursor:
+                covered = await cursor.fetchall()
+            for cov_0, cov_f in covered:
+                await db.execute(
+                    _DELETE_COVERAGE_STATEMENT,
+                    {"station_id": station_id, "date_0": cov_0},
+                )
+                for rest_0, rest_f in (
+                    (cov_0, params["date_0"]),
+                    (params["date_f"], cov_f),
+                ):
+                    if rest_0 < rest_f:
+                        await db.execute(
+                            _INSERT_COVERAGE_STATEMENT,
+                            {
+                                "station_id": station_id,
+                                "date_0": rest_0,
+                                "date_f": rest_f,
+                            },
+                        )
+            await db.execute(DELETE_MONTH_POINTS_STATEMENT, params)
+            await db.execute(DELETE_ROLLUPS_STATEMENT, params)
+            await db.execute(DELETE_MONTH_SKETCH_STATEMENT, params)
+            await db.execute(DELETE_MONTH_ACCESS_STATEMENT, params)
+            await db.commit()
+            # REFRESHES STARTED BEFORE THE EVICTION MUST NOT BRING ITS SKETCH BACK.
+            self._sketch_versions.pop((station_id, month), None)
+
+        logger.debug("Month evicted", station_id=station_id, month=month)
+
+    async def _compact(self):
+        """
+        Online compaction. Returns free pages to the filesystem, refreshes planner statistics and checkpoints the WAL.
+
+        No full VACUUM: it rewrites the whole file. The passive checkpoint never waits for readers.
+        """
+        async with self.pool.writer() as db:
+            # EVERY STEP OF THE PRAGMA FREES PAGES. CONSUME IT WHOLE.
+            async with db.execute(
+                f"PRAGMA incremental_vacuum({int(self.retention.vacuum_pages)});"
+            ) as cursor:
+                await cursor.fetchall()
+            await db.execute("PRAGMA optimize;")
+            await db.commit()
+            async with db.execute("PRAGMA wal_checkpoint(PASSIVE);") as cursor:
+                await cursor.fetchall()
+
 
 async def sqlite_cache_fetcher_proxy_factory(
-    fetcher: WeatherDataFetcher[WeatherPoint], sqlite_uri: str
+    fetcher: WeatherDataFetcher[WeatherPoint],
+    sqlite_uri: str,
+    n_readers: int = 4,
+    retention: RetentionPolicy | None = None,
+    maintenance_interval: float | None = None,
+    write_queue_size: int = 16,
+    rollup_timezone: tzinfo = UTC,
 ) -> SqliteCacheFetcherProxy:
     """
-    Creates table if it doesn't exist already.
+    Opens the connection pool. Creates tables if they don't exist already.
+
+    Starts periodic maintenance (retention and compaction) every maintenance_interval seconds unless None.
+    No size limits if retention is None.
+    Writes go through a background writer with at most write_queue_size pending writes. Synchronous writes if 0.
+    Rollups are bucketed in rollup_timezone. It should be the results timezone for aggregations to use them.
+    Release connections with aclose.
     """
     logger.info("Creating sql proxy for fetcher")
-    async with aiosqlite.connect(sqlite_uri) as db:
+    pool = SqlitePool(sqlite_uri, n_readers=n_readers)
+    await pool.open()
+    async with pool.writer() as db:
         await db.executescript(_CREATE_TABLE_STATEMENT)
-    return SqliteCacheFetcherProxy(fetcher=fetcher, sqlite_uri=sqlite_uri)
+        await db.executescript(CREATE_ROLLUP_TABLE_STATEMENT)
+        await db.executescript(CREATE_SKETCH_TABLE_STATEMENT)
+        await db.executescript(CREATE_ACCESS_TABLE_STATEMENT)
+    proxy = SqliteCacheFetcherProxy(
+        fetcher=fetcher,
+        pool=pool,
+        retention=retention or RetentionPolicy(),
+        rollup_timezone=rollup_timezone,
+    )
+    if write_queue_size > 0:
+        proxy.start_write_behind(write_queue_size)
+    if maintenance_interval is not None:
+        proxy._maintenance_task = asyncio.create_task(
+            proxy.run_maintenance(maintenance_interval)
+        )
+    return proxy
@@ -0,0 +1,151 @@
+"""
+Retention of the sql cache. Access tracking, eviction planning and compaction statements.
+
+The eviction unit is a (station, UTC calendar month): what gets re-fetched upstream on a miss. Cached months and their
+points are counted from the datapoints themselves, never from derived tables (rollups and sketches may be missing).
+"""
+
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from typing import NamedTuple
+
+CREATE_ACCESS_TABLE_STATEMENT = """
+CREATE TABLE IF NOT EXISTS access(
+    station VARCHAR,
+    month DATETIME,
+    last_access FLOAT,
+    PRIMARY KEY(station, month)
+);
+""".strip()
+
+"Record month accesses. Parameters: (station, month, last_access)"
+UPSERT_ACCESS_STATEMENT = """
+INSERT INTO access (station, month, last_access)
+VALUES (?, ?, ?)
+ON CONFLICT(station, month) DO UPDATE SET
+    last_access = max(last_access, excluded.last_access);
+""".strip()
+
+"UTC month (sql date of its first day) of a datapoint"
+_MONTH_EXPRESSION = "strftime('%Y-%m-01 00:00:00', fhora)"
+
+"Cached months never accessed since tracking started (older databases) are the least recently used"
+BACKFILL_ACCESS_STATEMENT = f"""
+INSERT OR IGNORE INTO access (station, month, last_access)
+SELECT DISTINCT station, {_MONTH_EXPRESSION}, 0
+FROM datapoints;
+""".strip()
+
+"Cached months with their number of points, least recently used first"
+FETCH_EVICTION_CANDIDATES_STATEMENT = f"""
+WITH months AS (
+    SELECT station, {_MONTH_EXPRESSION} AS month, count(*) AS n
+    FROM datapoints
+    GROUP BY station, month
+)
+SELECT
+    months.station,
+    months.month,
+    months.n
+FROM months
+LEFT JOIN access ON
+    access.station == months.station
+    and access.month == months.month
+ORDER BY coalesce(access.last_access, 0), months.month;
+""".strip()
+
+"Parameters of the month statements: station_id, date_0 and date_f (month start and next month start)"
+DELETE_MONTH_POINTS_STATEMENT = """
+DELETE FROM datapoints
+WHERE
+    station == :station_id
+    and fhora >= :date_0
+    and fhora < :date_f;
+""".strip()
+
+DELETE_MONTH_ACCESS_STATEMENT = """
+DELETE FROM access
+WHERE
+    station == :station_id
+    and month == :date_0;
+""".strip()
+
+"Used database bytes. Free pages are excluded: they are reused before the file grows"
+USED_BYTES_STATEMENT = """
+SELECT (page_count - freelist_count) * page_size
+FROM pragma_page_count(), pragma_freelist_count(), pragma_page_size();
+""".strip()
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    Size limits of the sql cache. None disables a limit.
+
+    Least recently accessed months are evicted first until every limit holds.
+    """
+
+    "Max cached points of the whole database"
+    max_rows: int | None = None
+
+    "Max cached points of each station"
+    max_station_rows: int | None = None
+
+    "Max used bytes of the database file (free pages excluded)"
+    max_bytes: int | None = None
+
+    "Free pages returned to the filesystem per maintenance pass. Requires auto_vacuum = INCREMENTAL"
+    vacuum_pages: int = 4096
+
+
+class EvictionCandidate(NamedTuple):
+    "Cached station month. Month is the sql date of its first day"
+
+    station: str
+    month: str
+    n: int
+
+
+def plan_evictions(
+    candidates: Sequence[EvictionCandidate],
+    policy: RetentionPolicy,
+    used_bytes: int = 0,
+    pinned: Iterable[tuple[str, str]] = (),
+) -> list[EvictionCandidate]:
+    """
+    Months to evict so that the policy holds. Candidates must be sorted least recently used first.
+
+    The byte budget is turned into a row budget with the current mean bytes per row. Pinned (station, month) pairs
+    (i.e. being fetched) are never evicted.
+    """
+    pinned = set(pinned)
+    evictable = [c for c in candidates if (c.station, c.month) not in pinned]
+    evicted: dict[tuple[str, str], EvictionCandidate] = {}
+
+    if policy.max_station_rows is not None:
+        station_rows: defaultdict[str, int] = defaultdict(int)
+        for c in candidates:
+            station_rows[c.station] += c.n
+        for c in evictable:
+            if station_rows[c.station] > policy.max_station_rows:
+                evicted[(c.station, c.month)] = c
+                station_rows[c.station] -= c.n
+
+    total_rows = sum(c.n for c in candidates)
+    row_budgets: list[float] = []
+    if policy.max_rows is not None:
+        row_budgets.append(policy.max_rows)
+    if policy.max_bytes is not None and total_rows > 0 and used_bytes > 0:
+        row_budgets.append(policy.max_bytes / (used_bytes / total_rows))
+
+    if len(row_budgets) > 0:
+        rows = total_rows - sum(c.n for c in evicted.values())
+        for c in evictable:
+            if rows <= min(row_budgets):
+                break
+            if (c.station, c.month) not in evicted:
+                evicted[(c.station, c.month)] = c
+                rows -= c.n
+
+    return list(evicted.values())
@@ -0,0 +1,283 @@
+"""
+Rollup tables of the sql cache. Mergeable aggregation state per station, period and calendar bucket.
+
+Buckets follow the calendar of a timezone (the results one), so that they are the buckets of the aggregations.
+Bucket bounds are computed in python and passed as a json array, as in the aggregation push-down.
+"""
+
+import json
+from collections.abc import Sequence
+from datetime import UTC, datetime, tzinfo
+from itertools import pairwise
+from typing import NamedTuple
+
+from aemetAntartica.aggregator.bucketing import (
+    CalendarPeriod,
+    bucket_floor,
+    bucket_starts,
+    next_bucket,
+)
+from aemetAntartica.fetcher.annot import SqlAggType
+
+from .batch import PointRecord
+
+"Rolled up calendar periods"
+ROLLUP_PERIODS: Sequence[CalendarPeriod] = ("hour", "day", "month")
+
+"Numeric columns of datapoints that are rolled up"
+ROLLUP_VARIABLES = ("temp", "pres", "vel")
+
+_VARIABLE_STATS = ("count", "sum", "min", "max", "first", "last")
+
+_SQL_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class VariableRollup(NamedTuple):
+    """
+    Aggregation state of a variable in a bucket. Nan values are excluded from count, sum, min and max.
+    """
+
+    count: int
+    sum: float
+    min: float
+    max: float
+    "Value of the first point of the bucket. May be nan"
+    first: float
+    "Value of the last point of the bucket. May be nan"
+    last: float
+
+    @property
+    def mean(self) -> float:
+        "Mean ignoring nan. 0 if there are no values (same as calc_mean)"
+        if self.count == 0:
+            return 0
+        return self.sum / self.count
+
+
+class Rollup(NamedTuple):
+    "Aggregation state of a calendar bucket of raw points"
+
+    "UTC start of the bucket"
+    bucket: datetime
+    "Number of raw points"
+    n: int
+    first_fhora: datetime
+    last_fhora: datetime
+    temp: VariableRollup
+    pres: VariableRollup
+    vel: VariableRollup
+
+
+def _rollup_columns() -> list[str]:
+    return [f"{v}_{s}" for v in ROLLUP_VARIABLES for s in _VARIABLE_STATS]
+
+
+CREATE_ROLLUP_TABLE_STATEMENT = f"""
+CREATE TABLE IF NOT EXISTS rollups(
+    station VARCHAR,
+    tz VARCHAR,
+    period VARCHAR,
+    bucket DATETIME,
+    n INTEGER,
+    first_fhora DATETIME,
+    last_fhora DATETIME,
+    {",\n    ".join(f"{c} FLOAT" for c in _rollup_columns())},
+    PRIMARY KEY(station, tz, period, bucket)
+);
+""".strip()
+
+
+def _numeric(v: str) -> str:
+    "Nan is stored as text. Exclude it from aggregations"
+    return f"CASE WHEN typeof({v}) IN ('integer', 'real') THEN {v} END"
+
+
+_AGG_COLUMNS = ",\n        ".join(
+    f"{agg}({_numeric(v)}) AS {v}_{agg}"
+    for v in ROLLUP_VARIABLES
+    for agg in ("count", "sum", "min", "max")
+)
+
+"""Recompute every non empty bucket of a period. One index range scan per bucket.
+
+Parameters: station_id, tz, period and buckets (json array of [start, end] sql dates).
+"""
+REFRESH_ROLLUP_STATEMENT = f"""
+WITH buckets AS (
+    SELECT
+        value ->> 0 AS bucket_0,
+        value ->> 1 AS bucket_f
+    FROM json_each(:buckets)
+),
+points AS (
+    SELECT
+        datapoints.fhora,
+        datapoints.temp,
+        datapoints.pres,
+        datapoints.vel,
+        buckets.bucket_0 AS bucket
+    FROM buckets
+    JOIN datapoints ON
+        datapoints.station == :station_id
+        and datapoints.fhora >= buckets.bucket_0
+        and datapoints.fhora < buckets.bucket_f
+),
+agg AS (
+    SELECT
+        bucket,
+        count(*) AS n,
+        min(fhora) AS first_fhora,
+        max(fhora) AS last_fhora,
+        {_AGG_COLUMNS}
+    FROM points
+    GROUP BY bucket
+)
+INSERT OR REPLACE INTO rollups (
+    station,
+    tz,
+    period,
+    bucket,
+    n,
+    first_fhora,
+    last_fhora,
+    {",\n    ".join(_rollup_columns())}
+)
+SELECT
+    :station_id,
+    :tz,
+    :period,
+    agg.bucket,
+    agg.n,
+    agg.first_fhora,
+    agg.last_fhora,
+    {
+    ",\n    ".join(
+        f"f.{v}" if s == "first" else f"l.{v}" if s == "last" else f"agg.{v}_{s}"
+        for v in ROLLUP_VARIABLES
+        for s in _VARIABLE_STATS
+    )
+}
+FROM agg
+JOIN points AS f ON f.fhora == agg.first_fhora
+JOIN points AS l ON l.fhora == agg.last_fhora;
+""".strip()
+
+"Rollups of a period with bucket start in [date_0, date_f). Parameters: station_id, tz, period, date_0 and date_f"
+FETCH_ROLLUP_STATEMENT = f"""
+SELECT
+    bucket,
+    n,
+    first_fhora,
+    last_fhora,
+    {",\n    ".join(_rollup_columns())}
+FROM rollups
+WHERE
+    station == :station_id
+    and tz == :tz
+    and period == :period
+    and bucket >= :date_0
+    and bucket < :date_f
+ORDER BY bucket;
+""".strip()
+
+"Number of cached points in [date_0, date_f). Parameters: station_id, date_0 and date_f"
+COUNT_POINTS_STATEMENT = """
+SELECT count(*)
+FROM datapoints
+WHERE
+    station == :station_id
+    and fhora >= :date_0
+    and fhora < :date_f;
+""".strip()
+
+"Buckets (of any timezone and period) holding points of [date_0, date_f). Parameters: station_id, date_0 and date_f"
+DELETE_ROLLUPS_STATEMENT = """
+DELETE FROM rollups
+WHERE
+    station == :station_id
+    and first_fhora < :date_f
+    and last_fhora >= :date_0;
+""".strip()
+
+
+def _parse_date(d: str) -> datetime:
+    return datetime.strptime(d, _SQL_DATE_FORMAT).replace(tzinfo=UTC)
+
+
+def _parse_float(v: float | str | None) -> float:
+    "Nulls (no values) and nan text are read as nan"
+    return float("nan") if v is None else float(v)
+
+
+def parse_rollup_row(row: tuple) -> Rollup:
+    "Rollup from a FETCH_ROLLUP_STATEMENT row"
+    bucket, n, first_fhora, last_fhora, *stats = row
+    n_stats = len(_VARIABLE_STATS)
+
+    def variable(i: int) -> VariableRollup:
+        count, sum_, *rest = stats[i * n_stats : (i + 1) * n_stats]
+        return VariableRollup(
+            int(count), 0.0 if sum_ is None else sum_, *map(_parse_float, rest)
+        )
+
+    return Rollup(
+        _parse_date(bucket),
+        n,
+        _parse_date(first_fhora),
+        _parse_date(last_fhora),
+        *map(variable, range(len(ROLLUP_VARIABLES))),
+    )
+
+
+def rollup_refresh_range(
+    date_0: datetime, date_f: datetime, tz: tzinfo
+) -> tuple[datetime, datetime]:
+    """
+    Raw points interval whose buckets (of any period) must be refreshed after inserting points in [date_0, date_f].
+
+    Expanded to whole months of tz since monthly buckets are the widest.
+    """
+    return bucket_floor(date_0, "month", tz), next_bucket(
+        bucket_floor(date_f, "month", tz), "month"
+    )
+
+
+def rollup_buckets_param(
+    date_0: datetime, date_f: datetime, period: CalendarPeriod, tz: tzinfo
+) -> str:
+    "Json buckets of a period in [date_0, date_f) for REFRESH_ROLLUP_STATEMENT. Bounds must be buckets starts"
+    return json.dumps(
+        [
+            [_sql_date(b0), _sql_date(bf)]
+            for b0, bf in pairwise(bucket_starts(date_0, date_f, period, tz))
+        ]
+    )
+
+
+def rollup_period(buckets: Sequence[datetime], tz: tzinfo) -> CalendarPeriod | None:
+    "Period whose consecutive buckets in tz are exactly buckets. None if none is (i.e. other timezone)"
+    for period in ROLLUP_PERIODS:
+        if bucket_starts(buckets[0], buckets[-1], period, tz) == list(buckets):
+            return period
+    return None
+
+
+def rollup_record(rollup: Rollup, agg: SqlAggType) -> PointRecord:
+    "Aggregated point of a bucket. Same as the aggregation push-down over its raw points"
+    if agg == "first":
+        return PointRecord(
+            rollup.first_fhora, rollup.temp.first, rollup.pres.first, rollup.vel.first
+        )
+    if agg == "last":
+        return PointRecord(
+            rollup.last_fhora, rollup.temp.last, rollup.pres.last, rollup.vel.last
+        )
+    if agg == "mean":
+        return PointRecord(
+            rollup.first_fhora, rollup.temp.mean, rollup.pres.mean, rollup.vel.mean
+        )
+    raise ValueError(f"Unfeasible rollup aggregation {agg}")
+
+
+def _sql_date(d: datetime) -> str:
+    return d.astimezone(UTC).strftime(_SQL_DATE_FORMAT)
@@ -0,0 +1,136 @@
+"""
+Quantile sketch table of the sql cache. Mergeable quantile sketches per station and UTC calendar month.
+
+Any range is answered by merging the sketches of the months inside it. Only the hours of months partially inside the
+range are read raw (added, or subtracted from the month sketch if most of the month is inside).
+"""
+
+import json
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from itertools import pairwise
+from typing import NamedTuple
+
+from aemetAntartica.aggregator.sketch import QuantileSketch
+from aemetAntartica.util.datetime import month_starts
+
+"Numeric columns of datapoints that are sketched"
+SKETCH_VARIABLES = ("temp", "pres", "vel")
+
+_SQL_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+CREATE_SKETCH_TABLE_STATEMENT = f"""
+CREATE TABLE IF NOT EXISTS sketches(
+    station VARCHAR,
+    month DATETIME,
+    n INTEGER,
+    first_fhora DATETIME,
+    {",\n    ".join(f"{v} TEXT" for v in SKETCH_VARIABLES)},
+    PRIMARY KEY(station, month)
+);
+""".strip()
+
+"Parameters: station_id, month, n, first_fhora and a json sketch per variable"
+UPSERT_SKETCH_STATEMENT = f"""
+INSERT OR REPLACE INTO sketches (station, month, n, first_fhora, {", ".join(SKETCH_VARIABLES)})
+VALUES (:station_id, :month, :n, :first_fhora, {", ".join(f":{v}" for v in SKETCH_VARIABLES)});
+""".strip()
+
+"Sketches of the months starting in [date_0, date_f). Parameters: station_id, date_0 and date_f"
+FETCH_SKETCH_STATEMENT = f"""
+SELECT
+    month,
+    n,
+    first_fhora,
+    {",\n    ".join(SKETCH_VARIABLES)}
+FROM sketches
+WHERE
+    station == :station_id
+    and month >= :date_0
+    and month < :date_f
+ORDER BY month;
+""".strip()
+
+"First cached date in [date_0, date_f). Parameters: station_id, date_0 and date_f"
+FETCH_FIRST_FHORA_STATEMENT = """
+SELECT min(fhora)
+FROM datapoints
+WHERE
+    station == :station_id
+    and fhora >= :date_0
+    and fhora < :date_f;
+""".strip()
+
+"Parameters of the month statements: station_id, date_0 and date_f (month start and next month start)"
+DELETE_MONTH_SKETCH_STATEMENT = """
+DELETE FROM sketches
+WHERE
+    station == :station_id
+    and month >= :date_0
+    and month < :date_f;
+""".strip()
+
+
+class MonthSketch(NamedTuple):
+    "Quantile sketches of the points of a month"
+
+    month: datetime
+    "Number of raw points"
+    n: int
+    first_fhora: datetime
+    temp: QuantileSketch
+    pres: QuantileSketch
+    vel: QuantileSketch
+
+
+def _parse_date(d: str) -> datetime:
+    return datetime.strptime(d, _SQL_DATE_FORMAT).replace(tzinfo=UTC)
+
+
+def parse_sketch_row(row: tuple) -> MonthSketch:
+    "Month sketch from a FETCH_SKETCH_STATEMENT row"
+    month, n, first_fhora, *sketches = row
+    return MonthSketch(
+        _parse_date(month),
+        n,
+        _parse_date(first_fhora),
+        *(QuantileSketch.from_dict(json.loads(s)) for s in sketches),
+    )
+
+
+def sketch_params(
+    station_id: str,
+    month: str,
+    n: int,
+    first_fhora: str,
+    sketches: Sequence[QuantileSketch],
+) -> dict[str, str | int]:
+    "Parameters of UPSERT_SKETCH_STATEMENT. One sketch per variable, in SKETCH_VARIABLES order"
+    return {
+        "station_id": station_id,
+        "month": month,
+        "n": n,
+        "first_fhora": first_fhora,
+        **{v: json.dumps(s.to_dict()) for v, s in zip(SKETCH_VARIABLES, sketches)},
+    }
+
+
+def month_parts(
+    date_0: datetime, date_f: datetime
+) -> list[tuple[datetime, datetime, tuple[datetime, datetime] | None]]:
+    """
+    Split [date_0, date_f) in consecutive parts at UTC month starts. Each part has the UTC month [m0, m1) it is
+    derived from, None if it must be read raw.
+
+    Months mostly inside the interval are used: their sketch minus the raw points of the month outside the part.
+    A local calendar month is a UTC month shifted a few hours, so only those hours are read raw.
+    """
+    parts: list[tuple[datetime, datetime, tuple[datetime, datetime] | None]] = []
+    for m0, m1 in pairwise(month_starts(date_0, date_f)):
+        part_0, part_f = max(m0, date_0), min(m1, date_f)
+        if part_0 >= part_f:
+            continue
+        # THE RAW READ IS THE SMALLEST OF THE PART AND THE REST OF THE MONTH.
+        outside = (m1 - m0) - (part_f - part_0)
+        parts.append((part_0, part_f, (m0, m1) if outside < part_f - part_0 else None))
+    return parts
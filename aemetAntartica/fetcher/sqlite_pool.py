@@ -0,0 +1,135 @@
+"""
+Long-lived sqlite connections shared by the sql cache.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+import aiosqlite
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class SqlitePool:
+    """
+    Pool of persistent reader connections plus a single dedicated writer connection.
+
+    Every connection is configured once on open: WAL journal (readers don't block the writer and vice versa),
+    relaxed synchronous, memory mapped io, page cache and prepared statement cache.
+    Requires a file database. Each connection to ":memory:" would be a different database.
+
+    Open with open() and release with close(). Connections are threads: an unclosed pool keeps the process alive.
+    """
+
+    sqlite_uri: str
+
+    "Number of reader connections. Readers are held while a cursor is being iterated"
+    n_readers: int = 4
+
+    "Journal mode. WAL lets readers and the writer work concurrently"
+    journal_mode: str = "WAL"
+
+    "INCREMENTAL lets free pages be returned in small steps. Only applies to new databases (or after a VACUUM)"
+    auto_vacuum: str = "INCREMENTAL"
+
+    "NORMAL is safe with WAL. Only the last transactions may be lost on power failure"
+    synchronous: str = "NORMAL"
+
+    "Bytes of the database file memory mapped per connection"
+    mmap_size: int = 256 * 2**20
+
+    "Page cache per connection. Negative values are KiB"
+    cache_size: int = -64 * 2**10
+
+    "Milliseconds a connection waits on a locked database before failing"
+    busy_timeout: int = 5000
+
+    "Prepared statements cached per connection"
+    cached_statements: int = 256
+
+    _readers: asyncio.Queue[aiosqlite.Connection] = field(init=False, repr=False)
+    _writer: aiosqlite.Connection | None = field(init=False, default=None, repr=False)
+    _write_lock: asyncio.Lock = field(init=False, default_factory=asyncio.Lock)
+    _connections: list[aiosqlite.Connection] = field(
+        init=False, default_factory=list, repr=False
+    )
+
+    def __post_init__(self):
+        if self.n_readers < 1:
+            raise ValueError(f"At least one reader is required: {self.n_readers}")
+        self._readers = asyncio.Queue()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(
+            self.sqlite_uri, cached_statements=self.cached_statements
+        )
+        self._connections.append(db)
+        await db.executescript(
+            f"""
+            PRAGMA busy_timeout = {int(self.busy_timeout)};
+            PRAGMA synchronous = {self.synchronous};
+            PRAGMA mmap_size = {int(self.mmap_size)};
+            PRAGMA cache_size = {int(self.cache_size)};
+            PRAGMA temp_store = MEMORY;
+            """
+        )
+        return db
+
+    async def open(self):
+        "Open and configure every connection"
+        self._writer = await self._connect()
+        # AUTO VACUUM MUST BE SET BEFORE THE FIRST TABLE IS CREATED. IGNORED BY EXISTING DATABASES.
+        await self._writer.execute(f"PRAGMA auto_vacuum = {self.auto_vacuum};")
+        # JOURNAL MODE IS PERSISTENT. SET ONCE BY THE WRITER BEFORE READERS OPEN.
+        async with self._writer.execute(
+            f"PRAGMA journal_mode = {self.journal_mode};"
+        ) as cursor:
+            (journal_mode,) = await cursor.fetchone()  # type: ignore
+
+        for _ in range(self.n_readers):
+            reader = await self._connect()
+            await reader.execute("PRAGMA query_only = ON;")
+            self._readers.put_nowait(reader)
+
+        logger.info(
+            "Sqlite pool ready",
+            n_readers=self.n_readers,
+            journal_mode=journal_mode,
+            synchronous=self.synchronous,
+            mmap_size=self.mmap_size,
+            cache_size=self.cache_size,
+        )
+
+    async def close(self):
+        "Close every connection"
+        connections, self._connections = self._connections, []
+        for db in connections:
+            await db.close()
+        self._writer = None
+        logger.info("Sqlite pool closed")
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        "Borrow a read only connection. Waits if every reader is in use"
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        "Exclusive use of the writer connection. Uncommitted changes are rolled back on error"
+        if self._writer is None:
+            raise RuntimeError("Sqlite pool is not open")
+
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
@@ -0,0 +1,181 @@
+"""
+Background cache warm-up. Walks the full history of every station through the cached fetcher.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime, timedelta
+from itertools import pairwise
+from pathlib import Path
+
+import httpx
+import structlog
+
+from aemetAntartica.util.datetime import month_starts
+
+from .annot import WeatherDataFetcher, WeatherPoint
+from .exceptions import FetchAbandonedError
+from .rate_limit import RetryPolicy
+
+logger = structlog.get_logger(__name__)
+
+"Failures of a month fetch: upstream (http, aemet status, timeouts, bad data) or cache storage (sqlite, files)"
+WARMUP_ERRORS = (
+    httpx.HTTPError,
+    OSError,
+    TimeoutError,
+    ValueError,
+    sqlite3.Error,
+    FetchAbandonedError,
+)
+
+
+@dataclass
+class WarmupProgress:
+    "Snapshot of the warm-up state. Months are (station, month) pairs"
+
+    months_total: int = 0
+    months_done: int = 0
+    months_failed: int = 0
+    "Month being fetched as 'station YYYY-MM'. None if idle"
+    current: str | None = None
+    finished: bool = False
+
+
+@dataclass
+class CacheWarmer:
+    """
+    Fill the cache tier of fetcher with the whole history of every station, one month at a time.
+
+    Most recent months go first since those are the most requested ones. Each month waits interval seconds after
+    the previous one so interactive requests keep most of the upstream quota (the rate limiter is shared anyway).
+    Months that are not settled (may still change upstream) are skipped.
+
+    Completed months are recorded in state_path (if any) so a restarted process resumes where it stopped.
+    Failed months are retried after the rest with exponential backoff, then on the next run.
+    """
+
+    fetcher: WeatherDataFetcher[WeatherPoint]
+
+    "Seconds between consecutive month fetches"
+    interval: float = 5.0
+
+    "Json file of completed months by station. Not resumable if None"
+    state_path: Path | None = None
+
+    "Months ending after now - settle are not warmed up"
+    settle: timedelta = timedelta(days=1)
+
+    "Retry rounds of failed months. Each round waits its backoff, then retries every failed month"
+    retry_policy: RetryPolicy = field(
+        default_factory=lambda: RetryPolicy(max_retries=3, base_delay=60, max_delay=900)
+    )
+
+    "Wall clock. Injectable for testing"
+    now: Callable[[], datetime] = field(default=lambda: datetime.now(UTC))
+
+    progress: WarmupProgress = field(default_factory=WarmupProgress, init=False)
+
+    def _load_state(self) -> dict[str, list[str]]:
+        if self.state_path is None or not self.state_path.exists():
+            return {}
+        return json.loads(self.state_path.read_text())
+
+    def _save_state(self, state: dict[str, list[str]]):
+        "Atomic write. A crash never leaves a truncated state file"
+        if self.state_path is None:
+            return
+        tmp_path = self.state_path.with_name(f".{self.state_path.name}.tmp")
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, self.state_path)
+
+    async def _plan(
+        self, done: dict[str, list[str]]
+    ) -> list[tuple[str, datetime, datetime]]:
+        "Pending (station, date_0, date_f) months clipped to the station time range, most recent first"
+        settled = self.now() - self.settle
+        plan: list[tuple[str, datetime, datetime]] = []
+        for station_id in await self.fetcher.stations():
+            date_0, date_f = await self.fetcher.time_range(station_id)
+            station_done = set(done.get(station_id, []))
+            for m0, m1 in pairwise(month_starts(date_0, min(date_f, settled))):
+                if m1 <= settled and f"{m0:%Y-%m}" not in station_done:
+                    plan.append((station_id, max(m0, date_0), min(m1, date_f)))
+
+        plan.sort(key=lambda job: job[1], reverse=True)
+        return plan
+
+    async def run(self):
+        "Warm up every pending month. Runs until done or cancelled"
+        state = self._load_state()
+        try:
+            plan = await self._plan(state)
+        except WARMUP_ERRORS as e:
+            logger.error("Cache warm-up planning failed", error=repr(e))
+            return
+        self.progress = WarmupProgress(months_total=len(plan))
+        logger.info("Cache warm-up started", months_total=len(plan))
+
+        pending = plan
+        for attempt in range(self.retry_policy.max_retries + 1):
+            if len(pending) == 0:
+                break
+            if attempt > 0:
+                delay = self.retry_policy.delay(attempt - 1)
+                logger.info(
+                    "Cache warm-up retrying failed months",
+                    attempt=attempt,
+                    n_months=len(pending),
+                    delay=delay,
+                )
+                await asyncio.sleep(delay)
+
+            failed: list[tuple[str, datetime, datetime]] = []
+            for ndx, (station_id, date_0, date_f) in enumerate(pending):
+                if ndx > 0:
+                    await asyncio.sleep(self.interval)
+                if not await self._warm(station_id, date_0, date_f, state, attempt):
+                    failed.append((station_id, date_0, date_f))
+            pending = failed
+
+        # STILL FAILED MONTHS ARE RETRIED ON THE NEXT RUN.
+        self.progress.current = None
+        self.progress.finished = True
+        logger.info("Cache warm-up finished", **asdict(self.progress))
+
+    async def _warm(
+        self,
+        station_id: str,
+        date_0: datetime,
+        date_f: datetime,
+        state: dict[str, list[str]],
+        attempt: int,
+    ) -> bool:
+        "Fetch a month through the cache and record it as done. False if it failed"
+        month = f"{date_0.astimezone(UTC):%Y-%m}"
+        self.progress.current = f"{station_id} {month}"
+        try:
+            await self.fetcher.timeseries(date_0, date_f, station_id)
+        except WARMUP_ERRORS as e:
+            if attempt == 0:
+                self.progress.months_failed += 1
+            logger.warning(
+                "Cache warm-up month failed",
+                station_id=station_id,
+                month=month,
+                attempt=attempt,
+                error=repr(e),
+            )
+            return False
+
+        if attempt > 0:
+            self.progress.months_failed -= 1
+        self.progress.months_done += 1
+        state.setdefault(station_id, []).append(month)
+        self._save_state(state)
+        logger.info("Cache warm-up progress", **asdict(self.progress))
+        return True
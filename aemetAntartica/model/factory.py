@@ -14,14 +14,31 @@ from .fetch import WeatherDataPoint
 logger = structlog.get_logger()
 
 
+def result_timezone_os() -> ZoneInfo:
+    """
+    Results timezone from environment variables. Aggregation buckets follow its calendar:
+
+    - AEMET_TIMEZONE_RESULT: any timezone from. See zoneinfo.available_timzone(). (default: Europe/Madrid)
+    """
+    return ZoneInfo(environ.get("AEMET_TIMEZONE_RESULT", "Europe/Madrid"))
+
+
+def stream_aggregation_months_os() -> int:
+    """
+    Aggregations over ranges longer than this are computed online over the monthly stream (bounded memory).
+    Shorter ones fetch the whole series and aggregate it at once (vectorized if numpy is installed):
+
+    - AEMET_STREAM_AGG_MONTHS: number of months. (default: 12)
+    """
+    return int(environ.get("AEMET_STREAM_AGG_MONTHS", "12"))
+
+
 def change_series_timezone_os() -> Callable[[WeatherDataPoint], WeatherDataPoint]:
     """
     Generate datetime switcher factory from environment variables:
 
     - AEMET_TIMEZONE_RESULT: any timezone from. See zoneinfo.available_timzone(). (default: Europe/Madrid)
     """
-    zone_key = environ.get("AEMET_TIMEZONE_RESULT", "Europe/Madrid")
-
-    zi = ZoneInfo(zone_key)
-    logger.debug("Creating results timezone converter", timezone_key=zone_key)
+    zi = result_timezone_os()
+    logger.debug("Creating results timezone converter", timezone_key=zi.key)
     return set_point_timzone(zi)
@@ -10,11 +10,14 @@ from .fetch import WeatherDataPoint, WeatherDataPointSeries
 def set_point_timzone(tz: tzinfo):
     "Convenient method for changing points timezone"
 
+    # ANY OBJECT WITH THE MODEL ATTRIBUTES (I.E. TRUSTED CACHE RECORDS) IS ACCEPTED.
     def _(model: WeatherDataPoint):
-        d = model.model_dump()
-        d["fhora"] = model.fhora.astimezone(tz)
-
-        return WeatherDataPoint.model_validate(d)
+        return WeatherDataPoint(
+            fhora=model.fhora.astimezone(tz),
+            temp=model.temp,
+            pres=model.pres,
+            vel=model.vel,
+        )
 
     return _
 
@@ -0,0 +1,200 @@
+"""
+Extra asyncio-based functionality.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable, Iterable
+from functools import partial, wraps
+
+
+def _failed(task: asyncio.Task) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is not None
+
+
+async def bounded_map[T, R](
+    f: Callable[[T], Awaitable[R]], items: Iterable[T], limit: int
+) -> AsyncIterator[R]:
+    """
+    Sliding window map. Keeps up to `limit` calls in flight and starts the next one as soon as any finishes.
+
+    Results are yielded in input order. If any call fails the rest are cancelled and the exception is raised.
+    """
+    if limit < 1:
+        raise ValueError(f"Concurrency limit must be positive: limit={limit}")
+
+    sem = asyncio.Semaphore(limit)
+    any_failed = asyncio.Event()
+
+    async def run(item: T) -> R:
+        async with sem:
+            return await f(item)
+
+    def on_done(task: asyncio.Task):
+        if _failed(task):
+            any_failed.set()
+
+    tasks = [asyncio.create_task(run(item)) for item in items]
+    for task in tasks:
+        task.add_done_callback(on_done)
+
+    try:
+        for task in tasks:
+            if not task.done():
+                # WAKE UP ON THE HEAD RESULT OR ON ANY FAILURE, WHATEVER COMES FIRST.
+                failure = asyncio.ensure_future(any_failed.wait())
+                await asyncio.wait([task, failure], return_when=asyncio.FIRST_COMPLETED)
+                failure.cancel()
+
+            if not task.done():
+                raise next(filter(_failed, tasks)).exception()  # type: ignore
+
+            yield task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SingleFlight[K, V]:
+    """
+    Coalesce concurrent calls by key. Callers of a key already in flight share its result (or exception).
+
+    The shared call is shielded: a cancelled caller doesn't cancel it for the rest.
+    """
+
+    def __init__(self):
+        self._flights: dict[K, asyncio.Future[V]] = {}
+
+    def __len__(self) -> int:
+        "Number of calls in flight"
+        return len(self._flights)
+
+    async def do(self, key: K, f: Callable[[], Awaitable[V]]) -> V:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(f())
+            self._flights[key] = flight
+            flight.add_done_callback(partial(self._land, key))
+        return await asyncio.shield(flight)
+
+    def join(self, key: K) -> Awaitable[V] | None:
+        "Shielded result of the call of key in flight. None if there is none"
+        flight = self._flights.get(key)
+        return None if flight is None else asyncio.shield(flight)
+
+    def lead(self, key: K) -> asyncio.Future[V]:
+        """
+        Register a call of key resolved by the caller through the returned future. Key must not be in flight.
+
+        Useful when results come from a shared pool (i.e. a pipeline) instead of a call per key.
+        """
+        if key in self._flights:
+            raise ValueError(f"Key already in flight: {key}")
+        flight: asyncio.Future[V] = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        flight.add_done_callback(partial(self._land, key))
+        return flight
+
+    def _land(self, key: K, flight: asyncio.Future[V]):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # MARK EXCEPTION AS RETRIEVED IN CASE EVERY CALLER WAS CANCELLED.
+        if not flight.cancelled():
+            flight.exception()
+
+
+def single_flight[**P, V](
+    f: Callable[P, Awaitable[V]],
+) -> Callable[P, Awaitable[V]]:
+    """
+    Decorator. Concurrent calls with the same (hashable) arguments share one in-flight call.
+    """
+    flights: SingleFlight[Hashable, V] = SingleFlight()
+
+    @wraps(f)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> V:
+        key = (args, tuple(sorted(kwargs.items())))
+        return await flights.do(key, partial(f, *args, **kwargs))
+
+    return wrapper
+
+
+def _first_error(e: BaseException) -> BaseException:
+    "Unwrap task group exceptions"
+    while isinstance(e, BaseExceptionGroup):
+        e = e.exceptions[0]
+    return e
+
+
+async def pipeline_map[T, M, R](
+    f_1: Callable[[T], Awaitable[M]],
+    f_2: Callable[[M], Awaitable[R]],
+    items: Iterable[T],
+    limit_1: int,
+    limit_2: int,
+) -> AsyncIterator[R]:
+    """
+    Two stage map. Each stage has its own concurrency limit (limit_1 and limit_2) connected by a bounded queue.
+
+    A slow second stage doesn't hold first stage slots: the first stage slot is released before enqueueing. The queue
+    applies backpressure once limit_2 items are waiting (plus up to limit_1 + limit_2 finished first stage calls).
+    Results are yielded in input order. If any call fails the rest are cancelled and the exception is raised.
+    """
+    if limit_1 < 1 or limit_2 < 1:
+        raise ValueError(
+            f"Concurrency limits must be positive: limit_1={limit_1}, limit_2={limit_2}"
+        )
+
+    loop = asyncio.get_running_loop()
+    indexed_items = list(enumerate(items))
+    results: list[asyncio.Future[R]] = [loop.create_future() for _ in indexed_items]
+    pending = iter(indexed_items)
+    queue: asyncio.Queue[tuple[int, M] | None] = asyncio.Queue(maxsize=limit_2)
+    sem_1 = asyncio.Semaphore(limit_1)
+
+    async def stage_1():
+        # THE ITERATOR IS SHARED BY EVERY WORKER.
+        for i, item in pending:
+            async with sem_1:
+                mid = await f_1(item)
+            # A WORKER WAITING FOR QUEUE SPACE DOESN'T HOLD A FIRST STAGE SLOT.
+            await queue.put((i, mid))
+
+    async def stage_2():
+        while (job := await queue.get()) is not None:
+            i, mid = job
+            results[i].set_result(await f_2(mid))
+
+    async def run_stages():
+        async with asyncio.TaskGroup() as tg:
+            stage_1_workers = [
+                tg.create_task(stage_1()) for _ in range(limit_1 + limit_2)
+            ]
+            stage_2_workers = [tg.create_task(stage_2()) for _ in range(limit_2)]
+            await asyncio.wait(stage_1_workers)
+            for _ in stage_2_workers:
+                await queue.put(None)
+
+    def on_done(runner: asyncio.Task):
+        if runner.cancelled() or runner.exception() is None:
+            return
+        error = _first_error(runner.exception())  # type: ignore
+        for res in results:
+            if not res.done():
+                res.set_exception(error)
+
+    runner = asyncio.create_task(run_stages())
+    runner.add_done_callback(on_done)
+
+    try:
+        for res in results:
+            yield await res
+    finally:
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        for res in results:
+            if not res.done():
+                res.cancel()
+            elif not res.cancelled():
+                # MARK AS RETRIEVED. ONLY THE FIRST ERROR IS RAISED.
+                res.exception()
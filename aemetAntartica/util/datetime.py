@@ -3,7 +3,7 @@ datetime based utilities
 """
 
 from collections.abc import Iterable, Callable
-from datetime import datetime, timedelta
+from datetime import UTC, datetime, timedelta
 from functools import partial
 
 
@@ -45,3 +45,24 @@ def monthly_date_range(d0: datetime, df: datetime):
             d0_ = d0_.replace(month=d0_.month + 1)
         else:
             d0_ = d0_.replace(year=d0_.year + 1, month=1)
+
+
+def month_floor(d: datetime) -> datetime:
+    "Start of the calendar month of d. Same timezone"
+    return d.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(d: datetime) -> datetime:
+    "Start of the calendar month after the one of d. Same timezone"
+    d = month_floor(d)
+    if d.month == 12:
+        return d.replace(year=d.year + 1, month=1)
+    return d.replace(month=d.month + 1)
+
+
+def month_starts(d0: datetime, df: datetime) -> list[datetime]:
+    "UTC month starts of every month overlapping [d0, df) plus the end of the last one"
+    months = [month_floor(d0.astimezone(UTC))]
+    while months[-1] < df:
+        months.append(next_month(months[-1]))
+    return months
@@ -12,12 +12,11 @@ import pytest
 from aemetAntartica.fetcher.aemet import (
     AemetWeatherDataFetcherConcurrent,
     AemetWeatherDataFetcherNaive,
+    AemetWeatherDataFetcherPipelined,
     AemetWeatherDataFetcherSerial,
 )
-from aemetAntartica.fetcher.fetch_functions import (
-    aemet_2_step_fetch,
-    cached_aemet_2_step_fetch,
-)
+from aemetAntartica.fetcher.factory import gen_fetch_function_env_var
+from aemetAntartica.fetcher.fetch_functions import aemet_2_step_fetch
 from aemetAntartica.fetcher.static import named_station_metadata
 from aemetAntartica.util.datetime import monthly_date_range
 
@@ -142,6 +141,42 @@ async def test_concurrent_fetcher(
     )
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "date_0, date_f, station",
+    [
+        (
+            datetime.fromisoformat("2023-01-01T00:00:00+0000"),
+            datetime.fromisoformat("2023-03-01T00:00:00+0000"),
+            "Meteo Station Gabriel de Castilla",
+        ),
+        (
+            datetime.fromisoformat("2023-01-01T00:00:00+0000"),
+            datetime.fromisoformat("2023-03-01T00:00:00+0000"),
+            "Meteo Station Juan Carlos I",
+        ),
+    ],
+)
+async def test_pipelined_fetcher(
+    date_0: datetime, date_f: datetime, station: str, api_key: str
+):
+    """
+    Simple test of pipelined aemet fetcher
+    """
+
+    fetcher = AemetWeatherDataFetcherPipelined(
+        api_key=api_key,
+        stations_metadata=named_station_metadata,
+        date_generator=monthly_date_range,
+    )
+
+    await fetcher.timeseries(
+        date_0=date_0,
+        date_f=date_f,
+        station_id=station,
+    )
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "date_0, date_f, station",
@@ -169,7 +204,7 @@ async def test_serial_cached_fetcher(
         api_key=api_key,
         stations_metadata=named_station_metadata,
         date_generator=monthly_date_range,
-        fetch_function=cached_aemet_2_step_fetch,
+        fetch_function=gen_fetch_function_env_var(),
     )
 
     await fetcher.timeseries(
@@ -206,7 +241,7 @@ async def test_concurrent_cached_fetcher(
         api_key=api_key,
         stations_metadata=named_station_metadata,
         date_generator=monthly_date_range,
-        fetch_function=cached_aemet_2_step_fetch,
+        fetch_function=gen_fetch_function_env_var(),
     )
 
     await fetcher.timeseries(
@@ -0,0 +1,88 @@
+"""
+Testing of calendar bucketing.
+"""
+
+import operator as op
+from datetime import UTC, datetime, timedelta
+from itertools import pairwise
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from aemetAntartica.aggregator.bucketing import (
+    bucket_floor,
+    bucket_starts,
+    calendar_buckets,
+)
+
+_madrid = ZoneInfo("Europe/Madrid")
+
+
+@pytest.mark.parametrize(
+    "date_0, date_f, hours",
+    [
+        # SPRING FORWARD, FALL BACK AND A REGULAR DAY.
+        (
+            datetime(2024, 3, 31, tzinfo=_madrid),
+            datetime(2024, 4, 1, tzinfo=_madrid),
+            23,
+        ),
+        (
+            datetime(2024, 10, 27, tzinfo=_madrid),
+            datetime(2024, 10, 28, tzinfo=_madrid),
+            25,
+        ),
+        (
+            datetime(2024, 6, 1, tzinfo=_madrid),
+            datetime(2024, 6, 2, tzinfo=_madrid),
+            24,
+        ),
+    ],
+)
+def test_day_buckets_dst(date_0: datetime, date_f: datetime, hours: int):
+    "Days follow the wall clock of the timezone"
+    day_0, day_f = bucket_starts(date_0, date_0 + timedelta(hours=1), "day", _madrid)
+    assert (day_0, day_f) == (date_0, date_f)
+    # SAME TZINFO SUBTRACTION IS WALL CLOCK. ELAPSED TIME IS MEASURED IN UTC.
+    assert day_f.astimezone(UTC) - day_0.astimezone(UTC) == timedelta(hours=hours)
+
+    hour_starts = bucket_starts(day_0, day_f, "hour", _madrid)
+    assert len(hour_starts) == hours + 1
+    assert all(
+        h1.astimezone(UTC) - h0.astimezone(UTC) == timedelta(hours=1)
+        for h0, h1 in pairwise(hour_starts)
+    )
+
+
+def test_month_buckets():
+    "Months are calendar months"
+    starts = bucket_starts(
+        datetime(2024, 1, 15, tzinfo=UTC),
+        datetime(2024, 4, 1, tzinfo=UTC),
+        "month",
+        UTC,
+    )
+    assert [s.month for s in starts] == [1, 2, 3, 4]
+    assert [(m1 - m0).days for m0, m1 in pairwise(starts)] == [31, 29, 31]
+
+
+def test_bucket_floor_tz():
+    "Buckets are floored in the given timezone"
+    d = datetime(2024, 6, 30, 23, 30, tzinfo=UTC)
+    assert bucket_floor(d, "day", UTC) == datetime(2024, 6, 30, tzinfo=UTC)
+    assert bucket_floor(d, "month", _madrid) == datetime(2024, 7, 1, tzinfo=_madrid)
+
+
+def test_calendar_buckets_gaps():
+    "Empty buckets are skipped, partial buckets are kept"
+    dates = [
+        datetime(2024, 1, 1, 10, tzinfo=UTC),
+        datetime(2024, 1, 1, 20, tzinfo=UTC),
+        datetime(2024, 1, 4, 0, tzinfo=UTC),
+        datetime(2024, 1, 5, 23, 59, tzinfo=UTC),
+    ]
+    chunks = list(
+        calendar_buckets(list(zip(dates, range(4))), "day", UTC, op.itemgetter(0))
+    )
+    assert [[v for _, v in c] for c in chunks] == [[0, 1], [2], [3]]
+    assert list(calendar_buckets([], "day", UTC, op.itemgetter(0))) == []
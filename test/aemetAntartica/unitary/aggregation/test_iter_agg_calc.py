@@ -4,15 +4,15 @@ Testing of chunk aggregation functions (not just the calculation per se)
 
 import operator as op
 from collections.abc import Callable, Sequence
-from datetime import datetime, timedelta
+from datetime import UTC, datetime, timedelta
 
 import pytest
 
+from aemetAntartica.aggregator.bucketing import CalendarPeriod
 from aemetAntartica.aggregator.iteration import (
     calc_agg_factory,
     calc_mean,
     calc_median,
-    calc_points_period,
     picker_agg_factory,
 )
 
@@ -24,7 +24,7 @@ except ImportError:
 np_exception = ImportError("Numpy optional rependency required for this test")
 
 "Arbitrary 'now' date for datetime generation"
-_now = datetime.fromisoformat("2024-12-15")
+_now = datetime.fromisoformat("2024-12-15T00:00:00+00:00")
 
 
 def gen_dt(base: datetime, inc: timedelta):
@@ -35,6 +35,16 @@ def gen_dt(base: datetime, inc: timedelta):
         i += inc
 
 
+def np_chunks(vals: Sequence[tuple[datetime, float]]):
+    """
+    Helper numpy split of hourly tuples in UTC days. The trailing incomplete day is kept.
+    """
+    arr = np.array(list(map(op.itemgetter(1), vals)))
+    days = [d.date() for d, _ in vals]
+    cuts = [i for i in range(1, len(days)) if days[i] != days[i - 1]]
+    return np.split(arr, cuts)
+
+
 @pytest.mark.parametrize(
     "vals, period",
     [
@@ -45,11 +55,11 @@ def gen_dt(base: datetime, inc: timedelta):
                     range(50),
                 )
             ),
-            timedelta(hours=5),
+            "day",
         )
     ],
 )
-def test_first_agg_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
+def test_first_agg_np(vals: Sequence[tuple[datetime, float]], period: CalendarPeriod):
     """
     Compare 'first' aggregation function with numpy matrix-based implementation
     """
@@ -62,20 +72,13 @@ def test_first_agg_np(vals: Sequence[tuple[datetime, float]], period: timedelta)
         date_getter=op.itemgetter(0),
     )
 
-    firsts_iter = first_agg(vals, period)
+    firsts_iter = first_agg(vals, period, UTC)
 
     # NUMPY CALC COMPRARE
 
-    dates = list(map(op.itemgetter(0), vals))
-    data_freq = calc_points_period(dates)
-    n_samples_period = period // data_freq
-    arr = np.array(list(map(op.itemgetter(1), vals)))
-    mat = arr.reshape(
-        len(vals) // n_samples_period,
-        n_samples_period,
-    )
+    chunks = np_chunks(vals)
 
-    firsts_np = mat[:, 0]
+    firsts_np = [c[0] for c in chunks]
 
     assert len(firsts_iter) == len(firsts_np)
 
@@ -93,11 +96,11 @@ def test_first_agg_np(vals: Sequence[tuple[datetime, float]], period: timedelta)
                     range(50),
                 )
             ),
-            timedelta(hours=5),
+            "day",
         )
     ],
 )
-def test_last_agg_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
+def test_last_agg_np(vals: Sequence[tuple[datetime, float]], period: CalendarPeriod):
     """
     Compare 'last' aggregation function with numpy matrix-based implementation
     """
@@ -110,20 +113,13 @@ def test_last_agg_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
         date_getter=op.itemgetter(0),
     )
 
-    firsts_iter = first_agg(vals, period)
+    firsts_iter = first_agg(vals, period, UTC)
 
     # NUMPY CALC COMPRARE
 
-    dates = list(map(op.itemgetter(0), vals))
-    data_freq = calc_points_period(dates)
-    n_samples_period = period // data_freq
-    arr = np.array(list(map(op.itemgetter(1), vals)))
-    mat = arr.reshape(
-        len(vals) // n_samples_period,
-        n_samples_period,
-    )
+    chunks = np_chunks(vals)
 
-    firsts_np = mat[:, -1]
+    firsts_np = [c[-1] for c in chunks]
 
     assert len(firsts_iter) == len(firsts_np)
 
@@ -155,11 +151,11 @@ def do_tup_agg_factory(
                     range(50),
                 )
             ),
-            timedelta(hours=5),
+            "day",
         )
     ],
 )
-def test_agg_mean_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
+def test_agg_mean_np(vals: Sequence[tuple[datetime, float]], period: CalendarPeriod):
     """
     Test iterable mean calculation against numpy.
     """
@@ -175,19 +171,12 @@ def test_agg_mean_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
         model_f=do_tup_agg_factory,
     )
 
-    firsts_iter = mean_agg(vals, period)
+    firsts_iter = mean_agg(vals, period, UTC)
 
     # NUMPY CALC COMPRARE
 
-    dates = list(map(op.itemgetter(0), vals))
-    data_freq = calc_points_period(dates)
-    n_samples_period = period // data_freq
-    arr = np.array(list(map(op.itemgetter(1), vals)))
-    mat = arr.reshape(
-        len(vals) // n_samples_period,
-        n_samples_period,
-    )
-    mat_mean = np.nanmean(mat, axis=1)
+    chunks = np_chunks(vals)
+    mat_mean = [np.nanmean(c) for c in chunks]
 
     assert len(firsts_iter) == len(mat_mean), "Results length mismatch"
 
@@ -205,11 +194,11 @@ def test_agg_mean_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
                     range(50),
                 )
             ),
-            timedelta(hours=5),
+            "day",
         )
     ],
 )
-def test_agg_median_np(vals: Sequence[tuple[datetime, float]], period: timedelta):
+def test_agg_median_np(vals: Sequence[tuple[datetime, float]], period: CalendarPeriod):
     """
     Test iterable median calculation against numpy.
     """
@@ -225,19 +214,12 @@ def test_agg_median_np(vals: Sequence[tuple[datetime, float]], period: timedelta
         model_f=do_tup_agg_factory,
     )
 
-    firsts_iter = mean_agg(vals, period)
+    firsts_iter = mean_agg(vals, period, UTC)
 
     # NUMPY CALC COMPRARE
 
-    dates = list(map(op.itemgetter(0), vals))
-    data_freq = calc_points_period(dates)
-    n_samples_period = period // data_freq
-    arr = np.array(list(map(op.itemgetter(1), vals)))
-    mat = arr.reshape(
-        len(vals) // n_samples_period,
-        n_samples_period,
-    )
-    mat_median = np.nanmedian(mat, axis=1)
+    chunks = np_chunks(vals)
+    mat_median = [np.nanmedian(c) for c in chunks]
 
     assert len(firsts_iter) == len(mat_median), "Results length mismatch"
 
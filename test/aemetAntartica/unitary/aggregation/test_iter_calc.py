@@ -6,7 +6,12 @@ from typing import Sequence
 
 import pytest
 
-from aemetAntartica.aggregator.iteration import calc_mean, calc_median
+from aemetAntartica.aggregator.iteration import (
+    calc_mean,
+    calc_median,
+    calc_percentile,
+    select_kth,
+)
 
 try:
     import numpy as np
@@ -46,3 +51,33 @@ def test_calc_median_np(values: Sequence[float]):
     iter_mean = calc_median(values)
 
     assert np_mean == iter_mean, "Different result from numpy and iterable"
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        list(range(50)),
+        [3.0, 1.0, float("nan"), 1.0, 7.0, 3.0, -2.0],
+        [5.0] * 10,
+        [float("nan"), 2.5],
+    ],
+)
+@pytest.mark.parametrize("q", [0, 0.1, 0.5, 0.9, 0.99, 1])
+def test_calc_percentile_np(values: Sequence[float], q: float):
+    """
+    Compare results of selection based percentiles and numpy percentiles
+    """
+
+    if np is None:
+        raise np_exception
+
+    np_percentile = np.nanpercentile(values, q * 100)
+    iter_percentile = calc_percentile(values, q)
+
+    assert iter_percentile == pytest.approx(np_percentile)
+
+
+def test_select_kth():
+    "Every rank of a series with repeated values"
+    values = [5, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5]
+    assert [select_kth(values, k) for k in range(len(values))] == sorted(values)
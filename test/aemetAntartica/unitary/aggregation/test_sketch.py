@@ -0,0 +1,94 @@
+"""
+Testing of mergeable quantile sketches.
+"""
+
+import json
+import random
+from math import isnan
+
+import pytest
+
+from aemetAntartica.aggregator.iteration import calc_percentile
+from aemetAntartica.aggregator.sketch import QuantileSketch, variable_sketch
+
+_rng = random.Random(42)
+_values = [_rng.gauss(0, 10) for _ in range(5000)] + [0.0] * 20 + [float("nan")] * 5
+
+
+def bracket(values: list[float], q: float) -> tuple[float, float]:
+    "Closest ranks around the q quantile"
+    non_nan = sorted(v for v in values if not isnan(v))
+    pos = q * (len(non_nan) - 1)
+    return non_nan[int(pos)], non_nan[min(int(pos) + 1, len(non_nan) - 1)]
+
+
+@pytest.mark.parametrize("q", [0, 0.01, 0.1, 0.5, 0.9, 0.99, 1])
+def test_sketch_accuracy(q: float):
+    "Quantiles within the relative accuracy of the closest ranks"
+    sketch = QuantileSketch(alpha=0.01)
+    sketch.update(_values)
+
+    lo, hi = bracket(_values, q)
+    res = sketch.quantile(q)
+    assert min(lo, hi) - 0.01 * abs(lo) <= res <= max(lo, hi) + 0.01 * abs(hi)
+    assert sketch.count == len(_values) - 5
+
+
+@pytest.mark.parametrize("q", [0, 0.01, 0.5, 0.99, 1])
+def test_sketch_offset(q: float):
+    "Pressures are sketched around 1000 hPa: the error is relative to the distance to it, not to the value"
+    pres = [1000 + _rng.gauss(-20, 15) for _ in range(5000)]
+    sketch = variable_sketch("pres")
+    sketch.update(pres)
+    sketch = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+    lo, hi = bracket(pres, q)
+    res = sketch.quantile(q)
+    assert min(lo, hi) - 1 <= res <= max(lo, hi) + 1
+    assert sketch.offset == 1000
+
+
+def test_sketch_merge():
+    "Merged sketches answer the same as a sketch of every value. State survives json"
+    whole = QuantileSketch()
+    whole.update(_values)
+
+    merged = QuantileSketch()
+    for ndx in range(0, len(_values), 700):
+        part = QuantileSketch()
+        part.update(_values[ndx : ndx + 700])
+        merged.merge(QuantileSketch.from_dict(json.loads(json.dumps(part.to_dict()))))
+
+    assert merged == whole
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch(alpha=0.05))
+    with pytest.raises(ValueError):
+        merged.merge(variable_sketch("pres"))
+
+
+def test_sketch_subtract():
+    "Subtracted values are removed from the bins"
+    whole = QuantileSketch()
+    whole.update(_values)
+    tail = QuantileSketch()
+    tail.update(_values[4000:])
+    head = QuantileSketch()
+    head.update(_values[:4000])
+
+    whole.subtract(tail)
+    assert (whole.positive, whole.negative, whole.zeros, whole.count) == (
+        head.positive,
+        head.negative,
+        head.zeros,
+        head.count,
+    )
+    with pytest.raises(ValueError):
+        head.subtract(tail)
+
+
+def test_sketch_empty():
+    "No values give 0 (same as calc_percentile)"
+    sketch = QuantileSketch()
+    sketch.update([float("nan")])
+    assert sketch.quantile(0.9) == calc_percentile([float("nan")], 0.9) == 0
+    assert QuantileSketch.from_dict(sketch.to_dict()) == sketch
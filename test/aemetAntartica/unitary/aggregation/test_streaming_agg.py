@@ -0,0 +1,190 @@
+"""
+Testing of online streaming aggregation functions.
+"""
+
+from datetime import UTC, datetime, timedelta
+from itertools import groupby
+from math import isnan
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from aemetAntartica.aggregator import iteration
+from aemetAntartica.aggregator.bucketing import CalendarPeriod, calendar_buckets
+from aemetAntartica.aggregator.streaming import (
+    StreamAggType,
+    StreamingAggregator,
+    StreamStat,
+    aggregate_async_stream,
+    aggregate_stream,
+    aggregate_stream_stats,
+)
+from aemetAntartica.fetcher.batch import WeatherPointBatch
+from aemetAntartica.model.fetch import WeatherDataPoint
+
+_now = datetime(2024, 1, 1, tzinfo=UTC)
+_madrid = ZoneInfo("Europe/Madrid")
+
+
+def gen_models(n: int, freq: timedelta) -> list[WeatherDataPoint]:
+    "Helper regular series with some missing values"
+    return [
+        WeatherDataPoint(
+            fhora=_now + i * freq,
+            temp=float("nan") if i % 7 == 3 else (i * 37) % 11,
+            pres=1000 + i % 3,
+            vel=float("nan") if i % 5 == 0 else i % 4,
+        )
+        for i in range(n)
+    ]
+
+
+def utc_months(models: list[WeatherDataPoint]) -> list[list[WeatherDataPoint]]:
+    "Helper monthly batches as fetched (UTC months)"
+    return [list(g) for _, g in groupby(models, key=lambda p: p.fhora.month)]
+
+
+def to_batch(models: list[WeatherDataPoint]) -> WeatherPointBatch:
+    return WeatherPointBatch.from_points(p.model_dump() for p in models)
+
+
+def assert_same_points(res, expected):
+    assert len(res) == len(expected)
+    for p_stream, p_expected in zip(res, expected):
+        assert p_stream.fhora == p_expected.fhora
+        for prop in ("temp", "pres", "vel"):
+            val, expected_val = getattr(p_stream, prop), getattr(p_expected, prop)
+            assert (isnan(val) and isnan(expected_val)) or val == pytest.approx(
+                expected_val
+            )
+
+
+@pytest.mark.parametrize("agg", ["first", "last", "mean"])
+@pytest.mark.parametrize("period", ["hour", "day", "month"])
+@pytest.mark.parametrize("tz", [UTC, _madrid])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_stream_agg_iteration(
+    agg: StreamAggType, period: CalendarPeriod, tz, columnar: bool
+):
+    """
+    Same points as the iteration based aggregation of the whole series. Buckets span several batches
+    (i.e. Madrid months over UTC monthly batches).
+    """
+    models = gen_models(2000, timedelta(hours=1, minutes=10))
+    batches = utc_months(models)
+    if columnar:
+        batches = list(map(to_batch, batches))
+
+    expected = getattr(iteration, f"{agg}_agg")(models, period, tz)
+
+    assert_same_points(list(aggregate_stream(batches, agg, period, tz)), expected)
+
+
+@pytest.mark.parametrize("agg", ["count", "min", "max"])
+def test_stream_agg_reductions(agg: StreamAggType):
+    "Count, min and max ignore nan. Nan if there are no values"
+    models = gen_models(500, timedelta(hours=1))
+    models[24:48] = [m.model_copy(update={"temp": float("nan")}) for m in models[24:48]]
+    res = list(aggregate_stream(utc_months(models), agg, "day", UTC))
+
+    reduce_f = {"count": len, "min": min, "max": max}[agg]
+    chunks = list(calendar_buckets(models, "day", UTC, lambda p: p.fhora))
+    assert len(res) == len(chunks)
+    for point, chunk in zip(res, chunks):
+        assert point.fhora == chunk[0].fhora
+        for prop in ("temp", "pres", "vel"):
+            vals = [v for p in chunk if not isnan(v := getattr(p, prop))]
+            val = getattr(point, prop)
+            if len(vals) == 0 and agg != "count":
+                assert isnan(val)
+            else:
+                assert val == reduce_f(vals)
+
+
+def test_stream_agg_emits_closed_buckets():
+    "Buckets are emitted as soon as a later point arrives. The open one on close"
+    models = gen_models(72, timedelta(hours=1))
+    aggregator = StreamingAggregator("mean", "day", UTC)
+
+    assert aggregator.push(models[:20]) == []
+    assert [p.fhora for p in aggregator.push(models[20:40])] == [_now]
+    assert [p.fhora for p in aggregator.push(models[40:])] == [_now + timedelta(days=1)]
+    assert [p.fhora for p in aggregator.close()] == [_now + timedelta(days=2)]
+    assert aggregator.close() == []
+
+
+def test_stream_agg_unsorted():
+    "Batches out of chronological order are rejected"
+    models = gen_models(72, timedelta(hours=1))
+    aggregator = StreamingAggregator("first", "day", UTC)
+    aggregator.push(models[48:])
+
+    with pytest.raises(ValueError):
+        aggregator.push(models[:24])
+
+
+@pytest.mark.asyncio
+async def test_stream_agg_async():
+    "Async streams give the same points"
+    models = gen_models(2000, timedelta(hours=1))
+
+    async def batches():
+        for batch in utc_months(models):
+            yield to_batch(batch)
+
+    res = [p async for p in aggregate_async_stream(batches(), "mean", "day", _madrid)]
+    assert_same_points(res, iteration.mean_agg(models, "day", _madrid))
+
+
+@pytest.mark.parametrize("q", [0.1, 0.9, 0.99])
+def test_stream_agg_quantile(q: float):
+    "Approximate quantiles within 1% of the closest ranks. Bins are merged across batches"
+    models = gen_models(3000, timedelta(minutes=50))
+    res = list(aggregate_stream(utc_months(models), "quantile", "month", _madrid, q))
+    chunks = list(calendar_buckets(models, "month", _madrid, lambda p: p.fhora))
+
+    assert [p.fhora for p in res] == [c[0].fhora for c in chunks]
+    for point, chunk in zip(res, chunks):
+        for prop in ("temp", "pres", "vel"):
+            vals = sorted(v for p in chunk if not isnan(v := getattr(p, prop)))
+            pos = q * (len(vals) - 1)
+            lo, hi = vals[int(pos)], vals[min(int(pos) + 1, len(vals) - 1)]
+            assert lo * 0.99 <= getattr(point, prop) <= hi * 1.01
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_stream_agg_stats(columnar: bool):
+    "Several statistics in a single pass. Same points as each aggregation on its own"
+    models = gen_models(2000, timedelta(hours=1))
+    batches = utc_months(models)
+    if columnar:
+        batches = list(map(to_batch, batches))
+    stats = [
+        StreamStat("mean"),
+        StreamStat("max"),
+        StreamStat("last"),
+        StreamStat("quantile", 0.9),
+        StreamStat("quantile", 0.1),
+    ]
+
+    res = list(aggregate_stream_stats(batches, stats, "day", _madrid))
+
+    chunks = list(calendar_buckets(models, "day", _madrid, lambda p: p.fhora))
+    assert [row.fhora for row in res] == [c[0].fhora for c in chunks]
+    for i, stat in enumerate(stats):
+        expected = list(aggregate_stream(batches, stat.agg, "day", _madrid, stat.q))
+        assert_same_points([row.points[i] for row in res], expected)
+
+
+@pytest.mark.parametrize("q", [0.1, 0.5, 0.9])
+def test_stream_agg_stats_percentile(q: float):
+    "Exact percentiles from the raw values of the open bucket. Same as the whole series aggregation"
+    models = gen_models(2000, timedelta(minutes=50))
+    res = list(
+        aggregate_stream_stats(
+            utc_months(models), [StreamStat("percentile", q)], "month", _madrid
+        )
+    )
+
+    expected = iteration.percentile_agg_factory(q)(models, "month", _madrid)
+    assert_same_points([row.points[0] for row in res], expected)
@@ -0,0 +1,80 @@
+"""
+Testing of numpy vectorized aggregation functions against the iteration based ones.
+"""
+
+from datetime import UTC, datetime, timedelta
+from math import isnan
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from aemetAntartica.aggregator import iteration
+from aemetAntartica.aggregator.bucketing import CalendarPeriod
+from aemetAntartica.fetcher.batch import WeatherPointBatch
+from aemetAntartica.model.fetch import WeatherDataPoint
+
+pytest.importorskip("numpy")
+
+from aemetAntartica.aggregator import vectorized
+from aemetAntartica.fetcher.sql_cache import models_to_batch
+
+_now = datetime(2024, 12, 15, tzinfo=UTC)
+
+
+def gen_models(n: int, freq: timedelta) -> list[WeatherDataPoint]:
+    "Helper regular series. Some values are missing, the 4th hour has no temperature at all"
+    return [
+        WeatherDataPoint(
+            fhora=_now + i * freq,
+            temp=float("nan") if i % 7 == 3 or 18 <= i < 24 else (i * 37) % 11,
+            pres=1000 + i % 3,
+            vel=float("nan") if i % 5 == 0 else i % 4,
+        )
+        for i in range(n)
+    ]
+
+
+def assert_same_points(res, expected):
+    assert len(res) == len(expected)
+    for p_np, p_py in zip(res, expected):
+        assert p_np.fhora == p_py.fhora
+        for prop in ("temp", "pres", "vel"):
+            np_val, py_val = getattr(p_np, prop), getattr(p_py, prop)
+            assert (isnan(np_val) and isnan(py_val)) or np_val == pytest.approx(py_val)
+
+
+@pytest.mark.parametrize("agg", ["first_agg", "last_agg", "mean_agg", "median_agg"])
+@pytest.mark.parametrize("period", ["hour", "day", "month"])
+@pytest.mark.parametrize("tz", [UTC, ZoneInfo("Europe/Madrid")])
+@pytest.mark.parametrize("gap", [False, True])
+def test_vectorized_agg(agg: str, period: CalendarPeriod, tz, gap: bool):
+    """
+    Same points as the iteration based aggregation, for models and batches. Empty buckets are skipped.
+    """
+    models = gen_models(9000, timedelta(minutes=10))
+    if gap:
+        models = models[:1000] + models[5000:]
+    expected = getattr(iteration, agg)(models, period, tz)
+
+    assert_same_points(getattr(vectorized, agg)(models, period, tz), expected)
+    assert_same_points(
+        getattr(vectorized, agg)(models_to_batch(models), period, tz), expected
+    )
+
+
+def test_vectorized_agg_short():
+    "Empty series aggregate to nothing"
+    assert vectorized.mean_agg([], "day", UTC) == []
+    assert vectorized.median_agg(WeatherPointBatch.concat(()), "hour", UTC) == []
+
+
+@pytest.mark.parametrize("q", [0.1, 0.9, 0.99])
+@pytest.mark.parametrize("period", ["hour", "day"])
+def test_vectorized_percentile_agg(q: float, period: CalendarPeriod):
+    "Same percentiles as the selection based ones, for models and batches"
+    models = gen_models(2000, timedelta(minutes=10))
+    expected = iteration.percentile_agg_factory(q)(models, period, UTC)
+    percentile_agg = vectorized.percentile_agg_factory(q)
+
+    assert_same_points(percentile_agg(models, period, UTC), expected)
+    assert_same_points(percentile_agg(models_to_batch(models), period, UTC), expected)
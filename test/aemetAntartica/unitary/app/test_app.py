@@ -0,0 +1,234 @@
+"""
+Testing of api routes using the mock fetcher as data source.
+"""
+
+import json
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from aemetAntartica.app.app import app
+from aemetAntartica.app.enum import AggTypeOpts
+from aemetAntartica.fetcher.context import deadline_var
+from aemetAntartica.fetcher.factory import cached_gen_aemet_fetcher_env_var
+from aemetAntartica.fetcher.mock import InMemoryStationData, MockWeatherDataFetcher
+
+_station = "Mock station"
+_date0 = datetime(2023, 1, 1, tzinfo=UTC)
+_datef = datetime(2023, 4, 1, tzinfo=UTC)
+
+
+def gen_station_data(freq: timedelta) -> InMemoryStationData:
+    "Helper monotonic station data generator."
+    timeseries = []
+    d = _date0
+    while d < _datef:
+        i = len(timeseries)
+        timeseries.append(
+            {"fhora": d.isoformat(), "temp": i % 7, "pres": 1000.0, "vel": i % 5}
+        )
+        d += freq
+
+    return {
+        "station_id": "0",
+        "date0": _date0,
+        "datef": _datef,
+        "timeseries": timeseries,
+    }
+
+
+@pytest.fixture
+def client():
+    fetcher = MockWeatherDataFetcher({_station: gen_station_data(timedelta(hours=1))})
+    app.dependency_overrides[cached_gen_aemet_fetcher_env_var] = lambda: fetcher
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+def station_uri(date_0: datetime, date_f: datetime, suffix: str = "") -> str:
+    return f"/api/antartida/datos/fechaini/{date_0.isoformat()}/fechafin/{date_f.isoformat()}/estacion/{_station}{suffix}"
+
+
+def test_station_data_stream(client: TestClient):
+    """
+    NDJSON stream returns every point in range, in order, with the requested properties only.
+    """
+    date_0 = datetime(2023, 1, 15, tzinfo=UTC)
+    date_f = datetime(2023, 3, 15, tzinfo=UTC)
+
+    response = client.get(
+        station_uri(date_0, date_f, "/stream"), params={"data_props": ["temp"]}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    points = list(map(json.loads, response.text.splitlines()))
+    dates = [datetime.fromisoformat(p["fhora"]) for p in points]
+
+    assert all(p.keys() == {"fhora", "temp"} for p in points)
+    assert dates == sorted(dates)
+    assert dates[0] == date_0 and dates[-1] < date_f
+    assert len(points) == (date_f - date_0) // timedelta(hours=1)
+
+
+class RecordingFetcher(MockWeatherDataFetcher):
+    "Mock fetcher that records every fetch method called and the request deadline it saw"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        object.__setattr__(self, "calls", [])
+
+    async def timeseries(self, date0, dateF, station_id):
+        self.calls.append(("timeseries", deadline_var.get()))
+        return await super().timeseries(date0, dateF, station_id)
+
+    def timeseries_stream(self, date0, dateF, station_id):
+        self.calls.append(("timeseries_stream", deadline_var.get()))
+        return super().timeseries_stream(date0, dateF, station_id)
+
+
+def test_station_data_stream_no_deadline():
+    """
+    The NDJSON stream is not bound by the whole request deadline (it would be truncated mid-body). Aggregations are.
+    """
+    fetcher = RecordingFetcher({_station: gen_station_data(timedelta(hours=1))})
+    app.dependency_overrides[cached_gen_aemet_fetcher_env_var] = lambda: fetcher
+    date_0 = datetime(2023, 1, 15, tzinfo=UTC)
+    date_f = datetime(2023, 3, 15, tzinfo=UTC)
+    try:
+        with TestClient(app) as client:
+            stream = client.get(station_uri(date_0, date_f, "/stream"))
+            aggregated = client.get(station_uri(date_0, date_f))
+    finally:
+        app.dependency_overrides.clear()
+
+    assert stream.status_code == 200 and aggregated.status_code == 200
+    assert fetcher.calls[0] == ("timeseries_stream", None)
+    assert fetcher.calls[-1][1] is not None
+
+
+@pytest.mark.parametrize("stream_months", ["0", "12"])
+def test_station_data_aggregation_stream_threshold(
+    monkeypatch: pytest.MonkeyPatch, stream_months: str
+):
+    """
+    Short ranges are aggregated as a whole series (vectorized if numpy is installed). Longer ones online over the stream.
+    """
+    monkeypatch.setenv("AEMET_STREAM_AGG_MONTHS", stream_months)
+    fetcher = RecordingFetcher({_station: gen_station_data(timedelta(hours=1))})
+    app.dependency_overrides[cached_gen_aemet_fetcher_env_var] = lambda: fetcher
+    date_0 = datetime(2023, 1, 15, tzinfo=UTC)
+    date_f = datetime(2023, 3, 15, tzinfo=UTC)
+    try:
+        with TestClient(app) as client:
+            response = client.get(
+                station_uri(date_0, date_f),
+                params={"agg_opt": "mean", "time_opt": "daily", "limit": 100},
+            )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    streamed = stream_months == "0" or not AggTypeOpts.MEAN.is_vectorized()
+    assert (fetcher.calls[0][0] == "timeseries_stream") == streamed
+    assert len(response.json()["points"]) == (date_f - date_0).days + 1
+
+
+def test_cache_warmup_disabled(client: TestClient):
+    "Warm-up progress is not available unless enabled"
+    response = client.get("/api/cache/warmup")
+    assert response.status_code == 404
+
+
+def test_cache_memory_stats(client: TestClient):
+    "Memory cache counters are exposed"
+    response = client.get("/api/cache/memory")
+    assert response.status_code == 200
+    assert {"hits", "misses", "evictions", "expirations"} <= set(response.json())
+
+
+@pytest.mark.parametrize("agg_opt", ["mean", "max", "median", "p90", "p90_approx"])
+def test_station_data_aggregation(client: TestClient, agg_opt: str):
+    """
+    Daily aggregations (online over the monthly stream or whole series for the median) give one point per day.
+    """
+    date_0 = datetime(2023, 1, 15, tzinfo=UTC)
+    date_f = datetime(2023, 3, 15, tzinfo=UTC)
+
+    response = client.get(
+        station_uri(date_0, date_f),
+        params={"agg_opt": agg_opt, "time_opt": "daily", "limit": 100},
+    )
+
+    assert response.status_code == 200
+    points = response.json()["points"]
+    dates = [datetime.fromisoformat(p["fhora"]) for p in points]
+
+    # DAYS OF THE RESULT TIMEZONE. THE FIRST ONE IS PARTIAL.
+    assert len(points) == (date_f - date_0).days + 1
+    assert dates == sorted(dates)
+    assert dates[0] == date_0
+    assert all(p["pres"] == 1000.0 for p in points)
+
+
+def test_station_data_stats(client: TestClient):
+    """
+    Several statistics in a single request. One column per statistic and property, same values as one request each.
+    """
+    date_0 = datetime(2023, 1, 15, tzinfo=UTC)
+    date_f = datetime(2023, 3, 15, tzinfo=UTC)
+    params = {"time_opt": "daily", "limit": 100, "data_props": ["temp", "vel"]}
+
+    response = client.get(
+        station_uri(date_0, date_f),
+        params={**params, "stats": ["mean", "min", "max", "median"]},
+    )
+
+    assert response.status_code == 200
+    points = response.json()["points"]
+    assert len(points) == (date_f - date_0).days + 1
+    assert set(points[0]) == {
+        "fhora",
+        *(
+            f"{k}_{s}"
+            for k in ("temp", "vel")
+            for s in ("mean", "min", "max", "median")
+        ),
+    }
+
+    for stat in ("mean", "min", "max", "median"):
+        single = client.get(
+            station_uri(date_0, date_f), params={**params, "agg_opt": stat}
+        )
+        for point, single_point in zip(points, single.json()["points"], strict=True):
+            assert point["fhora"] == single_point["fhora"]
+            assert point[f"temp_{stat}"] == pytest.approx(single_point["temp"])
+            assert point[f"vel_{stat}"] == pytest.approx(single_point["vel"])
+
+
+def test_station_data_stats_no_period(client: TestClient):
+    "Statistics cannot be computed without an aggregation time"
+    response = client.get(
+        station_uri(_date0, _datef), params={"stats": ["mean", "max"]}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"agg_opt": "mean"},
+        {"agg_opt": "count", "time_opt": "none"},
+        {"agg_opt": "p90"},
+        {"time_opt": "daily"},
+    ],
+)
+def test_station_data_aggregation_mismatched_options(
+    client: TestClient, params: dict[str, str]
+):
+    "Aggregation type and time have to be informed together"
+    response = client.get(station_uri(_date0, _datef), params=params)
+    assert response.status_code == 422
@@ -0,0 +1,83 @@
+"""
+Shared helpers of the fetcher tests. Cache proxies are tested over a mock fetcher that records network requests.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Mapping, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from aemetAntartica.fetcher.annot import WeatherPoint
+from aemetAntartica.fetcher.mock import MockWeatherDataFetcher
+
+
+def gen_points(d0: datetime, df: datetime, freq: timedelta) -> list[WeatherPoint]:
+    "Helper monotonic point generator."
+    points: list[WeatherPoint] = []
+    d = d0
+    while d < df:
+        i = len(points)
+        points.append(
+            {"fhora": d.isoformat(), "temp": i % 7, "pres": 1000 + i % 3, "vel": i % 5}
+        )
+        d += freq
+    return points
+
+
+@dataclass
+class CountingFetcher:
+    """
+    Mock fetcher wrapper that records every network request.
+    """
+
+    fetcher: MockWeatherDataFetcher
+    requests: list[tuple[datetime, datetime]] = field(default_factory=list)
+    many_requests: list[tuple[Sequence[str], datetime, datetime]] = field(
+        default_factory=list
+    )
+    "Seconds every request takes"
+    delay: float = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    @asynccontextmanager
+    async def _request(self) -> AsyncIterator[None]:
+        "Track concurrent requests"
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            yield
+        finally:
+            self.in_flight -= 1
+
+    async def stations(self) -> Sequence[str]:
+        return await self.fetcher.stations()
+
+    async def time_range(self, station_id: str) -> tuple[datetime, datetime]:
+        return await self.fetcher.time_range(station_id)
+
+    async def timeseries(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> Sequence[WeatherPoint]:
+        self.requests.append((date_0, date_f))
+        async with self._request():
+            return await self.fetcher.timeseries(date_0, date_f, station_id)
+
+    async def timeseries_stream(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> AsyncIterator[Sequence[WeatherPoint]]:
+        self.requests.append((date_0, date_f))
+        async with self._request():
+            async for batch in self.fetcher.timeseries_stream(
+                date_0, date_f, station_id
+            ):
+                yield batch
+
+    async def timeseries_many(
+        self, stations: Sequence[str], date_0: datetime, date_f: datetime
+    ) -> Mapping[str, Sequence[WeatherPoint]]:
+        self.many_requests.append((stations, date_0, date_f))
+        async with self._request():
+            return await self.fetcher.timeseries_many(stations, date_0, date_f)
@@ -0,0 +1,136 @@
+"""
+Testing of aemet fetchers scheduling with fake fetch functions.
+"""
+
+import asyncio
+from datetime import UTC, datetime
+
+import pytest
+
+from aemetAntartica.fetcher.aemet import (
+    AemetWeatherDataFetcherConcurrent,
+    AemetWeatherDataFetcherPipelined,
+)
+from aemetAntartica.fetcher.annot import AemetTicketResponse, WeatherPoint
+from aemetAntartica.fetcher.static import named_station_metadata
+from aemetAntartica.util.datetime import monthly_date_range
+
+_stations = ["Meteo Station Gabriel de Castilla", "Meteo Station Juan Carlos I"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_many_shared_budget():
+    """
+    Every (station, month) request runs under the same concurrency limit. Points are returned by station.
+    """
+    in_flight = 0
+    max_in_flight = 0
+    uris: list[str] = []
+
+    async def fetch(uri: str) -> list[WeatherPoint]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        uris.append(uri)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [{"fhora": uri, "temp": 0.0, "pres": 0.0, "vel": 0.0}]
+
+    fetcher = AemetWeatherDataFetcherConcurrent(
+        stations_metadata=named_station_metadata,
+        api_key="key",
+        date_generator=monthly_date_range,
+        fetch_function=fetch,
+        max_concurrent_requests=3,
+    )
+
+    res = await fetcher.timeseries_many(
+        _stations, datetime(2023, 1, 1, tzinfo=UTC), datetime(2023, 4, 1, tzinfo=UTC)
+    )
+
+    assert list(res.keys()) == _stations
+    assert len(uris) == 6
+    assert max_in_flight == 3
+    for station_id in _stations:
+        station_code = named_station_metadata[station_id]["station_id"]
+        assert len(res[station_id]) == 3
+        assert all(
+            p["fhora"].endswith(f"/estacion/{station_code}") for p in res[station_id]
+        )
+
+
+@pytest.mark.asyncio
+async def test_pipelined_coalesced():
+    """
+    Concurrent requests of the same months share one ticket and one download per month.
+    """
+    tickets: list[str] = []
+    downloads: list[str] = []
+
+    async def ticket_function(uri: str) -> AemetTicketResponse:
+        tickets.append(uri)
+        await asyncio.sleep(0.01)
+        return {"estado": 200, "datos": f"data:{len(tickets)}:{uri}"}
+
+    async def data_function(uri: str) -> list[WeatherPoint]:
+        downloads.append(uri)
+        await asyncio.sleep(0.02)
+        return [{"fhora": uri.split(":", 2)[-1], "temp": 0.0, "pres": 0.0, "vel": 0.0}]
+
+    fetcher = AemetWeatherDataFetcherPipelined(
+        stations_metadata=named_station_metadata,
+        api_key="key",
+        date_generator=monthly_date_range,
+        ticket_function=ticket_function,
+        data_function=data_function,
+    )
+
+    date_0, date_f = datetime(2023, 1, 1, tzinfo=UTC), datetime(2023, 4, 1, tzinfo=UTC)
+    res = await asyncio.gather(
+        fetcher.timeseries(date_0, date_f, _stations[0]),
+        fetcher.timeseries(date_0, date_f, _stations[0]),
+        fetcher.timeseries(date_0, date_f, _stations[0]),
+    )
+
+    assert len(tickets) == len(set(tickets)) == 3
+    assert len(downloads) == 3
+    assert res[0] == res[1] == res[2]
+    assert len(fetcher.flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_pipelined_abandoned_leader():
+    """
+    Followers fetch the months themselves if the leading request is closed before them.
+    """
+    downloads: list[str] = []
+
+    async def ticket_function(uri: str) -> AemetTicketResponse:
+        return {"estado": 200, "datos": uri}
+
+    async def data_function(uri: str) -> list[WeatherPoint]:
+        downloads.append(uri)
+        await asyncio.sleep(0.02)
+        return [{"fhora": uri, "temp": 0.0, "pres": 0.0, "vel": 0.0}]
+
+    fetcher = AemetWeatherDataFetcherPipelined(
+        stations_metadata=named_station_metadata,
+        api_key="key",
+        date_generator=monthly_date_range,
+        ticket_function=ticket_function,
+        data_function=data_function,
+        max_concurrent_tickets=1,
+        max_concurrent_downloads=1,
+    )
+
+    date_0, date_f = datetime(2023, 1, 1, tzinfo=UTC), datetime(2023, 4, 1, tzinfo=UTC)
+    leader = fetcher.timeseries_stream(date_0, date_f, _stations[0])
+    first = await anext(leader)
+    follower = asyncio.create_task(fetcher.timeseries(date_0, date_f, _stations[0]))
+    await asyncio.sleep(0)
+    await leader.aclose()
+
+    res = await follower
+    assert res[0] == first[0]
+    assert len(res) == 3
+    assert len(fetcher.flights) == 0
@@ -0,0 +1,130 @@
+"""
+Testing of projection decoding into columnar batches.
+"""
+
+import dataclasses
+import json
+from datetime import UTC, datetime, timedelta
+from math import isnan
+
+from aemetAntartica.fetcher.batch import WeatherPointBatch, decode_aemet_points
+from aemetAntartica.fetcher.memory_cache import points_sizeof
+from aemetAntartica.model.fetch import WeatherDataPointSeries
+
+_payload = json.dumps(
+    [
+        {
+            "identificacion": "89064",
+            "nombre": "JUAN CARLOS I",
+            "fhora": "2023-01-01T00:00:00+0000",
+            "temp": 1.5,
+            "pres": 990.1,
+            "vel": 3.0,
+            "hr": 80,
+        },
+        {
+            "identificacion": "89064",
+            "nombre": "JUAN CARLOS I",
+            "fhora": "2023-01-01T00:10:00+0000",
+            "temp": 1.7,
+            "pres": 990.0,
+            "hr": 81,
+        },
+    ]
+)
+
+
+def test_decode_projection():
+    """
+    Only projected fields are kept. Missing values are decoded as nan.
+    """
+    batch = decode_aemet_points(_payload)
+
+    assert len(batch) == 2
+    assert batch[0] == {
+        "fhora": datetime(2023, 1, 1, tzinfo=UTC),
+        "temp": 1.5,
+        "pres": 990.1,
+        "vel": 3.0,
+    }
+    assert isnan(batch[1]["vel"])
+    assert batch.extra == {}
+
+
+def test_decode_extra_fields():
+    "Requested extended fields are kept as well"
+    batch = decode_aemet_points(_payload.encode(), extra_fields=("hr", "ins"))
+
+    assert batch.extra == {"hr": [80, 81], "ins": [None, None]}
+    assert batch[1]["hr"] == 81
+    assert batch[1:].extra == {"hr": [81], "ins": [None]}
+    assert len(batch[1:]) == 1
+
+
+def test_decode_coercion():
+    "Numeric strings are parsed. Null and non numeric values are nan"
+    payload = json.dumps(
+        [
+            {
+                "fhora": "2023-01-01T00:00:00+0000",
+                "temp": None,
+                "pres": "990.5",
+                "vel": 2,
+            },
+            {"fhora": "2023-01-01T00:10:00+0000", "temp": 1, "pres": "", "vel": "n/a"},
+        ]
+    )
+    batch = decode_aemet_points(payload)
+
+    assert isnan(batch.temp[0])
+    assert batch.pres[0] == 990.5
+    assert batch.vel[0] == 2.0
+    assert batch.temp[1] == 1.0
+    assert isnan(batch.pres[1])
+    assert isnan(batch.vel[1])
+
+
+def test_batch_as_sequence():
+    """
+    Batches validate as any other sequence of points and are cheaper than the equivalent dicts.
+    """
+    points = json.loads(_payload)
+    batch = decode_aemet_points(_payload)
+
+    series = WeatherDataPointSeries.model_validate({"points": batch})
+    assert [p.fhora for p in series.points] == [
+        datetime(2023, 1, 1, 0, 0, tzinfo=UTC),
+        datetime(2023, 1, 1, 0, 10, tzinfo=UTC),
+    ]
+    assert points_sizeof(batch) < points_sizeof(points)
+
+
+def test_batch_concat_records():
+    """
+    Concatenated batches keep order. Only batches that are all trusted stay trusted.
+    """
+    batch = decode_aemet_points(_payload)
+    trusted = dataclasses.replace(batch, trusted=True)
+
+    assert not WeatherPointBatch.concat([batch, trusted]).trusted
+    concat = WeatherPointBatch.concat([trusted, trusted[1:]])
+    assert concat.trusted
+    assert concat[1:].trusted
+    assert [r.fhora for r in concat.records()] == [
+        datetime(2023, 1, 1, 0, 0, tzinfo=UTC),
+        datetime(2023, 1, 1, 0, 10, tzinfo=UTC),
+        datetime(2023, 1, 1, 0, 10, tzinfo=UTC),
+    ]
+    assert concat.records()[0].temp == batch[0]["temp"]
+
+
+def test_batch_between():
+    "Half-open date interval of a sorted batch. Sub-second bounds round up"
+    batch = dataclasses.replace(decode_aemet_points(_payload), trusted=True)
+    d0 = datetime(2023, 1, 1, 0, 0, tzinfo=UTC)
+
+    assert len(batch.between(d0, d0 + timedelta(minutes=10))) == 1
+    assert (
+        len(batch.between(d0 + timedelta(microseconds=1), d0 + timedelta(days=1))) == 1
+    )
+    assert batch.between(d0, d0 + timedelta(days=1)).trusted
@@ -0,0 +1,129 @@
+"""
+Testing of upstream deadlines, timeouts and hedging.
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from aemetAntartica.fetcher.context import (
+    api_key_ctx,
+    async_httpx_client_ctx,
+    deadline_ctx,
+    retry_policy_ctx,
+    timeout_policy_ctx,
+)
+from aemetAntartica.fetcher.deadline import (
+    LatencyHedger,
+    TimeoutPolicy,
+    remaining_timeout,
+)
+from aemetAntartica.fetcher.exceptions import DeadlineExceededError
+from aemetAntartica.fetcher.fetch_functions import aemet_fetch_data
+from aemetAntartica.fetcher.rate_limit import RetryPolicy
+
+_data_uri = "https://aemet.test/data"
+_points = [{"fhora": "2023-01-01T00:00:00+0000", "temp": 1.0, "pres": 2.0, "vel": 3.0}]
+
+
+def test_remaining_timeout():
+    """
+    Lowest of timeout and time left. Raises once the deadline has passed.
+    """
+    assert remaining_timeout(None, 5) == 5
+    assert remaining_timeout(10, None, clock=lambda: 4) == 6
+    assert remaining_timeout(10, 2, clock=lambda: 4) == 2
+    with pytest.raises(DeadlineExceededError):
+        remaining_timeout(10, 2, clock=lambda: 10)
+
+
+@pytest.mark.asyncio
+async def test_hedger_hedges_slow_call():
+    """
+    Once enough latencies are known a slow call is hedged and the fastest result wins.
+    """
+    hedger = LatencyHedger(percentile=0.5, min_samples=3)
+    for latency in (0.01, 0.01, 0.01):
+        hedger.observe(latency)
+
+    calls = 0
+
+    async def f() -> int:
+        nonlocal calls
+        calls += 1
+        n = calls
+        await asyncio.sleep(10 if n == 1 else 0)
+        return n
+
+    t0 = time.monotonic()
+    assert await hedger.run(f) == 2
+    assert time.monotonic() - t0 < 1
+
+
+@pytest.mark.asyncio
+async def test_hedger_not_enough_samples():
+    "No hedging until min_samples latencies are known"
+    hedger = LatencyHedger(min_samples=1)
+    calls = 0
+
+    async def f() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await hedger.run(f) == 1
+    assert hedger.hedge_delay() is not None
+    assert calls == 1
+
+
+def slow_then_fast_transport(n_slow: int, delay: float) -> httpx.MockTransport:
+    "First n_slow responses take delay seconds"
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls <= n_slow:
+            await asyncio.sleep(delay)
+        return httpx.Response(200, json=_points)
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_call_timeout_retried():
+    """
+    A hung download times out and is retried.
+    """
+    async with httpx.AsyncClient(transport=slow_then_fast_transport(1, 10)) as client:
+        with (
+            async_httpx_client_ctx(client),
+            api_key_ctx("key"),
+            retry_policy_ctx(RetryPolicy(max_retries=1, base_delay=0.001)),
+            timeout_policy_ctx(TimeoutPolicy(data=0.05)),
+        ):
+            res = await aemet_fetch_data(_data_uri)
+
+    assert len(res) == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_exceeded():
+    """
+    Calls and retries stop at the request deadline.
+    """
+    async with httpx.AsyncClient(transport=slow_then_fast_transport(10, 10)) as client:
+        with (
+            async_httpx_client_ctx(client),
+            api_key_ctx("key"),
+            retry_policy_ctx(RetryPolicy(max_retries=10, base_delay=0.001)),
+            timeout_policy_ctx(TimeoutPolicy(data=None)),
+            deadline_ctx(time.monotonic() + 0.1),
+        ):
+            t0 = time.monotonic()
+            with pytest.raises(DeadlineExceededError):
+                await aemet_fetch_data(_data_uri)
+
+    assert time.monotonic() - t0 < 1
@@ -0,0 +1,127 @@
+"""
+Testing of bounded memory cache.
+"""
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from aemetAntartica.fetcher.memory_cache import (
+    CacheStats,
+    MemoryCache,
+    MemoryCachedFetch,
+    ticket_uri_ttl_factory,
+)
+
+
+class FakeClock:
+    "Manually advanced monotonic clock"
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_memory_cache_lru_eviction():
+    """
+    Least recently used values are evicted to stay within the byte budget.
+    """
+    cache: MemoryCache[str, str] = MemoryCache(
+        max_bytes=3, sizeof=len, ttl=lambda k, v: None
+    )
+
+    cache.put("a", "x")
+    cache.put("b", "x")
+    cache.put("c", "x")
+    assert cache.get("a") == "x"  # B IS NOW THE LEAST RECENTLY USED.
+
+    cache.put("d", "xx")
+
+    assert cache.get("b") is None
+    assert cache.get("c") is None
+    assert cache.get("a") == "x"
+    assert cache.get("d") == "xx"
+    assert cache.stats() == CacheStats(
+        hits=3, misses=2, evictions=2, expirations=0, n_items=2, n_bytes=3
+    )
+
+
+def test_memory_cache_too_large():
+    "Values larger than the whole budget are not cached and don't evict anything"
+    cache: MemoryCache[str, str] = MemoryCache(
+        max_bytes=3, sizeof=len, ttl=lambda k, v: None
+    )
+    cache.put("a", "x")
+    cache.put("b", "xxxx")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x"
+
+
+def test_memory_cache_ttl():
+    """
+    Values with ttl expire. Values without ttl don't.
+    """
+    clock = FakeClock()
+    cache: MemoryCache[str, str] = MemoryCache(
+        max_bytes=100,
+        sizeof=len,
+        ttl=lambda k, v: 10 if k == "open" else None,
+        clock=clock,
+    )
+    cache.put("open", "x")
+    cache.put("closed", "x")
+
+    clock.now = 9
+    assert cache.get("open") == "x"
+
+    clock.now = 1e9
+    assert cache.get("open") is None
+    assert cache.get("closed") == "x"
+    assert cache.stats().expirations == 1
+    assert cache.stats().n_bytes == 1
+
+
+def ticket_uri(date_f: datetime) -> str:
+    date_f_str = date_f.strftime("%Y-%m-%dT%H:%M:%SUTC")
+    return f"https://opendata.aemet.es/opendata/api/antartida/datos/fechaini/2020-01-01T00:00:00UTC/fechafin/{date_f_str}/estacion/89064"
+
+
+@pytest.mark.parametrize(
+    "uri, expected",
+    [
+        (ticket_uri(datetime(2023, 1, 31, 23, 50)), None),
+        (ticket_uri(datetime.now(UTC) + timedelta(days=10)), 60),
+        (ticket_uri(datetime.now(UTC) - timedelta(hours=1)), 60),
+        ("https://opendata.aemet.es/other", 60),
+    ],
+)
+def test_ticket_uri_ttl(uri: str, expected: float | None):
+    """
+    Closed months don't expire. Open or unknown ones do.
+    """
+    ttl = ticket_uri_ttl_factory(open_ttl=60)
+    assert ttl(uri, None) == expected
+
+
+@pytest.mark.asyncio
+async def test_memory_cached_fetch():
+    """
+    Fetch function is only called on miss.
+    """
+    calls: list[str] = []
+
+    async def fetch(uri: str) -> list[int]:
+        calls.append(uri)
+        return [1, 2, 3]
+
+    cached_fetch = MemoryCachedFetch(
+        fetch_function=fetch,
+        cache=MemoryCache(max_bytes=100, sizeof=len, ttl=lambda k, v: None),
+    )
+
+    assert await cached_fetch("a") == [1, 2, 3]
+    assert await cached_fetch("a") == [1, 2, 3]
+    assert calls == ["a"]
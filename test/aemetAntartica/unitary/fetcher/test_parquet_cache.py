@@ -0,0 +1,156 @@
+"""
+Testing of parquet cache proxy using the mock fetcher as data source.
+"""
+
+from datetime import UTC, datetime, timedelta
+from math import isnan
+from pathlib import Path
+
+import pytest
+from conftest import CountingFetcher, gen_points
+
+from aemetAntartica.fetcher.mock import InMemoryStationData, MockWeatherDataFetcher
+
+pytest.importorskip("pyarrow")
+
+from aemetAntartica.fetcher.parquet_cache import (
+    ParquetCacheFetcherProxy,
+    parquet_cache_fetcher_proxy_factory,
+)
+
+_station = 'Mock "station"/1'
+_station_2 = "Mock station 2"
+_date0 = datetime(2023, 1, 1, tzinfo=UTC)
+_datef = datetime(2023, 5, 1, tzinfo=UTC)
+
+
+@pytest.fixture
+def counting_fetcher() -> CountingFetcher:
+    # SOME TEMPERATURES ARE MISSING.
+    timeseries = gen_points(_date0 + timedelta(days=10), _datef, timedelta(minutes=10))
+    for point in timeseries[5::500]:
+        point["temp"] = float("nan")  # type: ignore
+    station_data: InMemoryStationData = {
+        "station_id": "0",
+        "date0": _date0 + timedelta(days=10),
+        "datef": _datef,
+        "timeseries": timeseries,
+    }
+    return CountingFetcher(
+        MockWeatherDataFetcher({_station: station_data, _station_2: station_data})
+    )
+
+
+@pytest.fixture
+def proxy(
+    counting_fetcher: CountingFetcher, tmp_path: Path
+) -> ParquetCacheFetcherProxy:
+    return parquet_cache_fetcher_proxy_factory(counting_fetcher, tmp_path)  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_parquet_cache_consistency(
+    counting_fetcher: CountingFetcher, proxy: ParquetCacheFetcherProxy
+):
+    """
+    Whole months are fetched and stored once. Files return the same points as the network.
+    """
+    d0 = datetime(2023, 1, 20, 3, tzinfo=UTC)
+    df = datetime(2023, 3, 5, tzinfo=UTC)
+
+    fetched = await proxy.timeseries(d0, df, _station)
+    cached = await proxy.timeseries(d0, df, _station)
+
+    # CLIPPED TO THE STATION TIME RANGE
+    assert counting_fetcher.requests == [
+        (_date0 + timedelta(days=10), datetime(2023, 4, 1, tzinfo=UTC))
+    ]
+    assert fetched.trusted and cached.trusted
+    assert cached[0]["fhora"] == d0
+    assert len(cached) == (df - d0) // timedelta(minutes=10)
+    assert list(cached.fhora) == list(fetched.fhora)
+    assert [isnan(t) for t in cached.temp] == [isnan(t) for t in fetched.temp]
+    assert any(isnan(t) for t in cached.temp)
+    assert proxy.month_path(_station, datetime(2023, 2, 1, tzinfo=UTC)).exists()
+
+
+@pytest.mark.asyncio
+async def test_parquet_cache_many(
+    counting_fetcher: CountingFetcher, proxy: ParquetCacheFetcherProxy
+):
+    """
+    Missing months of several stations are fetched concurrently. Results match single station requests.
+    """
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 3, 1, tzinfo=UTC)
+    counting_fetcher.delay = 0.05
+
+    res = await proxy.timeseries_many([_station, _station_2, _station], d0, df)
+
+    assert list(res) == [_station, _station_2]
+    assert counting_fetcher.max_in_flight == 2
+    for station_id in (_station, _station_2):
+        single = await proxy.timeseries(d0, df, station_id)
+        assert list(res[station_id].fhora) == list(single.fhora)
+        assert len(single) > 0
+
+
+@pytest.mark.asyncio
+async def test_parquet_cache_missing_months(
+    counting_fetcher: CountingFetcher, proxy: ParquetCacheFetcherProxy
+):
+    """
+    Only runs of missing months are fetched. Batches are yielded in chronological order.
+    """
+    d = [datetime(2023, m, 1, tzinfo=UTC) for m in range(1, 6)]
+
+    await proxy.timeseries(d[1], d[2], _station)
+    batches = [b async for b in proxy.timeseries_stream(d[0], d[4], _station)]
+
+    assert counting_fetcher.requests == [
+        (d[1], d[2]),
+        (_date0 + timedelta(days=10), d[1]),
+        (d[2], d[4]),
+    ]
+    assert [len(b) > 0 for b in batches] == [True] * 4
+    fhoras = [t for b in batches for t in b.fhora]
+    assert fhoras == sorted(set(fhoras))
+
+
+@pytest.mark.asyncio
+async def test_parquet_cache_unsettled_not_stored(
+    counting_fetcher: CountingFetcher, proxy: ParquetCacheFetcherProxy
+):
+    """
+    Months that may still change upstream are fetched every time.
+    """
+    proxy.settle = datetime.now(UTC) - datetime(2023, 3, 1, tzinfo=UTC)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 4, 1, tzinfo=UTC)
+
+    await proxy.timeseries(d0, df, _station)
+    await proxy.timeseries(d0, df, _station)
+
+    assert counting_fetcher.requests == [
+        (d0, df),
+        (datetime(2023, 3, 1, tzinfo=UTC), df),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_parquet_cache_scan(proxy: ParquetCacheFetcherProxy):
+    """
+    Scans read only the requested columns of stored months.
+    """
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 4, 1, tzinfo=UTC)
+    assert len(await proxy.scan(d0, df, _station)) == 0
+
+    points = await proxy.timeseries(d0, df, _station)
+    table = await proxy.scan(
+        datetime(2023, 2, 15, tzinfo=UTC), df, _station, columns=["fhora", "temp"]
+    )
+
+    assert table.column_names == ["fhora", "temp"]
+    assert len(table) == len(points) - 14 * 144
+    assert table["temp"].to_pylist()[-1] == points[-1]["temp"]
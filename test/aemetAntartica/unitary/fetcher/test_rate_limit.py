@@ -0,0 +1,136 @@
+"""
+Testing of upstream throttling and retries.
+"""
+
+import time
+
+import httpx
+import pytest
+
+from aemetAntartica.fetcher.batch import WeatherPointBatch
+from aemetAntartica.fetcher.context import (
+    api_key_ctx,
+    async_httpx_client_ctx,
+    rate_limiter_ctx,
+    retry_policy_ctx,
+)
+from aemetAntartica.fetcher.exceptions import AemetResponseError
+from aemetAntartica.fetcher.fetch_functions import aemet_2_step_fetch
+from aemetAntartica.fetcher.rate_limit import (
+    AdaptiveRateLimiter,
+    RetryPolicy,
+    parse_retry_after,
+)
+
+_ticket_uri = "https://aemet.test/ticket"
+_data_uri = "https://aemet.test/data"
+_points = [{"fhora": "2023-01-01T00:00:00+0000", "temp": 1.0, "pres": 2.0, "vel": 3.0}]
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, None),
+        ("3", 3.0),
+        ("-1", 0.0),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+        ("not a date", None),
+    ],
+)
+def test_parse_retry_after(value: str | None, expected: float | None):
+    assert parse_retry_after(value) == expected
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_rate():
+    """
+    Once the burst is consumed requests are spaced 1/rate seconds.
+    """
+    rate_limiter = AdaptiveRateLimiter(rate=50, burst=2, max_rate=50)
+
+    t0 = time.monotonic()
+    for _ in range(7):
+        await rate_limiter.acquire()
+    elapsed = time.monotonic() - t0
+
+    assert elapsed >= 5 / 50 * 0.9
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_throttle():
+    """
+    Throttling halves the rate and pauses the bucket for retry_after seconds.
+    """
+    rate_limiter = AdaptiveRateLimiter(
+        rate=100, burst=10, max_rate=1000, increase_step=1
+    )
+
+    rate_limiter.on_throttle(retry_after=0.1)
+    assert rate_limiter.rate == 50
+
+    t0 = time.monotonic()
+    await rate_limiter.acquire()
+    assert time.monotonic() - t0 >= 0.09
+
+    rate_limiter.on_success()
+    assert rate_limiter.rate == 51
+
+
+def mock_aemet_transport(responses: list[httpx.Response]) -> httpx.MockTransport:
+    "Answer with the given responses in order"
+    it = iter(responses)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return next(it)
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_2_step_fetch_retries():
+    """
+    Throttled and server errors are retried in both steps. The limiter adapts to throttling.
+    """
+    transport = mock_aemet_transport(
+        [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, json={"estado": 429, "datos": ""}),
+            httpx.Response(200, json={"estado": 200, "datos": _data_uri}),
+            httpx.Response(503),
+            httpx.Response(200, json=_points),
+        ]
+    )
+    rate_limiter = AdaptiveRateLimiter(
+        rate=100, burst=10, max_rate=1000, increase_step=0
+    )
+
+    async with httpx.AsyncClient(transport=transport) as client:
+        with (
+            async_httpx_client_ctx(client),
+            api_key_ctx("key"),
+            rate_limiter_ctx(rate_limiter),
+            retry_policy_ctx(RetryPolicy(max_retries=3, base_delay=0.001)),
+        ):
+            res = await aemet_2_step_fetch(_ticket_uri)
+
+    assert res == WeatherPointBatch.from_points(_points)
+    assert rate_limiter.rate == 25
+
+
+@pytest.mark.asyncio
+async def test_2_step_fetch_non_retryable():
+    """
+    Client errors are not retried.
+    """
+    transport = mock_aemet_transport([httpx.Response(401), httpx.Response(200)])
+
+    async with httpx.AsyncClient(transport=transport) as client:
+        with (
+            async_httpx_client_ctx(client),
+            api_key_ctx("key"),
+            retry_policy_ctx(RetryPolicy(max_retries=3, base_delay=0.001)),
+            pytest.raises(AemetResponseError) as e,
+        ):
+            await aemet_2_step_fetch(_ticket_uri)
+
+    assert e.value.status_code == 401
@@ -0,0 +1,739 @@
+"""
+Testing of sql cache proxy using the mock fetcher as data source.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import UTC, datetime, timedelta, tzinfo
+from itertools import chain
+from math import isnan
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import asyncstdlib
+import pytest
+import pytest_asyncio
+from conftest import CountingFetcher, gen_points
+
+from aemetAntartica.aggregator.bucketing import CalendarPeriod, bucket_starts
+from aemetAntartica.aggregator.iteration import first_agg, last_agg, mean_agg
+from aemetAntartica.aggregator.streaming import approx_percentile_agg_factory
+from aemetAntartica.fetcher.annot import SqlAggType
+from aemetAntartica.fetcher.mock import InMemoryStationData, MockWeatherDataFetcher
+from aemetAntartica.fetcher.sql_cache import (
+    CacheWrite,
+    SqliteCacheFetcherProxy,
+    coverage_segments,
+    sqlite_cache_fetcher_proxy_factory,
+)
+from aemetAntartica.fetcher.sql_retention import (
+    EvictionCandidate,
+    RetentionPolicy,
+    plan_evictions,
+)
+from aemetAntartica.fetcher.sql_sketch import month_parts
+from aemetAntartica.model.fetch import WeatherDataPointSeries
+
+_station = "Mock station"
+_station_2 = "Mock station 2"
+_date0 = datetime(2023, 1, 1, tzinfo=UTC)
+_datef = datetime(2023, 5, 1, tzinfo=UTC)
+
+
+@pytest.fixture
+def counting_fetcher() -> CountingFetcher:
+    station_data: InMemoryStationData = {
+        "station_id": "0",
+        "date0": _date0,
+        "datef": _datef,
+        "timeseries": gen_points(_date0, _datef, timedelta(minutes=10)),
+    }
+    return CountingFetcher(
+        MockWeatherDataFetcher({_station: station_data, _station_2: station_data})
+    )
+
+
+type ProxyFactory = Callable[..., Awaitable[SqliteCacheFetcherProxy]]
+
+
+@pytest_asyncio.fixture
+async def proxy_factory(tmp_path: Path) -> AsyncIterator[ProxyFactory]:
+    "Proxies over a fresh database. Their connections are closed on teardown"
+    proxies: list[SqliteCacheFetcherProxy] = []
+
+    async def factory(fetcher: CountingFetcher, **kwargs) -> SqliteCacheFetcherProxy:
+        proxy = await sqlite_cache_fetcher_proxy_factory(
+            fetcher=fetcher,  # type: ignore
+            sqlite_uri=str(tmp_path / "cache.db"),
+            **kwargs,
+        )
+        proxies.append(proxy)
+        return proxy
+
+    yield factory
+
+    for proxy in proxies:
+        await proxy.aclose()
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_consistency(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Second request of the same range returns the same points.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 3, 1, tzinfo=UTC)
+
+    fetched = await proxy.timeseries(d0, df, _station)
+    cached = await proxy.timeseries(d0, df, _station)
+
+    assert [p["fhora"] for p in cached] == [p["fhora"] for p in fetched]
+    assert [p["temp"] for p in cached] == [p["temp"] for p in fetched]
+    assert cached.trusted
+    assert cached.records() == [
+        (p.fhora, p.temp, p.pres, p.vel)
+        for p in WeatherDataPointSeries.model_validate({"points": fetched}).points
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_stream_order(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Leading gap, cached points and trailing gap are streamed in chronological order without duplicates.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    await proxy.timeseries(
+        datetime(2023, 2, 1, tzinfo=UTC), datetime(2023, 3, 1, tzinfo=UTC), _station
+    )
+
+    batches = await asyncstdlib.list(
+        proxy.timeseries_stream(_date0, datetime(2023, 4, 1, tzinfo=UTC), _station)
+    )
+    dates = [p["fhora"] for batch in batches for p in batch]
+
+    assert len(batches) > 1
+    assert dates == sorted(set(dates))
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_coalesced_gaps(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Concurrent requests of the same missing range fetch it from the network once.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 4, 1, tzinfo=UTC)
+
+    results = await asyncio.gather(*[proxy.timeseries(d0, df, _station)] * 3)
+
+    assert len(counting_fetcher.requests) == 1
+    for res in results[1:]:
+        assert [p["fhora"] for p in res] == [p["fhora"] for p in results[0]]
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_many(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Stations sharing a gap are fetched with a single multi-station request. Results match single station requests.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 3, 1, tzinfo=UTC)
+
+    res = await proxy.timeseries_many([_station, _station_2], d0, df)
+
+    assert counting_fetcher.many_requests == [([_station, _station_2], d0, df)]
+    assert counting_fetcher.requests == []
+    for station_id in (_station, _station_2):
+        single = await proxy.timeseries(d0, df, station_id)
+        assert [p["fhora"] for p in res[station_id]] == [p["fhora"] for p in single]
+        assert len(single) > 0
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_many_concurrent_gaps(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Distinct gaps of several stations are fetched concurrently, not one station after another.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 4, 1, tzinfo=UTC)
+    # EACH STATION HAS A DIFFERENT MONTH CACHED: DIFFERENT GAPS.
+    await proxy.timeseries(d0, datetime(2023, 3, 1, tzinfo=UTC), _station)
+    await proxy.timeseries(datetime(2023, 3, 1, tzinfo=UTC), df, _station_2)
+    await proxy.flush()
+
+    counting_fetcher.delay = 0.05
+    res = await proxy.timeseries_many([_station, _station_2], d0, df)
+
+    assert len(counting_fetcher.many_requests) == 2
+    assert counting_fetcher.max_in_flight == 2
+    for station_id in (_station, _station_2):
+        single = await proxy.timeseries(d0, df, station_id)
+        assert [p["fhora"] for p in res[station_id]] == [p["fhora"] for p in single]
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_insert_upsert(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Overlapping inserts overwrite cached points. Station ids are bound, never interpolated.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    station_id = 'quoted "station"; --'
+    d0 = datetime(2023, 1, 1, tzinfo=UTC)
+    df = datetime(2023, 1, 2, tzinfo=UTC)
+    points = WeatherDataPointSeries.model_validate(
+        {"points": gen_points(d0, df, timedelta(minutes=10))}
+    ).points
+    updated = [p.model_copy(update={"temp": float("nan")}) for p in points[72:]]
+
+    await proxy._write(CacheWrite(station_id, points[:100]))
+    await proxy._write(CacheWrite(station_id, updated))
+    await proxy.flush()
+
+    cached = list(
+        chain.from_iterable(
+            await asyncstdlib.list(proxy._read_cached(d0, df, station_id))
+        )
+    )
+    assert [p["fhora"] for p in cached] == [p.fhora for p in points]
+    assert [p["temp"] for p in cached[:72]] == [p.temp for p in points[:72]]
+    assert all(isnan(p["temp"]) for p in cached[72:])
+
+
+def test_coverage_segments():
+    """
+    Covered intervals are clipped to the request and the rest is returned as gaps.
+    """
+    d = [datetime(2023, m, 1, tzinfo=UTC) for m in range(1, 8)]
+
+    assert coverage_segments(d[1], d[5], [(d[0], d[2]), (d[3], d[4])]) == [
+        (d[1], d[2], True),
+        (d[2], d[3], False),
+        (d[3], d[4], True),
+        (d[4], d[5], False),
+    ]
+    assert coverage_segments(d[1], d[2], []) == [(d[1], d[2], False)]
+    assert coverage_segments(d[1], d[2], [(d[0], d[6])]) == [(d[1], d[2], True)]
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_interior_gap(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Only the exact uncovered sub-intervals are fetched. Covered ranges are never fetched again.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d = [datetime(2023, m, 1, tzinfo=UTC) for m in range(1, 6)]
+
+    await proxy.timeseries(d[0], d[1], _station)
+    await proxy.timeseries(d[2], d[3], _station)
+    await proxy.flush()
+    res = await proxy.timeseries(d[0], d[4], _station)
+    await proxy.flush()
+    await proxy.timeseries(d[0], d[4], _station)
+
+    assert counting_fetcher.requests == [
+        (d[0], d[1]),
+        (d[2], d[3]),
+        (d[1], d[2]),
+        (d[3], d[4]),
+    ]
+    dates = [p["fhora"] for p in res]
+    assert dates == sorted(set(dates))
+    assert len(dates) == (d[4] - d[0]) // timedelta(minutes=10)
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_empty_interval(proxy_factory: ProxyFactory):
+    """
+    Intervals known to be empty are covered as well. They are not requested again.
+    """
+    station_data: InMemoryStationData = {
+        "station_id": "0",
+        "date0": _date0,
+        "datef": _datef,
+        "timeseries": gen_points(
+            _date0, _date0 + timedelta(days=1), timedelta(hours=1)
+        ),
+    }
+    counting_fetcher = CountingFetcher(MockWeatherDataFetcher({_station: station_data}))
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 3, 1, tzinfo=UTC)
+
+    assert len(await proxy.timeseries(d0, df, _station)) == 0
+    assert len(await proxy.timeseries(d0, df, _station)) == 0
+    assert len(counting_fetcher.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_unsettled_not_covered(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Data newer than coverage_settle may still change upstream. It is fetched every time.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    proxy.coverage_settle = datetime.now(UTC) - datetime(2023, 2, 1, tzinfo=UTC)
+
+    await proxy.timeseries(_date0, datetime(2023, 3, 1, tzinfo=UTC), _station)
+    await proxy.flush()
+    await proxy.timeseries(_date0, datetime(2023, 3, 1, tzinfo=UTC), _station)
+
+    assert counting_fetcher.requests[1][0] > datetime(2023, 1, 31, tzinfo=UTC)
+    assert len(counting_fetcher.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_rollups(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Rollups match the raw cached points of each calendar bucket. Nan values are ignored.
+    """
+    timeseries = counting_fetcher.fetcher.station_data[_station]["timeseries"]
+    for point in timeseries[5::500]:
+        point["temp"] = float("nan")  # type: ignore
+    proxy = await proxy_factory(counting_fetcher)
+    d = [datetime(2023, m, 1, tzinfo=UTC) for m in range(1, 6)]
+
+    # TWO INSERTS TOUCHING THE SAME MONTH. THE SECOND ONE MUST REFRESH IT WHOLE.
+    await proxy.timeseries(d[0], d[1] + timedelta(days=10), _station)
+    await proxy.flush()
+    res = await proxy.timeseries(d[0], d[4], _station)
+    await proxy.flush()
+
+    monthly = await proxy.rollups(d[0], d[4], _station, "month")
+    assert [r.bucket for r in monthly] == d[:4]
+
+    for rollup, month_0, month_f in zip(monthly, d, d[1:]):
+        points = [p for p in res if month_0 <= p["fhora"] < month_f]
+        temps = [p["temp"] for p in points if not isnan(p["temp"])]
+
+        assert rollup.n == len(points)
+        assert rollup.first_fhora == points[0]["fhora"]
+        assert rollup.last_fhora == points[-1]["fhora"]
+        assert rollup.temp.count == len(temps)
+        assert rollup.temp.mean == pytest.approx(sum(temps) / len(temps))
+        assert rollup.temp.min == min(temps)
+        assert rollup.temp.max == max(temps)
+        assert rollup.pres.first == points[0]["pres"]
+        assert rollup.vel.last == points[-1]["vel"]
+
+    hourly = await proxy.rollups(d[0], d[4], _station, "hour")
+    assert len(hourly) == (d[4] - d[0]) // timedelta(hours=1)
+    assert sum(r.n for r in hourly) == len(res)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("agg", ["first", "last", "mean"])
+@pytest.mark.parametrize("period", ["hour", "day", "month"])
+@pytest.mark.parametrize("tz", [UTC, ZoneInfo("Europe/Madrid")])
+async def test_sql_cache_aggregate(
+    counting_fetcher: CountingFetcher,
+    proxy_factory: ProxyFactory,
+    agg: SqlAggType,
+    period: CalendarPeriod,
+    tz: tzinfo,
+):
+    """
+    Aggregations pushed down to sql (rollups and edges read raw) match the python aggregations.
+    Partially cached intervals are not aggregated.
+    """
+    timeseries = counting_fetcher.fetcher.station_data[_station]["timeseries"]
+    for point in timeseries[5::500]:
+        point["temp"] = float("nan")  # type: ignore
+    proxy = await proxy_factory(counting_fetcher, rollup_timezone=tz)
+    d0 = datetime(2023, 1, 1, tzinfo=UTC)
+    df = datetime(2023, 5, 1, tzinfo=UTC)
+
+    assert (
+        await proxy.aggregate(d0, df, _station, agg, bucket_starts(d0, df, period, tz))
+        is None
+    )
+
+    points = WeatherDataPointSeries.model_validate(
+        {"points": await proxy.timeseries(d0, df, _station)}
+    ).points
+    await proxy.flush()
+
+    # WHOLE CACHED RANGE AND A RANGE WITH PARTIAL EDGE BUCKETS.
+    for date_0, date_f in (
+        (d0, df),
+        (d0 + timedelta(days=10, hours=3), df - timedelta(days=5)),
+    ):
+        buckets = bucket_starts(date_0, date_f, period, tz)
+        res = await proxy.aggregate(date_0, date_f, _station, agg, buckets)
+        expected = {"first": first_agg, "last": last_agg, "mean": mean_agg}[agg](
+            [p for p in points if date_0 <= p.fhora < date_f], period, tz
+        )
+
+        assert res is not None
+        assert len(res) == len(expected)
+        for p_sql, p_py in zip(res, expected):
+            assert p_sql.fhora == p_py.fhora
+            for prop in ("temp", "pres", "vel"):
+                sql_val, py_val = getattr(p_sql, prop), getattr(p_py, prop)
+                assert (isnan(sql_val) and isnan(py_val)) or sql_val == pytest.approx(
+                    py_val
+                )
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_aggregate_rollups(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Buckets of the rollup timezone are read from the rollups. Stale rollups and other timezones are aggregated raw.
+    """
+    tz = ZoneInfo("Europe/Madrid")
+    proxy = await proxy_factory(counting_fetcher, rollup_timezone=tz)
+    d0 = datetime(2023, 2, 1, tzinfo=tz)
+    df = datetime(2023, 5, 1, tzinfo=tz)
+    await proxy.timeseries(d0 - timedelta(days=1), df, _station)
+    await proxy.flush()
+    buckets = bucket_starts(d0, df, "month", tz)
+    raw = await proxy.aggregate(d0, df, _station, "mean", buckets)
+    assert raw is not None and len(raw) == 3
+
+    # SHIFTED ROLLUPS ARE NOTICED IN THE RESULT: THEY ARE READ INSTEAD OF THE RAW POINTS.
+    async with proxy.pool.writer() as db:
+        await db.execute("UPDATE rollups SET temp_sum = temp_sum + 100 * temp_count")
+        await db.commit()
+    rolled_up = await proxy.aggregate(d0, df, _station, "mean", buckets)
+    assert rolled_up is not None
+    assert [p.temp for p in rolled_up] == pytest.approx([p.temp + 100 for p in raw])
+
+    other_tz = await proxy.aggregate(
+        d0, df, _station, "mean", bucket_starts(d0, df, "month", UTC)
+    )
+    assert other_tz is not None and all(p.temp < 100 for p in other_tz)
+
+    # ROLLUPS NOT COUNTING EVERY CACHED POINT ARE IGNORED.
+    async with proxy.pool.writer() as db:
+        await db.execute(
+            "DELETE FROM rollups WHERE period == 'month' AND bucket == '2023-02-28 23:00:00'"
+        )
+        await db.commit()
+    stale = await proxy.aggregate(d0, df, _station, "mean", buckets)
+    assert stale == raw
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tz", [UTC, ZoneInfo("Europe/Madrid")])
+async def test_sql_cache_quantiles(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory, tz: tzinfo
+):
+    """
+    Quantiles merged from cached month sketches match sketches of the raw points. Partially cached intervals are not aggregated.
+    """
+    timeseries = counting_fetcher.fetcher.station_data[_station]["timeseries"]
+    for i, point in enumerate(timeseries):
+        point["vel"] = (i * 7919 % 1000) / 10
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 1, 10, tzinfo=UTC)
+    df = datetime(2023, 5, 1, tzinfo=UTC)
+    buckets = bucket_starts(d0, df, "month", tz)
+
+    assert await proxy.quantiles(d0, df, _station, 0.9, buckets) is None
+
+    points = WeatherDataPointSeries.model_validate(
+        {"points": await proxy.timeseries(d0, df, _station)}
+    ).points
+    await proxy.flush()
+    res = await proxy.quantiles(d0, df, _station, 0.9, buckets)
+
+    expected = approx_percentile_agg_factory(0.9)(points, "month", tz)
+
+    assert res is not None
+    assert [p.fhora for p in res] == [p.fhora for p in expected]
+    # SAME SKETCH BINS. SUBTRACTED MONTHS ONLY KEEP LOOSER EXTREMES.
+    for p_sql, p_py in zip(res, expected):
+        assert tuple(p_sql[1:]) == pytest.approx(tuple(p_py[1:]), rel=0.02)
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_sketch_refresh(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Month sketches are refreshed after the write commits. A refresh outdated by a later write of the month is discarded.
+    """
+    proxy = await proxy_factory(counting_fetcher, write_queue_size=0)
+    d0 = datetime(2023, 1, 1, tzinfo=UTC)
+    df = datetime(2023, 2, 1, tzinfo=UTC)
+    points = WeatherDataPointSeries.model_validate(
+        {"points": gen_points(d0, df, timedelta(hours=1))}
+    ).points
+
+    # REFRESH OF THE FIRST WRITE SUSPENDED AFTER READING THE MONTH.
+    read_batch = proxy._read_batch
+    suspended = asyncio.Event()
+    gate = asyncio.Event()
+
+    async def suspended_read_batch(*args):
+        batch = await read_batch(*args)
+        if not suspended.is_set():
+            suspended.set()
+            await gate.wait()
+        return batch
+
+    proxy._read_batch = suspended_read_batch  # type: ignore
+    write = asyncio.create_task(
+        proxy._write(CacheWrite(_station, points, coverage=(d0, df)))
+    )
+    await suspended.wait()
+    updated = [p.model_copy(update={"pres": p.pres + 20}) for p in points]
+    await proxy._write(CacheWrite(_station, updated))
+    gate.set()
+    await write
+    proxy._read_batch = read_batch  # type: ignore
+
+    res = await proxy.quantiles(d0, df, _station, 1, [d0, df])
+    assert res is not None
+    assert res[0].pres == pytest.approx(max(p.pres for p in updated), abs=0.5)
+    # NOTHING PENDING IS KEPT.
+    assert proxy._sketch_versions == {}
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_retention(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Least recently accessed months are evicted whole. Evicted months are fetched again, the rest stay covered.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d = [datetime(2023, m, 1, tzinfo=UTC) for m in range(1, 6)]
+
+    fetched = await proxy.timeseries(d[0], d[4], _station)
+    await proxy.flush()
+    await proxy.timeseries(d[0], d[0] + timedelta(days=2), _station)
+
+    # 4 MONTHS OF 10 MINUTES DATA: 17280 POINTS. FEBRUARY AND MARCH ARE THE LEAST RECENTLY ACCESSED.
+    proxy.retention = RetentionPolicy(max_station_rows=9000)
+    evicted = await proxy.maintain()
+    assert [c.month for c in evicted] == ["2023-02-01 00:00:00", "2023-03-01 00:00:00"]
+    assert len(await proxy.rollups(d[0], d[4], _station, "month")) == 2
+    assert await proxy.maintain() == []
+
+    counting_fetcher.requests.clear()
+    cached = await proxy.timeseries(d[0], d[4], _station)
+    assert counting_fetcher.requests == [(d[1], d[3])]
+    assert list(cached.fhora) == list(fetched.fhora)
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_retention_without_sketches(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Months are counted from their points. Months without a sketch (i.e. not refreshed yet) are evicted too.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 1, 1, tzinfo=UTC)
+    df = datetime(2023, 5, 1, tzinfo=UTC)
+    await proxy.timeseries(d0, df, _station)
+    await proxy.flush()
+    async with proxy.pool.writer() as db:
+        await db.execute("DELETE FROM sketches WHERE month == '2023-01-01 00:00:00'")
+        await db.commit()
+
+    proxy.retention = RetentionPolicy(max_station_rows=9000)
+    evicted = await proxy.maintain()
+    assert [(c.month, c.n) for c in evicted] == [
+        ("2023-01-01 00:00:00", 31 * 144),
+        ("2023-02-01 00:00:00", 28 * 144),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_retention_pinned_reads(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Months being read are not evicted. Reads starting during an eviction wait for it and fetch the evicted months.
+    """
+    proxy = await proxy_factory(counting_fetcher, retention=RetentionPolicy(max_rows=0))
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 4, 1, tzinfo=UTC)
+    fetched = await proxy.timeseries(d0, df, _station)
+    await proxy.flush()
+
+    # READ SUSPENDED AFTER ITS COVERAGE CHECK.
+    proxy.read_batch_size = 100
+    stream = proxy.timeseries_stream(d0, df, _station)
+    await anext(stream)
+    assert await proxy.maintain() == []
+    await stream.aclose()
+
+    # EVICTION IN PROGRESS. THE READ WAITS FOR IT.
+    counting_fetcher.requests.clear()
+    delete_month = proxy._delete_month
+    gate = asyncio.Event()
+
+    async def gated_delete_month(*args):
+        await gate.wait()
+        await delete_month(*args)
+
+    proxy._delete_month = gated_delete_month  # type: ignore
+    maintenance = asyncio.create_task(proxy.maintain())
+    await asyncio.sleep(0.05)
+    read = asyncio.create_task(proxy.timeseries(d0, df, _station))
+    await asyncio.sleep(0.05)
+    assert not read.done()
+    gate.set()
+
+    assert len(await maintenance) == 2
+    assert list((await read).fhora) == list(fetched.fhora)
+    assert counting_fetcher.requests == [(d0, df)]
+
+
+def test_plan_evictions():
+    "Row and byte budgets evict in candidate order. Pinned months are kept"
+    candidates = [
+        EvictionCandidate("a", "2023-01-01 00:00:00", 10),
+        EvictionCandidate("b", "2023-01-01 00:00:00", 10),
+        EvictionCandidate("a", "2023-02-01 00:00:00", 10),
+        EvictionCandidate("b", "2023-02-01 00:00:00", 10),
+    ]
+
+    assert plan_evictions(candidates, RetentionPolicy()) == []
+    assert plan_evictions(candidates, RetentionPolicy(max_rows=25)) == candidates[:2]
+    assert (
+        plan_evictions(
+            candidates,
+            RetentionPolicy(max_rows=25),
+            pinned=[("a", candidates[0].month)],
+        )
+        == candidates[1:3]
+    )
+    # 100 BYTES PER ROW
+    assert (
+        plan_evictions(candidates, RetentionPolicy(max_bytes=3000), used_bytes=4000)
+        == candidates[:1]
+    )
+    assert (
+        plan_evictions(candidates, RetentionPolicy(max_station_rows=10, max_rows=15))
+        == candidates[:3]
+    )
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_write_behind(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Misses return without waiting for sqlite. Identical requests wait for the pending write instead of fetching.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    d0 = datetime(2023, 2, 1, tzinfo=UTC)
+    df = datetime(2023, 4, 1, tzinfo=UTC)
+
+    # BUSY WRITER: NOTHING CAN BE COMMITTED.
+    async with proxy.pool.writer():
+        fetched = await asyncio.wait_for(proxy.timeseries(d0, df, _station), 5)
+        follower = asyncio.create_task(proxy.timeseries(d0, df, _station))
+        await asyncio.sleep(0.1)
+        assert not follower.done()
+        assert await proxy.rollups(d0, df, _station, "month") == []
+
+    cached = await follower
+    assert counting_fetcher.requests == [(d0, df)]
+    assert list(cached.fhora) == list(fetched.fhora)
+    assert len(await proxy.rollups(d0, df, _station, "month")) == 2
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_write_backpressure(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    Network streams wait while the write queue is full. Pending writes are flushed on close.
+    """
+    proxy = await proxy_factory(counting_fetcher, write_queue_size=1)
+
+    async with proxy.pool.writer():
+        request = asyncio.create_task(proxy.timeseries(_date0, _datef, _station))
+        await asyncio.sleep(0.1)
+        assert not request.done()
+
+    fetched = await request
+    await proxy.aclose()
+
+    counting_fetcher.requests.clear()
+    proxy = await proxy_factory(counting_fetcher)
+    cached = await proxy.timeseries(_date0, _datef, _station)
+    assert counting_fetcher.requests == []
+    assert list(cached.fhora) == list(fetched.fhora)
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_failed_insert_followers(
+    counting_fetcher: CountingFetcher, proxy_factory: ProxyFactory
+):
+    """
+    A failed point insert leaves its range uncovered. Followers of the gap fetch it again instead of reading a partial range.
+    """
+    proxy = await proxy_factory(counting_fetcher)
+    # ONE TRANSACTION PER WRITE: ONLY THE FIRST MONTH FAILS.
+    proxy.write_batch_size = 1
+    insert_points = proxy._insert_points
+    n_inserts = 0
+
+    async def failing_insert_points(*args):
+        nonlocal n_inserts
+        n_inserts += 1
+        if n_inserts == 1:
+            raise OSError("disk I/O error")
+        return await insert_points(*args)
+
+    proxy._insert_points = failing_insert_points  # type: ignore
+
+    async with proxy.pool.writer():
+        fetched = await proxy.timeseries(_date0, _datef, _station)
+        followers = [
+            asyncio.create_task(proxy.timeseries(_date0, _datef, _station))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.1)
+
+    for follower in followers:
+        assert list((await follower).fhora) == list(fetched.fhora)
+    assert len(counting_fetcher.requests) > 1
+
+
+def test_sketch_month_parts():
+    "Months mostly inside the interval are used, the rest is read raw"
+    d = datetime(2023, 1, 31, 23, tzinfo=UTC)
+    parts = month_parts(d, datetime(2023, 4, 10, tzinfo=UTC))
+
+    assert parts == [
+        (d, datetime(2023, 2, 1, tzinfo=UTC), None),
+        (
+            datetime(2023, 2, 1, tzinfo=UTC),
+            datetime(2023, 3, 1, tzinfo=UTC),
+            (datetime(2023, 2, 1, tzinfo=UTC), datetime(2023, 3, 1, tzinfo=UTC)),
+        ),
+        (
+            datetime(2023, 3, 1, tzinfo=UTC),
+            datetime(2023, 4, 1, tzinfo=UTC),
+            (datetime(2023, 3, 1, tzinfo=UTC), datetime(2023, 4, 1, tzinfo=UTC)),
+        ),
+        (datetime(2023, 4, 1, tzinfo=UTC), datetime(2023, 4, 10, tzinfo=UTC), None),
+    ]
@@ -0,0 +1,40 @@
+"""
+Testing of the sqlite connection pool.
+"""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from aemetAntartica.fetcher.sqlite_pool import SqlitePool
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pool_wal_readers(tmp_path: Path):
+    """
+    Readers see committed data while the writer holds an open transaction. Readers can't write.
+    """
+    pool = SqlitePool(str(tmp_path / "pool.db"), n_readers=2)
+    await pool.open()
+    try:
+        async with pool.writer() as db:
+            async with db.execute("PRAGMA journal_mode;") as cursor:
+                assert await cursor.fetchone() == ("wal",)
+            await db.execute("CREATE TABLE t(x INTEGER);")
+            await db.execute("INSERT INTO t VALUES (1);")
+            await db.commit()
+
+        async with pool.writer() as db:
+            await db.execute("INSERT INTO t VALUES (2);")
+
+            async with pool.reader() as reader, reader.execute("SELECT x FROM t;") as c:
+                assert await c.fetchall() == [(1,)]
+
+            await db.commit()
+
+        async with pool.reader() as reader:
+            with pytest.raises(sqlite3.OperationalError):
+                await reader.execute("INSERT INTO t VALUES (3);")
+    finally:
+        await pool.close()
@@ -0,0 +1,36 @@
+"""
+Testing of custom httpx transports.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from aemetAntartica.fetcher.transport import HostLimitedTransport
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_per_host", [1, 2])
+async def test_host_limited_transport(max_per_host: int):
+    """
+    No more than max_per_host requests in flight to the same host. Other hosts are not affected.
+    """
+    in_flight: dict[str, int] = {}
+    max_in_flight: dict[str, int] = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        in_flight[host] = in_flight.get(host, 0) + 1
+        max_in_flight[host] = max(max_in_flight.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        return httpx.Response(200, json={"host": host})
+
+    transport = HostLimitedTransport(httpx.MockTransport(handler), max_per_host)
+    async with httpx.AsyncClient(transport=transport) as client:
+        uris = [f"https://{host}/" for host in ["a.test", "b.test"] * 5]
+        responses = await asyncio.gather(*map(client.get, uris))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert max_in_flight == {"a.test": max_per_host, "b.test": max_per_host}
@@ -0,0 +1,177 @@
+"""
+Testing of background cache warm-up using the mock fetcher as data source.
+"""
+
+import asyncio
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+
+import pytest
+
+from aemetAntartica.fetcher.annot import WeatherPoint
+from aemetAntartica.fetcher.factory import gen_cache_warmer_env_var
+from aemetAntartica.fetcher.mock import InMemoryStationData, MockWeatherDataFetcher
+from aemetAntartica.fetcher.rate_limit import RetryPolicy
+from aemetAntartica.fetcher.warmup import CacheWarmer
+
+_date0 = datetime(2023, 1, 15, tzinfo=UTC)
+_datef = datetime(2023, 4, 10, tzinfo=UTC)
+
+
+@dataclass
+class RecordingFetcher:
+    """
+    Mock fetcher wrapper that records requests. Fails the requests of the given months.
+    """
+
+    fetcher: MockWeatherDataFetcher
+    failing: set[datetime] = field(default_factory=set)
+    "Times every failing month fails before recovering. Always if None"
+    n_failures: int | None = None
+    requests: list[tuple[str, datetime, datetime]] = field(default_factory=list)
+
+    async def stations(self) -> Sequence[str]:
+        return await self.fetcher.stations()
+
+    async def time_range(self, station_id: str) -> tuple[datetime, datetime]:
+        return await self.fetcher.time_range(station_id)
+
+    async def timeseries(
+        self, date_0: datetime, date_f: datetime, station_id: str
+    ) -> Sequence[WeatherPoint]:
+        self.requests.append((station_id, date_0, date_f))
+        n_requests = sum(r[1] == date_0 for r in self.requests)
+        if date_0 in self.failing and (
+            self.n_failures is None or n_requests <= self.n_failures
+        ):
+            raise ConnectionError("Upstream down")
+        return await self.fetcher.timeseries(date_0, date_f, station_id)
+
+
+@pytest.fixture
+def fetcher() -> RecordingFetcher:
+    station_data: InMemoryStationData = {
+        "station_id": "0",
+        "date0": _date0,
+        "datef": _datef,
+        "timeseries": [],
+    }
+    return RecordingFetcher(MockWeatherDataFetcher({"a": station_data}))
+
+
+@pytest.mark.asyncio
+async def test_warmup_recent_first(fetcher: RecordingFetcher):
+    """
+    Whole history clipped to the station range, newest month first. Unsettled months are skipped.
+    """
+    warmer = CacheWarmer(
+        fetcher,  # type: ignore
+        interval=0,
+        now=lambda: datetime(2023, 4, 5, tzinfo=UTC),
+    )
+    await warmer.run()
+
+    assert fetcher.requests == [
+        ("a", datetime(2023, 3, 1, tzinfo=UTC), datetime(2023, 4, 1, tzinfo=UTC)),
+        ("a", datetime(2023, 2, 1, tzinfo=UTC), datetime(2023, 3, 1, tzinfo=UTC)),
+        ("a", _date0, datetime(2023, 2, 1, tzinfo=UTC)),
+    ]
+    assert warmer.progress.finished
+    assert warmer.progress.months_done == warmer.progress.months_total == 3
+
+
+@pytest.mark.asyncio
+async def test_warmup_resume(fetcher: RecordingFetcher, tmp_path: Path):
+    """
+    A new warmer resumes from the state file. Failed months are retried.
+    """
+    fetcher.failing = {datetime(2023, 2, 1, tzinfo=UTC)}
+    state_path = tmp_path / "warmup.json"
+    now = datetime(2023, 6, 1, tzinfo=UTC)
+
+    first = CacheWarmer(
+        fetcher,  # type: ignore
+        interval=0,
+        state_path=state_path,
+        now=lambda: now,
+        retry_policy=RetryPolicy(max_retries=0),
+    )
+    await first.run()
+    assert first.progress.months_failed == 1
+    assert first.progress.months_done == 3
+
+    fetcher.failing = set()
+    fetcher.requests = []
+    second = CacheWarmer(fetcher, interval=0, state_path=state_path, now=lambda: now)  # type: ignore
+    await second.run()
+
+    assert fetcher.requests == [
+        ("a", datetime(2023, 2, 1, tzinfo=UTC), datetime(2023, 3, 1, tzinfo=UTC))
+    ]
+    assert second.progress.months_total == 1
+    assert second.progress.months_done == 1
+
+
+@pytest.mark.asyncio
+async def test_warmup_retry(fetcher: RecordingFetcher):
+    """
+    Failed months are retried after the rest, once per retry round, until they succeed.
+    """
+    failing = datetime(2023, 2, 1, tzinfo=UTC)
+    fetcher.failing = {failing}
+    warmer = CacheWarmer(
+        fetcher,  # type: ignore
+        interval=0,
+        now=lambda: datetime(2023, 6, 1, tzinfo=UTC),
+        retry_policy=RetryPolicy(max_retries=2, base_delay=0),
+    )
+    await warmer.run()
+
+    assert [r[1] for r in fetcher.requests][-3:] == [_date0, failing, failing]
+    assert warmer.progress.months_failed == 1
+    assert warmer.progress.months_done == 3
+
+    fetcher.requests = []
+    fetcher.n_failures = 1
+    warmer = CacheWarmer(
+        fetcher,  # type: ignore
+        interval=0,
+        now=lambda: datetime(2023, 6, 1, tzinfo=UTC),
+        retry_policy=RetryPolicy(max_retries=2, base_delay=0),
+    )
+    await warmer.run()
+
+    assert [r[1] for r in fetcher.requests][-2:] == [_date0, failing]
+    assert warmer.progress.months_failed == 0
+    assert warmer.progress.months_done == 4
+
+
+def test_warmup_requires_persistent_cache(monkeypatch: pytest.MonkeyPatch):
+    "Warming up without sqlite nor parquet cache is a configuration error"
+    monkeypatch.setenv("AEMET_WARMUP", "true")
+    monkeypatch.delenv("AEMET_SQLITE_URL", raising=False)
+    monkeypatch.delenv("AEMET_PARQUET_DIR", raising=False)
+    with pytest.raises(ValueError, match="AEMET_WARMUP"):
+        asyncio.run(gen_cache_warmer_env_var())
+
+
+@pytest.mark.asyncio
+async def test_warmup_throttled(fetcher: RecordingFetcher):
+    """
+    Consecutive months wait the interval. The task can be cancelled while waiting.
+    """
+    warmer = CacheWarmer(
+        fetcher,  # type: ignore
+        interval=10,
+        now=lambda: datetime(2023, 6, 1, tzinfo=UTC),
+    )
+    task = asyncio.create_task(warmer.run())
+    await asyncio.sleep(0.05)
+
+    assert len(fetcher.requests) == 1
+    assert warmer.progress.current == "a 2023-04"
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
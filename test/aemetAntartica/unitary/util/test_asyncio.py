@@ -0,0 +1,257 @@
+"""
+Testing of asyncio utilities.
+"""
+
+import asyncio
+
+import asyncstdlib
+import pytest
+
+from aemetAntartica.util.asyncio import (
+    SingleFlight,
+    bounded_map,
+    pipeline_map,
+    single_flight,
+)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "delays, limit",
+    [
+        ([0.03, 0.01, 0.02, 0.0, 0.01], 2),
+        ([0.01] * 7, 3),
+        ([0.0], 10),
+    ],
+)
+async def test_bounded_map_order(delays: list[float], limit: int):
+    """
+    Results come back in input order regardless of completion order. No partial chunk is dropped.
+    """
+
+    async def f(i: int) -> int:
+        await asyncio.sleep(delays[i])
+        return i
+
+    res = await asyncstdlib.list(bounded_map(f, range(len(delays)), limit))
+
+    assert res == list(range(len(delays)))
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_refill():
+    """
+    A slow call must not stall the remaining slots.
+    """
+    in_flight = 0
+    max_in_flight = 0
+    started: list[int] = []
+
+    async def f(i: int) -> int:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        started.append(i)
+        await asyncio.sleep(0.2 if i == 0 else 0.01)
+        in_flight -= 1
+        return i
+
+    async def consume():
+        return await asyncstdlib.list(bounded_map(f, range(6), 2))
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.1)
+
+    # THE SLOW CALL IS STILL RUNNING BUT EVERY OTHER ONE HAS ALREADY STARTED.
+    assert started == list(range(6))
+    assert max_in_flight == 2
+    assert await task == list(range(6))
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_error_cancels():
+    """
+    A failing call is raised and pending calls are cancelled.
+    """
+    cancelled = []
+
+    async def f(i: int) -> int:
+        if i == 1:
+            raise KeyError(i)
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+        return i
+
+    with pytest.raises(KeyError):
+        await asyncstdlib.list(bounded_map(f, range(4), 4))
+
+    assert sorted(cancelled) == [0, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    """
+    Concurrent calls with the same arguments share one call. Different arguments don't.
+    """
+    calls: list[int] = []
+
+    @single_flight
+    async def f(i: int) -> int:
+        calls.append(i)
+        await asyncio.sleep(0.01)
+        return i * 2
+
+    res = await asyncio.gather(f(1), f(1), f(2), f(1))
+    assert res == [2, 2, 4, 2]
+    assert sorted(calls) == [1, 2]
+
+    # NOT A CACHE. LANDED CALLS ARE NOT SHARED.
+    await f(1)
+    assert sorted(calls) == [1, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancel():
+    """
+    Cancelling one caller doesn't cancel the shared call for the rest.
+    """
+
+    @single_flight
+    async def f(i: int) -> int:
+        await asyncio.sleep(0.05)
+        return i
+
+    first = asyncio.create_task(f(1))
+    second = asyncio.create_task(f(1))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == 1
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_order():
+    """
+    Results come back in input order after both stages.
+    """
+    delays = [0.03, 0.0, 0.02, 0.01, 0.0, 0.02]
+
+    async def f_1(i: int) -> int:
+        await asyncio.sleep(delays[i])
+        return i * 10
+
+    async def f_2(i: int) -> int:
+        await asyncio.sleep(delays[-1 - i // 10])
+        return i + 1
+
+    res = await asyncstdlib.list(pipeline_map(f_1, f_2, range(len(delays)), 2, 3))
+
+    assert res == [i * 10 + 1 for i in range(len(delays))]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_stage_limits():
+    """
+    Slow second stage doesn't hold first stage slots. Each stage honours its own limit.
+    """
+    in_flight = {1: 0, 2: 0}
+    max_in_flight = {1: 0, 2: 0}
+    stage_1_done: list[int] = []
+
+    async def track(stage: int, delay: float):
+        in_flight[stage] += 1
+        max_in_flight[stage] = max(max_in_flight[stage], in_flight[stage])
+        await asyncio.sleep(delay)
+        in_flight[stage] -= 1
+
+    async def f_1(i: int) -> int:
+        await track(1, 0.001)
+        stage_1_done.append(i)
+        return i
+
+    async def f_2(i: int) -> int:
+        await track(2, 0.05)
+        return i
+
+    consumer = asyncio.create_task(
+        asyncstdlib.list(pipeline_map(f_1, f_2, range(8), 2, 3))
+    )
+    await asyncio.sleep(0.03)
+
+    # 3 DOWNLOADING AND 3 WAITING IN QUEUE. THE REST WAIT FOR QUEUE SPACE.
+    assert len(stage_1_done) >= 6
+    assert await consumer == list(range(8))
+    assert max_in_flight == {1: 2, 2: 3}
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_blocked_enqueue():
+    """
+    First stage calls waiting for queue space don't hold first stage slots.
+    """
+    stage_1_done: list[int] = []
+
+    async def f_1(i: int) -> int:
+        await asyncio.sleep(0.001)
+        stage_1_done.append(i)
+        return i
+
+    async def f_2(i: int) -> int:
+        await asyncio.sleep(0.05)
+        return i
+
+    consumer = asyncio.create_task(
+        asyncstdlib.list(pipeline_map(f_1, f_2, range(12), 2, 3))
+    )
+    await asyncio.sleep(0.03)
+
+    # 3 DOWNLOADING, 3 IN QUEUE AND 5 WAITING FOR QUEUE SPACE WITHOUT A SLOT.
+    assert len(stage_1_done) >= 11
+    assert await consumer == list(range(12))
+
+
+@pytest.mark.asyncio
+async def test_single_flight_lead_join():
+    """
+    Calls led by the caller are joined until resolved.
+    """
+    flights: SingleFlight[int, int] = SingleFlight()
+    assert flights.join(1) is None
+
+    flight = flights.lead(1)
+    with pytest.raises(ValueError):
+        flights.lead(1)
+
+    joined = flights.join(1)
+    assert joined is not None
+    flight.set_result(2)
+    assert await joined == 2
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_error():
+    """
+    A failing call in any stage is raised to the consumer.
+    """
+
+    async def f_1(i: int) -> int:
+        return i
+
+    async def f_2(i: int) -> int:
+        await asyncio.sleep(0.01)
+        if i == 3:
+            raise KeyError(i)
+        return i
+
+    res = []
+    with pytest.raises(KeyError):
+        async for r in pipeline_map(f_1, f_2, range(6), 2, 2):
+            res.append(r)
+
+    assert res == list(range(len(res)))
+    assert len(res) <= 3
@@ -0,0 +1,25 @@
+"""
+Testing of datetime utilities.
+"""
+
+from datetime import UTC, datetime
+
+from aemetAntartica.util.datetime import month_starts, next_month
+
+
+def test_month_starts():
+    "Every overlapped month plus the end of the last one"
+    assert month_starts(
+        datetime(2022, 12, 15, tzinfo=UTC), datetime(2023, 2, 1, tzinfo=UTC)
+    ) == [
+        datetime(2022, 12, 1, tzinfo=UTC),
+        datetime(2023, 1, 1, tzinfo=UTC),
+        datetime(2023, 2, 1, tzinfo=UTC),
+    ]
+
+
+def test_next_month():
+    "Year rolls over in december"
+    assert next_month(datetime(2022, 12, 31, 23, tzinfo=UTC)) == datetime(
+        2023, 1, 1, tzinfo=UTC
+    )